@@ -8,6 +8,7 @@ from apis.routers import admin_login, admin_mgmt, farms, nfts, pos
 
 api_routers = APIRouter()
 
+# the routes are mounted once, a new API prefix requires a restart, see config.RESTART_SETTINGS
 settings = get_settings()
 router_prefix = f'{settings.API.PREFIX}'
 
@@ -2,10 +2,10 @@
 
 from fastapi import APIRouter, Depends
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from apis.schemas.admin import AccessTokenResponse
-from database.session import get_db
+from database.session import get_async_db
 from security.admin import authenticate_admin
 from security.tokens import JSONWebToken
 
@@ -16,7 +16,7 @@ router = APIRouter()
 @router.post('', response_model=AccessTokenResponse)
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     '''
     Get login access token.
@@ -26,7 +26,7 @@ async def login_for_access_token(
     '''
 
     # authenticate admin login
-    admin = authenticate_admin(db=db, username=form_data.username, password=form_data.password)
+    admin = await authenticate_admin(db=db, username=form_data.username, password=form_data.password)
 
     # create JWT token
     access_token = JSONWebToken.create(data={'username': admin.username})
@@ -2,12 +2,15 @@
 
 from fastapi import APIRouter, Depends, status
 from fastapi_pagination import Page, paginate
-from sqlalchemy.orm import Session
-
-from apis.schemas.admin import CreateAdminRequest, UpdateAdminRequest, RetrieveAdminsResponse, CreateAdminResponse, UpdateAdminResponse
-from database import crud, models
-from database.session import get_db
-from security.admin import get_current_active_admin
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from apis.schemas.admin import (
+    CreateAdminRequest, UpdateAdminRequest, RetrieveAdminsResponse, CreateAdminResponse, UpdateAdminResponse, PoolStatisticsResponse, DeliveryStatisticsResponse
+)
+from database import async_crud, models
+from database.session import get_async_db, get_pool_statistics
+from models.blockchain import BlockchainRequest
+from security.admin import ADMIN_CACHE, get_current_active_admin
 from security.hashing import SecureHash
 
 
@@ -16,7 +19,7 @@ router = APIRouter(dependencies=[Depends(get_current_active_admin)])
 
 @router.get('', status_code=status.HTTP_200_OK, response_model=Page[RetrieveAdminsResponse])
 async def retrieve_admins(
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     '''
     Retrieve admins from the database.
@@ -25,7 +28,7 @@ async def retrieve_admins(
     '''
 
     # get admin from the database
-    admin_objects = crud.get_table(
+    admin_objects = await async_crud.get_table(
         db=db,
         table=models.AdminsTable,
         exc_message='Unable to find admins.'
@@ -37,7 +40,7 @@ async def retrieve_admins(
 @router.post('/create', status_code=status.HTTP_200_OK, response_model=CreateAdminResponse)
 async def add_admin(
     item: CreateAdminRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     '''
     Add new admin in the database.
@@ -48,35 +51,26 @@ async def add_admin(
         :returns [CreateAdminResponse]: Admin account that has just been created.
     '''
 
-    # create database new admin object
-    admin_object = models.AdminsTable(
-        username=item.username,
-        hashed_password=SecureHash.create(item.password),
-        is_active=True
-    )
-
     # add new admin to the database
-    crud.create_object(
-        db=db,
-        data=admin_object,
-        exc_message='Unable to create admin.'
-    )
-
-    new_admin = crud.get_object(
+    new_admin = await async_crud.create_object_returning(
         db=db,
         table=models.AdminsTable,
-        column=models.AdminsTable.username,
-        value=item.username,
-        exc_message='Unable to find admin.'
+        data=dict(
+            username=item.username,
+            hashed_password=SecureHash.create(item.password),
+            is_active=True
+        ),
+        exc_message='Unable to create admin.'
     )
+    ADMIN_CACHE.invalidate(item.username)
 
-    return new_admin.__dict__
+    return new_admin
 
 
 @router.post('/update', status_code=status.HTTP_200_OK, response_model=UpdateAdminResponse)
 async def alter_admin_status(
     item: UpdateAdminRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     '''
     Update other admin status (is_active) in the database.
@@ -88,7 +82,7 @@ async def alter_admin_status(
     '''
 
     # update other admin in the database
-    crud.update_object(
+    updated_admin = await async_crud.update_object_returning(
         db=db,
         table=models.AdminsTable,
         column=models.AdminsTable.username,
@@ -96,13 +90,26 @@ async def alter_admin_status(
         data=dict(is_active=item.is_active),
         exc_message='Unable to update admin.'
     )
+    ADMIN_CACHE.invalidate(item.username)
 
-    updated_admin = crud.get_object(
-        db=db,
-        table=models.AdminsTable,
-        column=models.AdminsTable.username,
-        value=item.username,
-        exc_message='Unable to find admin.'
-    )
+    return updated_admin
+
+
+@router.get('/pool', status_code=status.HTTP_200_OK, response_model=PoolStatisticsResponse)
+async def retrieve_pool_statistics():
+    '''
+    Retrieve the database connection pools live statistics.
 
-    return updated_admin.__dict__
+        :returns [PoolStatisticsResponse]: Checked out connections, overflow, wait times and errors of each pool.
+    '''
+    return get_pool_statistics()
+
+
+@router.get('/delivery', status_code=status.HTTP_200_OK, response_model=DeliveryStatisticsResponse)
+async def retrieve_delivery_statistics():
+    '''
+    Retrieve the blockchain request delivery statistics.
+
+        :returns [DeliveryStatisticsResponse]: Queued, delivered, failed and retried requests, and their latency.
+    '''
+    return BlockchainRequest.pool.report()
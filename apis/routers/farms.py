@@ -1,15 +1,21 @@
 '''This module is part of the /farms FastAPI router.'''
 
-from fastapi import APIRouter, Depends, status
-from sqlalchemy.orm import Session
+import os
+import orjson
+from fastapi import APIRouter, Depends, File, Header, Query, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from config import get_settings
-from helpers.misc import AppSettings
+from config import current_settings
+from helpers.misc import AppSettings, ConditionalRequest
 # from helpers.api_exceptions import ResponseValidationError # TODO: add exceptions
-from database.session import get_db
-from apis.schemas.farms import FarmListResponse
+from database.session import get_async_db
+from apis.schemas.farms import FarmFilters, FarmListResponse, FarmPage, FarmUploadResponse, FarmWithinResponse
 from security.admin import get_current_active_admin
-from models.farm_data_transformation import FarmData
+from models.farm_data_transformation import FarmQuery, FarmSnapshot
+from models.farm_ingestion import FarmUpload
+from models.spatial_queries import FarmIndex, SpatialQuery
 
 
 router = APIRouter(dependencies=[Depends(get_current_active_admin)])
@@ -17,14 +23,77 @@ router = APIRouter(dependencies=[Depends(get_current_active_admin)])
 
 @router.get('', status_code=status.HTTP_200_OK, response_model=FarmListResponse)
 async def retrieve_farms(
-    db: Session = Depends(get_db),
-    settings: AppSettings = Depends(get_settings)
+    filters: FarmFilters = Depends(),
+    page: FarmPage = Depends(),
+    if_none_match: str | None = Header(default=None),
+    db: AsyncSession = Depends(get_async_db),
+    settings: AppSettings = Depends(current_settings)
 ):
-    '''Retrieves all farms.'''
+    '''
+    Retrieves farms, optionally filtered, sorted (e.g. -effectiveArea) and paginated with the cursor returned along each page.
+    The unfiltered list is encoded once per data version and repeat requests are answered with HTTP 304.
+    '''
 
-    data = FarmData.retrieve_farms(db=db, settings=settings)
+    if any(v is not None for v in [*vars(filters).values(), *vars(page).values()]):
+        items, total, next_cursor = await FarmQuery.page(
+            db=db,
+            settings=settings,
+            filters=vars(filters),
+            sort=page.sort or 'farmId',
+            limit=page.limit,
+            cursor=page.cursor
+        )
+        body = orjson.dumps(FarmListResponse(items=items, total=total, nextCursor=next_cursor).dict())
+        return Response(content=body, media_type='application/json')
 
-    return FarmListResponse(
-        items=data,
-        total=len(data)
+    body, etag = await FarmSnapshot.encoded_farms(
+        db=db,
+        settings=settings,
+        encode=lambda data: orjson.dumps(FarmListResponse(items=data, total=len(data)).dict())
+    )
+
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if ConditionalRequest.etag_matches(if_none_match=if_none_match, etag=etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return Response(content=body, media_type='application/json', headers=headers)
+
+
+@router.get('/within', status_code=status.HTTP_200_OK, response_model=FarmWithinResponse)
+async def retrieve_farms_within(
+    bbox: str | None = None,
+    lat: float | None = Query(default=None, ge=-90, le=90),
+    lng: float | None = Query(default=None, ge=-180, le=180),
+    radiusKm: float | None = Query(default=None, gt=0, le=20000),
+    k: int | None = Query(default=None, ge=1, le=1000),
+    limit: int = Query(default=100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_db),
+    settings: AppSettings = Depends(current_settings)
+):
+    '''Retrieves the farms whose centroid is in a bounding box (minLng,minLat,maxLng,maxLat), within radiusKm of a point, or the k nearest to it.'''
+
+    index = await FarmIndex.current(db=db, settings=settings)
+    found = SpatialQuery.search(index=index, bbox=bbox, lat=lat, lng=lng, radius_km=radiusKm, k=k, limit=limit)
+
+    return FarmWithinResponse(
+        items=[{**farm, 'distanceKm': distance} for _, farm, distance in found],
+        total=len(found)
+    )
+
+
+@router.post('/upload', status_code=status.HTTP_200_OK, response_model=FarmUploadResponse)
+async def upload_farms(
+    file: UploadFile = File(...),
+    settings: AppSettings = Depends(current_settings)
+):
+    '''Loads farm unit rows from a CSV or Parquet file, in a single transaction.'''
+
+    file_format = os.path.splitext(file.filename or '')[1].lstrip('.').lower()
+
+    # the upload is spooled to disk, it is parsed and loaded off the event loop chunk by chunk
+    stats = await run_in_threadpool(FarmUpload.load, file=file.file, file_format=file_format, settings=settings)
+
+    return FarmUploadResponse(
+        status='Success',
+        **stats
     )
@@ -1,18 +1,23 @@
 '''This module is part of the /farms FastAPI router.'''
 import datetime
 import json
-from fastapi import APIRouter, BackgroundTasks, Depends, status
-from sqlalchemy.orm import Session
+import numpy
+from fastapi import APIRouter, Depends, Query, status
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from config import get_settings
+from config import current_settings
 from helpers.misc import AppSettings, DataAggregator, DataFormatter
 from helpers.api_exceptions import ResponseValidationError
-from database import crud, models
-from database.session import get_db
-from apis.schemas.nfts import NFTRequest, NFTResponse, NFTCO2Response
-from models.blockchain import BlockchainRequest
-from models.farm_data_transformation import FarmData
+from database import async_crud, models
+from database.outbox import Outbox
+from database.session import get_async_db
+from apis.schemas.nfts import (
+    NFTRequest, NFTResponse, NFTBulkRequest, NFTBulkRequestItem, NFTBulkResponse, NFTCO2Response, NFTCO2ListRequest, NFTCO2ListResponse, NFTWithinResponse
+)
+from models.farm_data_transformation import FarmData, FarmSnapshot
 from models.carbon_sequestration import NftCarbonSequestration
+from models.spatial_queries import NFTIndex, NFTOverlap, SpatialQuery
 from security.admin import get_current_active_admin
 
 
@@ -21,18 +26,22 @@ router = APIRouter(dependencies=[Depends(get_current_active_admin)])
 
 @router.post('/create', status_code=status.HTTP_200_OK, response_model=NFTResponse)
 async def create_nft(
-    background_task: BackgroundTasks,
     item: NFTRequest,
-    db: Session = Depends(get_db),
-    settings: AppSettings = Depends(get_settings)
+    db: AsyncSession = Depends(get_async_db),
+    settings: AppSettings = Depends(current_settings)
 ):
-    '''Creates a NFT object in the database.'''
+    '''
+    Creates a NFT object in the database, along with its blockchain update in the outbox, unless its parcel overlaps another NFT of its farm.
+    The overlap is checked in the insert transaction, with the farm locked, so concurrent requests cannot create overlapping NFTs.
+    '''
 
     item.geolocation = json.loads(item.geolocation)
+    update = DataFormatter.dictionary(data=item.dict(), name='NFT')
+    flagged = {}
 
-    crud.create_object(
+    await async_crud.create_objects(
         db=db,
-        data=models.NFTsTable(
+        data=[models.NFTsTable(
             nftId=item.nftId,
             nftName=item.nftName,
             nftArea=item.nftArea,
@@ -46,32 +55,98 @@ async def create_nft(
             farmId=item.farmId,
             scientificName=item.scientificName,
             plantStatus=item.plantStatus
-        ),
+        ), Outbox.message(topic='NFT', key=item.nftId, payload=jsonable_encoder(update))],
+        before=lambda db: NFTOverlap.check(db=db, row=item.dict(), settings=settings, flagged=flagged),
         exc_message='Unable to create NFT.'
     )
+    NFTIndex.upsert(rows=[{**item.dict(), 'mintStatus': False}])
 
-    update = DataFormatter.dictionary(data=item.__dict__, name='NFT')
-    background_task.add_task(
-        BlockchainRequest.request_update,
-        req_type='NFT',
-        data=update,
-        settings=settings
+    return NFTResponse(
+        status='Success',
+        data=item.__dict__,
+        overlaps=flagged.get(item.nftId)
     )
 
-    return NFTResponse(
+
+@router.post('/bulk', status_code=status.HTTP_200_OK, response_model=NFTBulkResponse)
+async def create_nfts(
+    item: NFTBulkRequest,
+    db: AsyncSession = Depends(get_async_db),
+    settings: AppSettings = Depends(current_settings)
+):
+    '''
+    Creates NFT objects in the database in batched statements, along with their blockchain updates in the outbox.
+
+        :param item [NFTBulkRequest]: NFTs to create.
+
+        :returns [NFTBulkResponse]: Whether each NFT is created, NFTs whose nftId already exists or is repeated are rejected,
+            as well as NFTs whose geolocation is not a JSON object and NFTs whose parcel overlaps another NFT of its farm,
+            already created or earlier in the request.
+            Overlaps are checked in the insert transaction, with the farms locked, so concurrent requests cannot create overlapping NFTs.
+    '''
+
+    rows, updates, results, rejected, flagged = [], {}, [], {}, {}
+    for nft in item.nfts:
+        if nft.nftId in updates:
+            results.append((nft.nftId, 'Duplicate nftId in request.'))
+            continue
+        try:
+            geolocation = NFTBulkRequestItem.parse_geolocation(nft.geolocation)
+        except ValueError:
+            results.append((nft.nftId, 'Invalid geolocation, it must be a JSON object, e.g. a GeoJSON geometry.'))
+            continue
+
+        rows.append(dict(
+            nftId=nft.nftId,
+            nftName=nft.nftName,
+            nftArea=nft.nftArea,
+            nftValueSol=nft.nftValueSol,
+            geolocation=geolocation,
+            tileCount=nft.tileCount,
+            carbonUrl=nft.carbonUrl,
+            mintStatus=False,
+            mintStartDate=nft.mintStartDate,
+            mintEndDate=nft.mintEndDate,
+            farmId=nft.farmId,
+            scientificName=nft.scientificName,
+            plantStatus=nft.plantStatus
+        ))
+        updates[nft.nftId] = jsonable_encoder(DataFormatter.dictionary(data={**nft.dict(), 'geolocation': geolocation}, name='NFT'))
+        results.append((nft.nftId, None))
+
+    created = set(await async_crud.create_objects_returning(
+        db=db,
+        table=models.NFTsTable,
+        data=rows,
+        conflict_column=models.NFTsTable.nftId,
+        before=lambda db, data: NFTOverlap.screen(db=db, rows=data, settings=settings, rejected=rejected, flagged=flagged),
+        related=lambda nft_ids: (models.OutboxTable, [Outbox.values(topic='NFT', key=k, payload=updates[k]) for k in nft_ids]),
+        exc_message='Unable to create NFTs.'
+    ))
+    NFTIndex.upsert(rows=[row for row in rows if row['nftId'] in created])
+
+    data = [
+        dict(nftId=k, created=True, overlaps=flagged.get(k)) if error is None and k in created
+        else dict(nftId=k, created=False, error=error or rejected.get(k, 'NFT already exists.'))
+        for k, error in results
+    ]
+
+    return NFTBulkResponse(
         status='Success',
-        data=item.__dict__
+        created=len(created),
+        rejected=len(data) - len(created),
+        data=data
     )
 
 
 @router.post('/update/{nftId}', status_code=status.HTTP_200_OK, response_model=NFTResponse)
 async def update_nft(
     nftId: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     '''Updates a NFT mint status to True in the database.'''
 
-    crud.update_object(
+    nft = await async_crud.update_object_returning(
         db=db,
         table=models.NFTsTable,
         column=models.NFTsTable.nftId,
@@ -79,30 +154,96 @@ async def update_nft(
         data={'mintStatus': True},
         exc_message='Unable to update NFT.'
     )
+    NFTIndex.upsert(rows=[nft])
+
+    return NFTResponse(
+        status='Success',
+        data=nft
+    )
 
-    nft = crud.get_object(
+
+@router.post('/co2', status_code=status.HTTP_200_OK, response_model=NFTCO2ListResponse)
+async def get_nfts_carbon_sequestered(
+    item: NFTCO2ListRequest,
+    db: AsyncSession = Depends(get_async_db),
+    settings: AppSettings = Depends(current_settings)
+):
+    '''Calculates carbon sequestered in real-time of multiple NFTs in tons, each item reports its own error if any.'''
+
+    nft_ids = list(dict.fromkeys(item.nftIds))
+
+    nfts = await async_crud.get_objects(
         db=db,
         table=models.NFTsTable,
         column=models.NFTsTable.nftId,
-        value=nftId,
-        exc_message='Unable to find NFT.'
+        values=nft_ids,
+        exc_message='Unable to find NFTs.'
     )
+    nfts = {nft.nftId: nft for nft in nfts}
 
-    return NFTResponse(
+    _, _, farms = await FarmSnapshot.fetch(db=db, settings=settings)
+
+    resp = {}
+    for nft_id in nft_ids:
+        if nft_id not in nfts:
+            resp[nft_id] = {'nftId': nft_id, 'error': 'Unable to find NFT.'}
+        elif nfts[nft_id].farmId not in farms:
+            resp[nft_id] = {'nftId': nft_id, 'error': 'Unable to find NFT farm.'}
+
+    nfts = [nft for nft in nfts.values() if nft.nftId not in resp]
+    if nfts:
+        now = datetime.datetime.now(datetime.timezone.utc)
+
+        # NFTs carbon sequestered in tons, all at once
+        nfts_co2 = NftCarbonSequestration.nft_carbon_sequestration(
+            nft_area=numpy.array([nft.nftArea for nft in nfts], dtype=float),
+            farm_spha=numpy.array([farms[nft.farmId]['sphaSurvival'] for nft in nfts], dtype=float),
+            trees_co2=numpy.array([farms[nft.farmId]['plantCo2'] for nft in nfts], dtype=float),
+            period=numpy.array([DataAggregator.date_difference_in_seconds(start=nft.mintStartDate, end=now) for nft in nfts], dtype=float),
+            settings=settings
+        )
+
+        for nft, co2 in zip(nfts, nfts_co2.tolist()):
+            resp[nft.nftId] = {'nftId': nft.nftId, 'nftArea': nft.nftArea, 'mintStartDate': nft.mintStartDate, 'co2Tons': co2}
+
+    return NFTCO2ListResponse(
+        status='Success',
+        data=[resp[nft_id] for nft_id in nft_ids]
+    )
+
+
+@router.get('/within', status_code=status.HTTP_200_OK, response_model=NFTWithinResponse)
+async def get_nfts_within(
+    bbox: str | None = None,
+    lat: float | None = Query(default=None, ge=-90, le=90),
+    lng: float | None = Query(default=None, ge=-180, le=180),
+    radiusKm: float | None = Query(default=None, gt=0, le=20000),
+    k: int | None = Query(default=None, ge=1, le=1000),
+    limit: int = Query(default=100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_db),
+    settings: AppSettings = Depends(current_settings)
+):
+    '''Retrieves the NFTs whose geometry intersects a bounding box (minLng,minLat,maxLng,maxLat), is within radiusKm of a point, or the k nearest to it.'''
+
+    index = await NFTIndex.current(db=db, settings=settings)
+    found = SpatialQuery.search(index=index, bbox=bbox, lat=lat, lng=lng, radius_km=radiusKm, k=k, limit=limit)
+
+    return NFTWithinResponse(
         status='Success',
-        data=nft.__dict__
+        total=len(found),
+        data=[{**nft, 'distanceKm': distance} for _, nft, distance in found]
     )
 
 
 @router.get('/{nftId}', status_code=status.HTTP_200_OK, response_model=NFTCO2Response)
 async def get_nft_carbon_sequestered(
     nftId: str,
-    db: Session = Depends(get_db),
-    settings: AppSettings = Depends(get_settings)
+    db: AsyncSession = Depends(get_async_db),
+    settings: AppSettings = Depends(current_settings)
 ):
     '''Calculates carbon sequestered in real-time of a given NFT in tons.'''
 
-    nft = crud.get_object(
+    nft = await async_crud.get_object(
         db=db,
         table=models.NFTsTable,
         column=models.NFTsTable.nftId,
@@ -110,14 +251,12 @@ async def get_nft_carbon_sequestered(
         exc_message='Unable to find NFT.'
     )
 
-    farms = FarmData.retrieve_farms(db=db, settings=settings)
-    try:
-        farm = [d for d in farms if d['farmId'] == nft.farmId][0]
-    except (KeyError, IndexError) as exc:
+    farm = await FarmData.retrieve_farm(db=db, settings=settings, farm_id=nft.farmId)
+    if not farm:
         raise ResponseValidationError(
             status_code=status.HTTP_400_BAD_REQUEST,
             message='Unable to find NFT.'
-        ) from exc
+        )
 
     # calculate timedelta in seconds
     period = DataAggregator.date_difference_in_seconds(
@@ -1,14 +1,14 @@
 '''This module is part of the /farm FastAPI router.'''
 
-from fastapi import APIRouter, BackgroundTasks, Depends, status
-from fastapi.responses import HTMLResponse
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Header, status
+from fastapi.responses import HTMLResponse, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from config import get_settings
-from helpers.misc import AppSettings, FileManagement
+from config import current_settings
+from helpers.misc import AppSettings, ConditionalRequest
 # from helpers.api_exceptions import ResponseValidationError # TODO: add exceptions
-from database import crud, models
-from database.session import get_db
+from database import async_crud, models
+from database.session import get_async_db
 from security.admin import get_current_active_admin
 from security.dependencies import valid_farm_id
 from models.farm_proof_of_service import FarmProofOfService
@@ -19,14 +19,14 @@ router = APIRouter(dependencies=[Depends(get_current_active_admin)])
 
 @router.get('/satellite/{farmId}', dependencies=[Depends(valid_farm_id)], status_code=status.HTTP_200_OK, response_class=HTMLResponse)
 async def show_farm_satellite_view(
-    background_task: BackgroundTasks,
     farmId: str,
-    db: Session = Depends(get_db),
-    settings: AppSettings = Depends(get_settings)
+    if_none_match: str | None = Header(default=None),
+    db: AsyncSession = Depends(get_async_db),
+    settings: AppSettings = Depends(current_settings)
 ):
-    '''Retrieves a satellite image from a given farm.'''
+    '''Retrieves a satellite image from a given farm, repeat views are answered with HTTP 304 if the client already has it.'''
 
-    farm = crud.get_object(
+    farm = await async_crud.get_object(
         db=db,
         table=models.FarmsTable,
         column=models.FarmsTable.FarmId,
@@ -34,16 +34,16 @@ async def show_farm_satellite_view(
         exc_message='Unable to find farm.'
     )
 
-    html = FarmProofOfService.satellite_mapbox(
+    key = FarmProofOfService.satellite_key(farm_id=farmId, lat=farm.Latitude, lng=farm.Longitude, settings=settings)
+    headers = {'ETag': FarmProofOfService.satellite_etag(key), 'Cache-Control': 'private, no-cache'}
+    if ConditionalRequest.etag_matches(if_none_match=if_none_match, etag=headers['ETag']):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    html = await FarmProofOfService.satellite_view(
         farm_id=farmId,
         lat=farm.Latitude,
         lng=farm.Longitude,
         settings=settings
     )
 
-    background_task.add_task(
-        FileManagement.remove_file,
-        filename=html
-    )
-
-    return FileManagement.read_file(html)
+    return HTMLResponse(content=html, headers=headers)
@@ -58,3 +58,39 @@ class UpdateAdminResponse(RetrieveAdminsResponse):
     '''Response schema to /admin/update'''
 
     pass  # pylint: disable=[W0107]
+
+
+class PoolStatistics(BaseModel):
+    '''Dependency schema to database connection pool statistics.'''
+
+    size: int | None = None
+    checked_in: int | None = None
+    checked_out: int | None = None
+    overflow: int | None = None
+    checkouts: int | None = None
+    timeouts: int | None = None
+    connect_errors: int | None = None
+    wait_seconds_avg: float | None = None
+    wait_seconds_max: float | None = None
+
+
+class PoolStatisticsResponse(BaseModel):
+    '''Response schema to /admin/pool'''
+
+    sync: PoolStatistics | None = None
+    asyncio: PoolStatistics | None = None
+
+
+class DeliveryStatisticsResponse(BaseModel):
+    '''Response schema to /admin/delivery'''
+
+    workers: int | None = None
+    pending: int | None = None
+    in_flight: int | None = None
+    enqueued: int | None = None
+    rejected: int | None = None
+    delivered: int | None = None
+    failed: int | None = None
+    retries: int | None = None
+    latency_seconds_avg: float | None = None
+    latency_seconds_max: float | None = None
@@ -1,7 +1,43 @@
 '''This module defines the HTTP request/response schemas for the /farm FastAPI routers.'''
 
+from fastapi import Query
 from pydantic import BaseModel
 
+from models.farm_data_transformation import SORT_FIELDS
+
+
+# Requests
+class FarmFilters:
+    '''Query parameters filtering /farm'''
+
+    def __init__(
+        self,
+        groupScheme: str | None = None,
+        country: str | None = None,
+        province: str | None = None,
+        minEffectiveArea: float | None = Query(default=None, ge=0),
+        isFscCertified: bool | None = None
+    ):
+        self.groupScheme = groupScheme
+        self.country = country
+        self.province = province
+        self.minEffectiveArea = minEffectiveArea
+        self.isFscCertified = isFscCertified
+
+
+class FarmPage:
+    '''Query parameters sorting and paginating /farm'''
+
+    def __init__(
+        self,
+        sort: str | None = Query(default=None, regex=f'^-?({"|".join(SORT_FIELDS)})$'),
+        limit: int | None = Query(default=None, ge=1, le=1000),
+        cursor: str | None = None
+    ):
+        self.sort = sort
+        self.limit = limit
+        self.cursor = cursor
+
 
 # Responses
 class FarmResponse(BaseModel):
@@ -29,4 +65,26 @@ class FarmListResponse(BaseModel):
     '''Response schema to /farm'''
 
     items: list[FarmResponse] | None = []
+    total: int | None = None  # farms matching the filters
+    nextCursor: str | None = None  # cursor of the next page, None if it is the last one
+
+
+class FarmWithinItem(FarmResponse):
+    '''Farm schema of a spatial query, including its distance to the query point.'''
+
+    distanceKm: float | None = None
+
+
+class FarmWithinResponse(BaseModel):
+    '''Response schema to /farm/within'''
+
+    items: list[FarmWithinItem] | None = []
     total: int | None = None
+
+
+class FarmUploadResponse(BaseModel):
+    '''Response schema to /farm/upload'''
+
+    status: str | None = None
+    loaded: int | None = None  # rows inserted or updated
+    rejected: int | None = None  # rows with missing or invalid values
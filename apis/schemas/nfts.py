@@ -1,12 +1,13 @@
 '''This module defines the HTTP request/response schemas for the /nft FastAPI routers.'''
 
+import json
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, conlist, validator
 
 
 # Requests
-class NFTRequest(BaseModel):
-    '''Request schema to /nft/*'''
+class NFTBulkRequestItem(BaseModel):
+    '''Request schema of a /nft/bulk item, its geolocation is checked by the route so that an invalid one only rejects the item.'''
 
     nftId: str
     nftName: str
@@ -21,6 +22,39 @@ class NFTRequest(BaseModel):
     scientificName: list
     plantStatus: str
 
+    def parse_geolocation(v: str) -> dict:
+        '''Parse a geolocation, raises ValueError if it is not a JSON object, e.g. a GeoJSON geometry.'''
+        geolocation = json.loads(v)
+        json.dumps(geolocation, allow_nan=False)  # NaN and Infinity are not JSON
+        if not isinstance(geolocation, dict):
+            raise ValueError('not a JSON object')
+        return geolocation
+
+
+class NFTRequest(NFTBulkRequestItem):
+    '''Request schema to /nft/*'''
+
+    @validator('geolocation')
+    def valid_geolocation(cls, v):
+        '''Ensure geolocation is a JSON object, e.g. a GeoJSON geometry, only Point, Polygon and MultiPolygon ones are spatially indexed.'''
+        try:
+            NFTBulkRequestItem.parse_geolocation(v)
+        except ValueError as e:
+            raise ValueError('it must be a JSON object, e.g. a GeoJSON geometry') from e
+        return v
+
+
+class NFTBulkRequest(BaseModel):
+    '''Request schema to /nft/bulk'''
+
+    nfts: conlist(NFTBulkRequestItem, min_items=1, max_items=10000)
+
+
+class NFTCO2ListRequest(BaseModel):
+    '''Request schema to /nft/co2'''
+
+    nftIds: conlist(str, min_items=1, max_items=1000)
+
 
 # Responses
 class NFT(BaseModel):
@@ -50,11 +84,50 @@ class NFTCO2(BaseModel):
     co2Tons: float | None = None
 
 
+class NFTBulkItem(BaseModel):
+    '''Bulk NFT creation schema, including the error of an item that could not be created.'''
+
+    nftId: str | None = None
+    created: bool | None = None
+    error: str | None = None
+    overlaps: list[str] | None = None  # NFTs of the same farm overlapping it
+
+
+class NFTWithinItem(NFT):
+    '''NFT schema of a spatial query, including its distance to the query point.'''
+
+    distanceKm: float | None = None
+
+
+class NFTCO2Item(NFTCO2):
+    '''Batch NFT CO2 schema, including the error of an item that could not be calculated.'''
+
+    error: str | None = None
+
+
 class NFTResponse(BaseModel):
     '''Response schema to /nft/*'''
 
     status: str | None = None
     data: NFT | None = None
+    overlaps: list[str] | None = None  # NFTs of the same farm overlapping it
+
+
+class NFTBulkResponse(BaseModel):
+    '''Response schema to /nft/bulk'''
+
+    status: str | None = None
+    created: int | None = None
+    rejected: int | None = None
+    data: list[NFTBulkItem] | None = None
+
+
+class NFTWithinResponse(BaseModel):
+    '''Response schema to /nft/within'''
+
+    status: str | None = None
+    total: int | None = None
+    data: list[NFTWithinItem] | None = []
 
 
 class NFTCO2Response(BaseModel):
@@ -62,3 +135,10 @@ class NFTCO2Response(BaseModel):
 
     status: str | None = None
     data: NFTCO2 | None = None
+
+
+class NFTCO2ListResponse(BaseModel):
+    '''Response schema to /nft/co2'''
+
+    status: str | None = None
+    data: list[NFTCO2Item] | None = []
@@ -0,0 +1,90 @@
+'''This module benchmarks concurrent database queries run from the event loop, through the blocking session the routes used before and the asyncio one.
+Each query sleeps on the database side, e.g. a slow /farm extraction, while a heartbeat measures how long the event loop stalls, e.g. a token check.
+It needs the PostgreSQL database set in .env, e.g. a local one.
+
+    python -m benchmarks.async_database --queries 200 --concurrency 20 --delay 20
+'''
+
+import argparse
+import asyncio
+import statistics
+import time
+from sqlalchemy import func, select
+
+from database.session import AsyncSessionLocal, SessionLocal, async_engine, engine
+
+
+async def blocking_query(delay: float) -> None:
+    '''Run a query through the blocking session from a coroutine, i.e. the event loop waits for the database.'''
+    db = SessionLocal()
+    try:
+        db.execute(select(func.pg_sleep(delay)))
+    finally:
+        db.close()
+
+
+async def asyncio_query(delay: float) -> None:
+    '''Run a query through the asyncio session, i.e. the event loop serves other coroutines meanwhile.'''
+    async with AsyncSessionLocal() as db:
+        await db.execute(select(func.pg_sleep(delay)))
+
+
+async def heartbeat(stop: asyncio.Event, lags: list, interval: float = 0.001) -> None:
+    '''Wake up every interval and record how late the event loop resumed it.'''
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+async def run(query, queries: int, concurrency: int, delay: float) -> tuple:
+    '''Run queries, at most `concurrency` at once, returns (seconds, event loop lags).'''
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited():
+        async with semaphore:
+            await query(delay)
+
+    stop, lags = asyncio.Event(), []
+    beat = asyncio.create_task(heartbeat(stop=stop, lags=lags))
+    start = time.perf_counter()
+    await asyncio.gather(*[limited() for _ in range(queries)])
+    seconds = time.perf_counter() - start
+    stop.set()
+    await beat
+    return seconds, lags
+
+
+async def benchmark(queries: int, concurrency: int, delay: float) -> None:
+    '''Benchmark both sessions on the same workload.'''
+    try:
+        for name, query in (('blocking', blocking_query), ('asyncio', asyncio_query)):
+            await run(query, queries=concurrency, concurrency=concurrency, delay=0)  # open the pool connections
+            seconds, lags = await run(query, queries=queries, concurrency=concurrency, delay=delay)
+            lags = sorted(lags) or [0.0]
+            print(
+                f'{name:<9} {queries/seconds:8.1f} queries/s {seconds:7.2f} s'
+                f'   event loop lag p50 {statistics.median(lags)*1e3:7.1f} ms max {lags[-1]*1e3:7.1f} ms'
+            )
+    finally:
+        await async_engine.dispose()
+        engine.dispose()
+
+
+def main() -> None:
+    '''Parse the arguments and run the benchmark.'''
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--queries', type=int, default=200, help='queries per run')
+    parser.add_argument('--concurrency', type=int, default=20, help='queries in flight at once, within the pool size and overflow')
+    parser.add_argument('--delay', type=float, default=20, help='milliseconds each query sleeps on the database side')
+    args = parser.parse_args()
+
+    if engine.dialect.name != 'postgresql':
+        parser.error('the database set in .env must be PostgreSQL')
+
+    print(f'{args.queries} queries of {args.delay:g} ms, {args.concurrency} at once')
+    asyncio.run(benchmark(queries=args.queries, concurrency=args.concurrency, delay=args.delay/1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+'''This module benchmarks the farm data transformation, i.e. the columnar pipeline against the original row-by-row one, on synthetic farm units.
+
+    python -m benchmarks.farm_pipeline --rows 200000
+'''
+
+import argparse
+import math
+import time
+import tracemalloc
+import numpy
+from pandas import DataFrame
+
+from config import get_settings
+from helpers.misc import AppSettings, ResponseFormatter
+from models.carbon_sequestration import PlantationCarbonSequestration
+from models.farm_data_transformation import FarmData
+
+
+def synthetic_farms(rows: int, units: int, settings: AppSettings) -> tuple:
+    '''Generate farm units, about `units` per farm, and the pricing of their Group Schemes.'''
+    rng = numpy.random.default_rng(6)
+    species = list(settings.SPECIES_TABLE) + [('eucalyptus', 'clones'), ('eucalyptus', 'GxN')]
+    schemes = numpy.array(['CMO', 'Sri Trang Thailand', 'Global Forest'])
+
+    farm_id = numpy.sort(rng.integers(0, rows//units + 1, rows))
+    picked = rng.integers(0, len(species), rows)
+    farm = DataFrame({
+        'GroupScheme': schemes[farm_id % len(schemes)],
+        'Country': 'ZA',
+        'Province': ' Province ',
+        'Latitude': -30 + (farm_id % 4500)/100,
+        'Longitude': -50 + farm_id/1000,
+        'FarmId': [f'F{i:07d}' for i in farm_id],
+        'FarmSize': 5 + farm_id % 495,
+        'UnitNumber': [f'{i:03d}' for i in range(rows)],
+        'EffectiveArea': rng.uniform(0.5, 50, rows),
+        'AreaTypeName': 'Plantation',
+        'ProductGroup': numpy.array(['Pulp', 'Sawlog', 'Latex'])[rng.integers(0, 3, rows)],
+        'GenusName': [species[i][0] for i in picked],
+        'SpeciesName': [species[i][1] for i in picked],
+        'PlantAge': rng.uniform(1, 25, rows),
+        'SphaSurvival': rng.uniform(600, 1600, rows),
+        'PlannedPlantDT': '2010-01-01',
+        'IsActive': rng.random(rows) > 0.15
+    })
+    ha = DataFrame({'groupScheme': schemes, 'hectareUsd': [1250.0, 980.5, 1530.25]})
+    return farm, ha
+
+
+def reference_transform(farm: list, ha: list, settings: AppSettings) -> list:
+    '''Original row-by-row pipeline, i.e. records converted to and from DataFrames and Python loops over dicts.'''
+    tree_co2 = {s: tree.co2 for (_, s), tree in settings.SPECIES_TABLE.items()}
+
+    df = DataFrame(farm)
+    df = df[(df['SpeciesName'] != 'clones') & (df['SpeciesName'] != 'GxN')]
+    df['PlantCO2'] = df['SpeciesName'].map(tree_co2)
+    data = df.to_dict('records')
+
+    df = DataFrame(data)
+    dfg = df[df['IsActive']].groupby(['GroupScheme', 'Country', 'Province', 'FarmId', 'Latitude', 'Longitude', 'FarmSize', 'IsActive']).agg({
+        'UnitNumber': 'count', 'EffectiveArea': 'sum', 'SphaSurvival': 'mean', 'PlantCO2': 'mean', 'PlantAge': 'mean',
+        'ProductGroup': list, 'GenusName': list, 'SpeciesName': list
+    }).reset_index(drop=False)
+    dfg['ProductGroup'] = dfg.apply(lambda x: sorted(set(x['ProductGroup'])), axis=1)
+    dfg = dfg.sort_values(by=['GroupScheme', 'FarmSize'], ascending=[True, False]).drop_duplicates(subset=['Latitude', 'Longitude'], keep='first')
+    data = dfg.to_dict('records')
+
+    price = {d['groupScheme']: d['hectareUsd'] for d in ha}
+    hectare = settings.UNIT_CONVERSION.area.haM2
+    for d in data:
+        d['ScientificName'] = sorted({f'{i} {j}' for i, j in zip(d['GenusName'], d['SpeciesName'])})
+        d['FarmRadius'] = math.sqrt((d['FarmSize']*hectare)/math.pi)
+        d['FarmCO2y'] = PlantationCarbonSequestration.plantation_carbon_sequestration(
+            co2=d['PlantCO2'], spha=d['SphaSurvival']*0.9, age=d['PlantAge'], settings=settings
+        )
+        d['TreesPlanted'] = int(d['SphaSurvival']*d['EffectiveArea'])
+        d['hectareUsd'] = price[d['GroupScheme']]
+
+    data = ResponseFormatter.obj_list_case_converter(data=data, fmt='camel')
+    data = ResponseFormatter.obj_list_strip_string(data=data)
+    for d in data:
+        d['isFscCertified'] = d['groupScheme'] == 'Sri Trang Thailand'
+
+    return data
+
+
+def measure(name: str, transform, *args, memory: bool = False) -> list:
+    '''Run a transform once, print its duration, or its peak memory since tracing allocations slows it down several times.'''
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    data = transform(*args)
+    seconds = time.perf_counter() - start
+    if memory:
+        print(f'{name:<10} {tracemalloc.get_traced_memory()[1]/2**20:8.0f} MiB peak {len(data):>8} farms')
+        tracemalloc.stop()
+    else:
+        print(f'{name:<10} {seconds:8.2f} s {len(data):>8} farms')
+    return data
+
+
+def main() -> None:
+    '''Benchmark both pipelines on the same farm units.'''
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000, help='farm units')
+    parser.add_argument('--units', type=int, default=8, help='farm units per farm on average')
+    parser.add_argument('--memory', action='store_true', help='measure the peak memory instead of the duration')
+    args = parser.parse_args()
+
+    settings = get_settings()
+    farm, ha = synthetic_farms(rows=args.rows, units=args.units, settings=settings)
+    print(f'{args.rows} farm units')
+
+    reference = measure('row-by-row', reference_transform, farm.to_dict('records'), ha.to_dict('records'), settings, memory=args.memory)
+    columnar = measure('columnar', FarmData.transform_farms, farm.copy(), ha.copy(), settings, memory=args.memory)
+
+    same = [d['farmId'] for d in reference] == [d['farmId'] for d in columnar] and all(
+        math.isclose(a['farmCo2y'], b['farmCo2y']) and a['treesPlanted'] == b['treesPlanted'] for a, b in zip(reference, columnar)
+    )
+    print(f'same farms: {same}')
+
+
+if __name__ == '__main__':
+    main()
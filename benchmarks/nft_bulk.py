@@ -0,0 +1,120 @@
+'''This module benchmarks the NFT writes, i.e. one transaction per NFT as /nft/create does against the batched statements of /nft/bulk,
+and the mint status update followed by a read against the single UPDATE ... RETURNING statement of /nft/update.
+It needs the PostgreSQL database set in .env, e.g. a local one, the benchmark NFTs and their outbox messages are deleted afterwards.
+
+    python -m benchmarks.nft_bulk --items 1000 10000
+'''
+
+import argparse
+import asyncio
+import time
+import uuid
+from datetime import datetime, timezone
+from sqlalchemy import delete
+
+from database import async_crud, models
+from database.outbox import Outbox
+from database.session import AsyncSessionLocal, async_engine, engine
+from database.startup import start_database
+
+
+def nfts(items: int, prefix: str) -> list:
+    '''Build the column values of NFTs with unique nftIds.'''
+    return [dict(
+        nftId=f'{prefix}{i}',
+        nftName=f'NFT {i}',
+        nftArea=1.5,
+        nftValueSol=0.1,
+        geolocation={'type': 'Polygon', 'coordinates': [[[30, -25], [30.001, -25], [30.001, -25.001], [30, -25.001], [30, -25]]]},
+        tileCount=1,
+        carbonUrl='https://example.com',
+        mintStatus=False,
+        mintStartDate=datetime(2023, 1, 1, tzinfo=timezone.utc),
+        mintEndDate=datetime(2023, 2, 1, tzinfo=timezone.utc),
+        farmId=str(i % 100),
+        scientificName=['Eucalyptus grandis'],
+        plantStatus='Planted'
+    ) for i in range(items)]
+
+
+async def create_one_by_one(rows: list) -> None:
+    '''Create each NFT and its outbox message in its own transaction.'''
+    for row in rows:
+        await async_crud.create_objects(
+            db=AsyncSessionLocal(),
+            data=[models.NFTsTable(**row), Outbox.message(topic='NFT', key=row['nftId'], payload={'nftId': row['nftId']})]
+        )
+
+
+async def create_batched(rows: list) -> None:
+    '''Create the NFTs and their outbox messages in batched INSERT ... ON CONFLICT DO NOTHING RETURNING statements.'''
+    await async_crud.create_objects_returning(
+        db=AsyncSessionLocal(),
+        table=models.NFTsTable,
+        data=rows,
+        conflict_column=models.NFTsTable.nftId,
+        related=lambda nft_ids: (models.OutboxTable, [Outbox.values(topic='NFT', key=k, payload={'nftId': k}) for k in nft_ids])
+    )
+
+
+async def update_then_read(nft_ids: list) -> None:
+    '''Update each mint status, then read the NFT back, i.e. two round trips.'''
+    for nft_id in nft_ids:
+        await async_crud.update_object(db=AsyncSessionLocal(), table=models.NFTsTable, column=models.NFTsTable.nftId, value=nft_id, data={'mintStatus': True})
+        await async_crud.get_object(db=AsyncSessionLocal(), table=models.NFTsTable, column=models.NFTsTable.nftId, value=nft_id)
+
+
+async def update_returning(nft_ids: list) -> None:
+    '''Update each mint status and return the NFT in a single UPDATE ... RETURNING statement.'''
+    for nft_id in nft_ids:
+        await async_crud.update_object_returning(
+            db=AsyncSessionLocal(), table=models.NFTsTable, column=models.NFTsTable.nftId, value=nft_id, data={'mintStatus': True}
+        )
+
+
+async def cleanup(prefix: str) -> None:
+    '''Delete the benchmark NFTs and their outbox messages.'''
+    async with AsyncSessionLocal() as db:
+        for column in (models.NFTsTable.nftId, models.OutboxTable.key):
+            await db.execute(delete(column.class_).where(column.startswith(prefix)).execution_options(synchronize_session=False))
+        await db.commit()
+
+
+async def measure(name: str, work, items: int) -> None:
+    '''Run a workload once and print its throughput.'''
+    start = time.perf_counter()
+    await work
+    seconds = time.perf_counter() - start
+    print(f'{name:<18} {items:>6} items {seconds:8.2f} s {items/seconds:10.0f} items/s')
+
+
+async def run(items: list) -> None:
+    '''Benchmark the creation and mint status update paths for each number of items.'''
+    prefix = f'bench-{uuid.uuid4().hex[:8]}-'
+    try:
+        for n in items:
+            one, batched = nfts(n, f'{prefix}one-{n}-'), nfts(n, f'{prefix}batch-{n}-')
+            await measure('create one by one', create_one_by_one(one), n)
+            await measure('create batched', create_batched(batched), n)
+            await measure('update then read', update_then_read([row['nftId'] for row in one]), n)
+            await measure('update returning', update_returning([row['nftId'] for row in batched]), n)
+    finally:
+        await cleanup(prefix)
+        await async_engine.dispose()
+
+
+def main() -> None:
+    '''Parse the arguments and run the benchmark.'''
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, nargs='+', default=[1000, 10000], help='NFTs per run')
+    args = parser.parse_args()
+
+    if engine.dialect.name != 'postgresql':
+        parser.error('the database set in .env must be PostgreSQL')
+
+    start_database()
+    asyncio.run(run(items=args.items))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,39 +1,164 @@
-'''This module configures application settings from config.yaml'''
+'''This module configures application settings from config.yaml, .env and docs/json/*.json.
+Settings are built once into a read-only object, then rebuilt and swapped atomically whenever one of these files changes.'''
 
+import glob
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable
 from pyaml_env import parse_config
-from dotenv import load_dotenv
+from dotenv import dotenv_values
 
 from helpers.misc import AppSettings, DataFormatter, FileManagement
-from helpers.lru_caching import timed_lru_cache
+from models.species_table import SpeciesTable
 
 
-load_dotenv()
+PATH_CONFIG = 'config.yaml'
+PATH_DOTENV = '.env'
+PATH_JSON = 'docs/json'
+ENVIRONMENT = set(os.environ)  # variables set by the process environment take precedence over .env, including on reload
+# settings read once at startup, a reload keeps using their startup values until a restart
+RESTART_SETTINGS = (
+    'ADMIN', 'API.PREFIX', 'APP.PROJECT_NAME', 'APP.PROJECT_VERSION', 'APP.SETTINGS_RELOAD_SECONDS', 'DATABASE.POSTGRESQL',
+    'INGESTION.ENABLED', 'INGESTION.EVERY_MINUTES', 'NFT.DELIVERY', 'THROTTLING.ENABLED', 'THROTTLING.STORE'
+)
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Settings:
+    '''Settings holder class, i.e. the current settings, their version and the callbacks run after a reload.'''
+
+    current = None
+    version = 0
+    fingerprint = None
+    lock = threading.Lock()
+    callbacks = []
+    watcher = None
+    dotenv = set()  # variables set from .env, unset again once removed from it
 
 
-@timed_lru_cache(seconds=10)
 def get_settings() -> AppSettings:
-    '''Set up settings in cache for the above lifetime, then refreshes it.'''
+    '''Fetch the current settings, i.e. a pointer read.'''
+    return Settings.current
+
+
+async def current_settings() -> AppSettings:
+    '''Fetch the current settings as a FastAPI dependency, being async it is resolved on the event loop instead of a worker thread.'''
+    return Settings.current
+
+
+def build_settings(version: int) -> AppSettings:
+    '''Build the settings from the configuration files.'''
+
+    # project settings
+    config = parse_config(PATH_CONFIG)
+    config['VERSION'] = version
+
+    # set up API prefix
+    project_version = config['APP']['PROJECT_VERSION']
+    config['API'] = {}
+    config['API']['PREFIX'] = f'/api/v{project_version.split(".")[0]}'
+
+    # set up environment
+    if config['APP']['ENVIRONMENT'] == 'development':
+        config['APP']['DEBUG'] = True
+        config['APP']['TESTING'] = True
+
+    # set up database
+    config['DATABASE']['POSTGRESQL']['URL'] = DataFormatter.postgresql(config['DATABASE']['POSTGRESQL']['URL'])
+    config['DATABASE']['POSTGRESQL']['ASYNC_URL'] = DataFormatter.async_database_url(config['DATABASE']['POSTGRESQL']['URL'])
+
+    # set up supporting data
+    config['ATOMIC_WEIGHT'] = FileManagement.read_file(f'{PATH_JSON}/atomic_weight.json')
+    config['PLANTATION_METRICS'] = FileManagement.read_file(f'{PATH_JSON}/plantation_metrics.json')
+    config['UNIT_CONVERSION'] = FileManagement.read_file(f'{PATH_JSON}/unit_conversion.json')
+
+    config['SPECIES_TABLE'] = SpeciesTable.compile(settings=AppSettings(config))
+
     return AppSettings(config)
 
 
-# project settings
-config = parse_config('config.yaml')
+def settings_fingerprint() -> tuple:
+    '''Fingerprint the configuration files by their modification time and size.'''
+    fingerprint = []
+    for path in [PATH_CONFIG, PATH_DOTENV, *sorted(glob.glob(f'{PATH_JSON}/*.json'))]:
+        try:
+            stat = os.stat(path)
+            fingerprint.append((path, stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            fingerprint.append((path, None, None))
+    return tuple(fingerprint)
+
+
+def settings_values(settings: AppSettings | None, path: str) -> Any:
+    '''Find the values of a dotted settings path as plain data, e.g. to compare two settings versions.'''
+    for k in path.split('.'):
+        settings = getattr(settings, k, None)
+    if isinstance(settings, AppSettings):
+        return {k: settings_values(settings, k) for k in vars(settings)}
+    return settings
+
+
+def reload_settings(force: bool = False) -> bool:
+    '''
+    Rebuild the settings if a configuration file has changed, then swap them atomically and run the reload callbacks.
+
+        :param force [bool]: Rebuild the settings even if no configuration file has changed.
+
+        :returns [bool]: True if the settings were swapped, False otherwise.
+    '''
+    with Settings.lock:
+        fingerprint = settings_fingerprint()
+        if not force and fingerprint == Settings.fingerprint:
+            return False
+
+        # a failed rebuild keeps the current settings, it is retried on the next change only
+        Settings.fingerprint = fingerprint
+        dotenv = {k: v for k, v in dotenv_values(PATH_DOTENV).items() if k not in ENVIRONMENT and v is not None}
+        for k in Settings.dotenv - set(dotenv):
+            os.environ.pop(k, None)
+        os.environ.update(dotenv)
+        Settings.dotenv = set(dotenv)
+        settings = build_settings(version=Settings.version + 1)
+
+        previous = Settings.current
+        Settings.version += 1
+        Settings.current = settings
+
+    if previous is not None:
+        changed = [path for path in RESTART_SETTINGS if settings_values(previous, path) != settings_values(settings, path)]
+        if changed:
+            LOGGER.warning('Settings reloaded (version %s), changes of %s take effect after a restart', settings.VERSION, ', '.join(changed))
+
+    for callback in Settings.callbacks:
+        callback(settings)
+    return True
+
+
+def on_reload(callback: Callable[[AppSettings], None]) -> Callable:
+    '''Register a callback run with the new settings after each reload, e.g. to resize a cache.'''
+    Settings.callbacks.append(callback)
+    return callback
+
+
+def watch_settings(seconds: float) -> None:
+    '''Poll the configuration files in a background thread and reload the settings when one of them changes.'''
+    if seconds <= 0 or Settings.watcher is not None:
+        return
 
-# set up API prefix
-version = config['APP']['PROJECT_VERSION']
-config['API'] = {}
-config['API']['PREFIX'] = f'/api/v{version.split(".")[0]}'
+    def watch():
+        '''Poll until the process exits.'''
+        while True:
+            time.sleep(seconds)
+            try:
+                reload_settings()
+            except Exception:  # pylint: disable=W0703
+                LOGGER.exception('Unable to reload settings, the current ones (version %s) are kept', Settings.version)
 
-# set up environment
-if config['APP']['ENVIRONMENT'] == 'development':
-    config['APP']['DEBUG'] = True
-    config['APP']['TESTING'] = True
+    Settings.watcher = threading.Thread(target=watch, name='settings-watcher', daemon=True)
+    Settings.watcher.start()
 
-# set up database
-config['DATABASE']['POSTGRESQL']['URL'] = DataFormatter.postgresql(config['DATABASE']['POSTGRESQL']['URL'])
 
-# set up supporting data
-path_json = 'docs/json'
-config['ATOMIC_WEIGHT'] = FileManagement.read_file(f'{path_json}/atomic_weight.json')
-config['PLANTATION_METRICS'] = FileManagement.read_file(f'{path_json}/plantation_metrics.json')
-config['UNIT_CONVERSION'] = FileManagement.read_file(f'{path_json}/unit_conversion.json')
+reload_settings(force=True)
@@ -0,0 +1,471 @@
+'''This module defines general database CRUD operations for asyncio sessions, i.e. without blocking the event loop.'''
+
+from typing import Any, Awaitable, Callable
+from fastapi import status
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.decl_api import DeclarativeMeta
+from sqlalchemy.exc import SQLAlchemyError
+
+from helpers.api_exceptions import ResponseValidationError
+
+
+async def get_object(
+    db: AsyncSession,
+    table: DeclarativeMeta,
+    column: DeclarativeMeta,
+    value: Any,
+    exc_status_code: status = status.HTTP_409_CONFLICT,
+    exc_message: str = 'Unable to find object in the database.'
+):
+    '''
+    Fetch database object that matches 1 condition, if exists.
+
+        :param db [generator]: Database asyncio session.
+        :param table [orm]: Declarative base Table.
+        :param column [orm]: Declarative base Column.
+        :param value: Value to look up.
+        :param exc_status_code [int]: Exception HTTP status code.
+        :param exc_message [str]: Exception error message.
+
+        :returns: Database object.
+    '''
+    try:
+        data = (await db.execute(select(table).where(column == value))).scalars().first()
+        if not data:
+            raise ResponseValidationError(
+                status_code=exc_status_code,
+                message=exc_message
+            )
+        return data
+
+    except SQLAlchemyError as e:
+        raise ResponseValidationError(
+            status_code=exc_status_code,
+            message=exc_message) from e
+
+    finally:
+        await db.close()
+
+
+async def get_objects(
+    db: AsyncSession,
+    table: DeclarativeMeta,
+    column: DeclarativeMeta,
+    values: list,
+    exc_status_code: status = status.HTTP_409_CONFLICT,
+    exc_message: str = 'Unable to find objects in the database.'
+):
+    '''
+    Fetch all database objects whose column matches any of the given values, in a single query.
+
+        :param db [generator]: Database asyncio session.
+        :param table [orm]: Declarative base Table.
+        :param column [orm]: Declarative base Column.
+        :param values [list]: Values to look up.
+        :param exc_status_code [int]: Exception HTTP status code.
+        :param exc_message [str]: Exception error message.
+
+        :returns: Database objects, it may be empty.
+    '''
+    try:
+        return (await db.execute(select(table).where(column.in_(values)))).scalars().all()
+
+    except SQLAlchemyError as e:
+        raise ResponseValidationError(
+            status_code=exc_status_code,
+            message=exc_message) from e
+
+    finally:
+        await db.close()
+
+
+async def get_table(
+    db: AsyncSession,
+    table: DeclarativeMeta,
+    exc_status_code: status = status.HTTP_409_CONFLICT,
+    exc_message: str = 'Unable to find table in the database.'
+):
+    '''
+    Fetch all database objects from a table.
+
+        :param db [generator]: Database asyncio session.
+        :param table [orm]: Declarative base Table.
+        :param exc_status_code [int]: Exception HTTP status code.
+        :param exc_message [str]: Exception error message.
+
+        :returns: Database table objects.
+    '''
+    try:
+        data = (await db.execute(select(table))).scalars().all()
+        if not data:
+            raise ResponseValidationError(
+                status_code=exc_status_code,
+                message=exc_message
+            )
+        return data
+
+    except SQLAlchemyError as e:
+        raise ResponseValidationError(
+            status_code=exc_status_code,
+            message=exc_message) from e
+
+    finally:
+        await db.close()
+
+
+async def get_columns(
+    db: AsyncSession,
+    columns: list[DeclarativeMeta],
+    exc_status_code: status = status.HTTP_409_CONFLICT,
+    exc_message: str = 'Unable to find table in the database.'
+):
+    '''
+    Fetch the given columns of all database objects as plain rows, i.e. without building declarative base objects.
+
+        :param db [generator]: Database asyncio session.
+        :param columns [list[orm]]: List of declarative base Columns.
+        :param exc_status_code [int]: Exception HTTP status code.
+        :param exc_message [str]: Exception error message.
+
+        :returns: Database rows.
+    '''
+    try:
+        data = (await db.execute(select(*columns))).all()
+        if not data:
+            raise ResponseValidationError(
+                status_code=exc_status_code,
+                message=exc_message
+            )
+        return data
+
+    except SQLAlchemyError as e:
+        raise ResponseValidationError(
+            status_code=exc_status_code,
+            message=exc_message) from e
+
+    finally:
+        await db.close()
+
+
+async def get_rows(
+    db: AsyncSession,
+    columns: list[DeclarativeMeta],
+    filters: list | None = None,
+    exc_status_code: status = status.HTTP_409_CONFLICT,
+    exc_message: str = 'Unable to find rows in the database.'
+):
+    '''
+    Fetch the given columns of the database objects matching filters as plain rows, it may be empty.
+
+        :param db [generator]: Database asyncio session.
+        :param columns [list[orm]]: List of declarative base Columns.
+        :param filters [list]: Filter expressions, all of them must match.
+        :param exc_status_code [int]: Exception HTTP status code.
+        :param exc_message [str]: Exception error message.
+
+        :returns: Database rows.
+    '''
+    try:
+        return (await db.execute(select(*columns).where(*(filters or [])))).all()
+
+    except SQLAlchemyError as e:
+        raise ResponseValidationError(
+            status_code=exc_status_code,
+            message=exc_message) from e
+
+    finally:
+        await db.close()
+
+
+async def get_aggregate(
+    db: AsyncSession,
+    columns: list[DeclarativeMeta],
+    group_by: list[DeclarativeMeta],
+    filters: list | None = None,
+    exc_status_code: status = status.HTTP_409_CONFLICT,
+    exc_message: str = 'Unable to aggregate table in the database.'
+):
+    '''
+    Fetch aggregated rows, i.e. filter and group the objects in the database and return the grouped rows only.
+
+        :param db [generator]: Database asyncio session.
+        :param columns [list[orm]]: List of declarative base Columns and aggregate expressions.
+        :param group_by [list[orm]]: List of declarative base Columns to group by.
+        :param filters [list]: List of filter conditions.
+        :param exc_status_code [int]: Exception HTTP status code.
+        :param exc_message [str]: Exception error message.
+
+        :returns: Database rows.
+    '''
+    try:
+        data = (await db.execute(select(*columns).where(*(filters or [])).group_by(*group_by))).all()
+        if not data:
+            raise ResponseValidationError(
+                status_code=exc_status_code,
+                message=exc_message
+            )
+        return data
+
+    except SQLAlchemyError as e:
+        raise ResponseValidationError(
+            status_code=exc_status_code,
+            message=exc_message) from e
+
+    finally:
+        await db.close()
+
+
+async def get_table_version(
+    db: AsyncSession,
+    table: DeclarativeMeta,
+    column: DeclarativeMeta,
+    exc_status_code: status = status.HTTP_409_CONFLICT,
+    exc_message: str = 'Unable to find table version in the database.'
+) -> tuple:
+    '''
+    Fetch a table version, i.e. the latest value of a timestamp column and the number of objects.
+
+        :param db [generator]: Database asyncio session.
+        :param table [orm]: Declarative base Table.
+        :param column [orm]: Declarative base Column, e.g. last update date.
+        :param exc_status_code [int]: Exception HTTP status code.
+        :param exc_message [str]: Exception error message.
+
+        :returns [tuple]: Latest column value and objects count.
+    '''
+    try:
+        return tuple((await db.execute(select(func.max(column), func.count()).select_from(table))).one())
+
+    except SQLAlchemyError as e:
+        raise ResponseValidationError(
+            status_code=exc_status_code,
+            message=exc_message) from e
+
+    finally:
+        await db.close()
+
+
+async def create_object(
+    db: AsyncSession,
+    data: DeclarativeMeta,
+    exc_status_code: status = status.HTTP_409_CONFLICT,
+    exc_message: str = 'Unable to add object to the database.'
+):
+    '''
+    Add an object to the database.
+
+        :param db [generator]: Database asyncio session.
+        :param data [orm]: Declarative base object.
+        :param exc_status_code [int]: Exception HTTP status code.
+        :param exc_message [str]: Exception error message.
+    '''
+    try:
+        db.add(data)
+        await db.commit()
+
+    except SQLAlchemyError as e:
+        await db.rollback()
+        raise ResponseValidationError(
+            status_code=exc_status_code,
+            message=exc_message) from e
+
+    finally:
+        await db.close()
+
+
+async def create_object_returning(
+    db: AsyncSession,
+    table: DeclarativeMeta,
+    data: dict,
+    exc_status_code: status = status.HTTP_409_CONFLICT,
+    exc_message: str = 'Unable to add object to the database.'
+) -> dict:
+    '''
+    Add an object to the database and return it as stored, in a single INSERT ... RETURNING statement.
+
+        :param db [generator]: Database asyncio session.
+        :param table [orm]: Declarative base Table.
+        :param data [dict]: Object dictionary.
+        :param exc_status_code [int]: Exception HTTP status code.
+        :param exc_message [str]: Exception error message.
+
+        :returns [dict]: Database object, including server-side defaults.
+    '''
+    try:
+        row = (await db.execute(insert(table).values(data).returning(*table.__table__.columns))).mappings().one()
+        await db.commit()
+        return dict(row)
+
+    except SQLAlchemyError as e:
+        await db.rollback()
+        raise ResponseValidationError(
+            status_code=exc_status_code,
+            message=exc_message) from e
+
+    finally:
+        await db.close()
+
+
+async def create_objects(
+    db: AsyncSession,
+    data: list[DeclarativeMeta],
+    before: Callable[[AsyncSession], Awaitable[None]] | None = None,
+    exc_status_code: status = status.HTTP_409_CONFLICT,
+    exc_message: str = 'Unable to add objects to the database.'
+):
+    '''
+    Add multiple objects to the database.
+
+        :param db [generator]: Database asyncio session.
+        :param data [list[[orm]]: List of declarative base objects.
+        :param before [callable]: Function of the session awaited in the transaction before the objects are added, e.g. to lock and check them.
+        :param exc_status_code [int]: Exception HTTP status code.
+        :param exc_message [str]: Exception error message.
+    '''
+    try:
+        if before is not None:
+            await before(db)
+        db.add_all(data)
+        await db.commit()
+
+    except SQLAlchemyError as e:
+        await db.rollback()
+        raise ResponseValidationError(
+            status_code=exc_status_code,
+            message=exc_message) from e
+
+    finally:
+        await db.close()
+
+
+async def create_objects_returning(  # pylint: disable=[R0913]
+    db: AsyncSession,
+    table: DeclarativeMeta,
+    data: list[dict],
+    conflict_column: DeclarativeMeta,
+    before: Callable[[AsyncSession, list], Awaitable[list]] | None = None,
+    related: Callable[[list], tuple] | None = None,
+    chunk_size: int = 1000,
+    exc_status_code: status = status.HTTP_409_CONFLICT,
+    exc_message: str = 'Unable to add objects to the database.'
+) -> list:
+    '''
+    Add multiple objects in batched INSERT ... ON CONFLICT DO NOTHING RETURNING statements, objects conflicting on a unique column are skipped.
+    The objects that follow from the created ones, e.g. outbox messages, are added in the same transaction.
+
+        :param db [generator]: Database asyncio session.
+        :param table [orm]: Declarative base Table.
+        :param data [list[dict]]: List of object dictionaries.
+        :param conflict_column [orm]: Declarative base Column with a unique constraint, its values are returned.
+        :param before [callable]: Function of the session and objects awaited in the transaction before the inserts, returning the objects to insert.
+        :param related [callable]: Function of the created values returning a (table, list of object dictionaries) pair.
+        :param chunk_size [int]: Objects per statement, bound parameters are limited to 32767 per statement.
+        :param exc_status_code [int]: Exception HTTP status code.
+        :param exc_message [str]: Exception error message.
+
+        :returns [list]: Values of the conflict column of the created objects.
+    '''
+    try:
+        if before is not None:
+            data = await before(db, data)
+        created = []
+        for i in range(0, len(data), chunk_size):
+            statement = postgresql_insert(table).values(data[i:i+chunk_size])
+            statement = statement.on_conflict_do_nothing(index_elements=[conflict_column]).returning(conflict_column)
+            created.extend((await db.execute(statement)).scalars().all())
+
+        related_table, related_data = related(created) if related is not None and created else (None, [])
+        for i in range(0, len(related_data), chunk_size):
+            await db.execute(insert(related_table).values(related_data[i:i+chunk_size]))
+
+        await db.commit()
+        return created
+
+    except SQLAlchemyError as e:
+        await db.rollback()
+        raise ResponseValidationError(
+            status_code=exc_status_code,
+            message=exc_message) from e
+
+    finally:
+        await db.close()
+
+
+async def update_object(
+    db: AsyncSession,
+    table: DeclarativeMeta,
+    column: DeclarativeMeta,
+    value: Any,
+    data: dict,
+    exc_status_code: status = status.HTTP_409_CONFLICT,
+    exc_message: str = 'Unable to update object in the database.'
+):
+    '''
+    Update a database object.
+
+        :param db [generator]: Database asyncio session.
+        :param table [orm]: Declarative base Table.
+        :param column [orm]: Declarative base Column.
+        :param value: Value to look up.
+        :param data [dict]: Update dictionary.
+        :param exc_status_code [int]: Exception HTTP status code.
+        :param exc_message [str]: Exception error message.
+    '''
+
+    try:
+        await db.execute(update(table).where(column == value).values(data))
+        await db.commit()
+
+    except SQLAlchemyError as e:
+        await db.rollback()
+        raise ResponseValidationError(
+            status_code=exc_status_code,
+            message=exc_message) from e
+
+    finally:
+        await db.close()
+
+
+async def update_object_returning(
+    db: AsyncSession,
+    table: DeclarativeMeta,
+    column: DeclarativeMeta,
+    value: Any,
+    data: dict,
+    exc_status_code: status = status.HTTP_409_CONFLICT,
+    exc_message: str = 'Unable to update object in the database.'
+) -> dict:
+    '''
+    Update a database object and return it as updated, in a single UPDATE ... RETURNING statement.
+
+        :param db [generator]: Database asyncio session.
+        :param table [orm]: Declarative base Table.
+        :param column [orm]: Declarative base Column.
+        :param value: Value to look up.
+        :param data [dict]: Update dictionary.
+        :param exc_status_code [int]: Exception HTTP status code.
+        :param exc_message [str]: Exception error message.
+
+        :returns [dict]: Database object.
+    '''
+    try:
+        stmt = update(table).where(column == value).values(data).returning(*table.__table__.columns)
+        row = (await db.execute(stmt.execution_options(synchronize_session=False))).mappings().first()
+        if not row:
+            raise ResponseValidationError(
+                status_code=exc_status_code,
+                message=exc_message
+            )
+        await db.commit()
+        return dict(row)
+
+    except SQLAlchemyError as e:
+        await db.rollback()
+        raise ResponseValidationError(
+            status_code=exc_status_code,
+            message=exc_message) from e
+
+    finally:
+        await db.close()
@@ -1,6 +1,6 @@
 '''This module defines all database tables.'''
 
-from sqlalchemy import Column, Boolean, Integer, Float, String, DateTime, JSON, PickleType
+from sqlalchemy import Column, Boolean, Integer, Float, String, DateTime, Index, JSON, PickleType, UniqueConstraint
 from sqlalchemy.ext.mutable import MutableList
 from sqlalchemy.sql import func
 
@@ -24,6 +24,7 @@ class FarmsTable(Base):
     '''Define farms as a database table.'''
 
     __tablename__ = 'farms'
+    __table_args__ = (UniqueConstraint('FarmId', 'UnitNumber', name='uq_farms_farm_id_unit_number'),)  # natural key of ingested rows
 
     Id = Column(Integer, primary_key=True, autoincrement=True)
     GroupScheme = Column(String, nullable=False)
@@ -52,6 +53,7 @@ class NFTsTable(Base):
     '''Define nfts as a database table.'''
 
     __tablename__ = 'nfts'
+    __table_args__ = (Index('ix_nfts_farm_id_id', 'farmId', 'id'),)  # NFTs of a farm added since the last overlap check
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     nftId = Column(String, unique=True, nullable=False)
@@ -71,6 +73,38 @@ class NFTsTable(Base):
     updatedAt = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
 
+class OutboxTable(Base):
+
+    '''Define outbox as a database table, i.e. requests to other services written in the same transaction as their data.'''
+
+    __tablename__ = 'outbox'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    topic = Column(String, nullable=False)
+    key = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    nextRetryAt = Column(DateTime(timezone=True), server_default=func.now(), index=True)  # null once the attempts are exhausted
+    lastError = Column(String)
+    createdAt = Column(DateTime(timezone=True), server_default=func.now())
+    updatedAt = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class IngestionWatermarksTable(Base):
+
+    '''Define ingestion watermarks as a database table, i.e. the latest source change loaded by each ingestion job.'''
+
+    __tablename__ = 'ingestion_watermarks'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    source = Column(String, unique=True, nullable=False)
+    watermark = Column(DateTime)  # in the source clock
+    rowsLoaded = Column(Integer, default=0, nullable=False)
+    rowsRejected = Column(Integer, default=0, nullable=False)
+    createdAt = Column(DateTime(timezone=True), server_default=func.now())
+    updatedAt = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
 class PricingTable(Base):
 
     '''Define pricing as a database table.'''
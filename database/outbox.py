@@ -0,0 +1,85 @@
+'''This module manages the outbox, i.e. requests to other services written in the same transaction as their data, then delivered in batches.'''
+
+import random
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+
+from database import models
+
+
+class Outbox:
+    '''Outbox class.'''
+
+    def values(topic: str, key: str, payload: dict) -> dict:
+        '''Build the column values of an outbox message, due now.'''
+        return dict(topic=topic, key=key, payload=payload, attempts=0, nextRetryAt=datetime.now(timezone.utc))
+
+    def message(topic: str, key: str, payload: dict) -> models.OutboxTable:
+        '''Create an outbox message, to be added to the session of the data it comes from.'''
+        return models.OutboxTable(**Outbox.values(topic=topic, key=key, payload=payload))
+
+    def claim(db: Session, batch_size: int, lease_seconds: float) -> list:
+        '''
+        Claim a batch of due messages, they are leased so other dispatchers skip them until they are settled or the lease expires.
+
+            :param db [session]: Database session.
+            :param batch_size [int]: Maximum number of messages.
+            :param lease_seconds [float]: Seconds before an unsettled message is due again, e.g. if its dispatcher stopped.
+
+            :returns [list]: Claimed messages as (id, topic, key, payload, attempts) rows.
+        '''
+        now = datetime.now(timezone.utc)
+        try:
+            rows = db.execute(
+                select(models.OutboxTable.id, models.OutboxTable.topic, models.OutboxTable.key, models.OutboxTable.payload, models.OutboxTable.attempts)
+                .where(models.OutboxTable.nextRetryAt <= now)
+                .order_by(models.OutboxTable.nextRetryAt)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+            if rows:
+                db.execute(
+                    update(models.OutboxTable)
+                    .where(models.OutboxTable.id.in_([row.id for row in rows]))
+                    .values(nextRetryAt=now + timedelta(seconds=lease_seconds))
+                    .execution_options(synchronize_session=False)
+                )
+            db.commit()
+            return rows
+        except Exception:
+            db.rollback()
+            raise
+
+    def settle(db: Session, delivered: list, failed: list, max_attempts: int, backoff_seconds: float, backoff_max_seconds: float) -> None:
+        '''
+        Remove the delivered messages and reschedule the failed ones with exponential backoff and jitter.
+
+            :param db [session]: Database session.
+            :param delivered [list]: Ids of the delivered messages.
+            :param failed [list]: (id, attempts, error) of the failed messages, attempts excluding the failed one.
+            :param max_attempts [int]: Attempts after which a message is no longer retried, it is kept for inspection.
+            :param backoff_seconds [float]: Base delay of the exponential backoff.
+            :param backoff_max_seconds [float]: Maximum delay.
+        '''
+        now = datetime.now(timezone.utc)
+        try:
+            if delivered:
+                db.execute(delete(models.OutboxTable).where(models.OutboxTable.id.in_(delivered)).execution_options(synchronize_session=False))
+            for _id, attempts, error in failed:
+                attempts += 1
+                delay = min(backoff_max_seconds, backoff_seconds * 2**(attempts - 1)) * random.uniform(0.5, 1)
+                db.execute(
+                    update(models.OutboxTable)
+                    .where(models.OutboxTable.id == _id)
+                    .values(
+                        attempts=attempts,
+                        nextRetryAt=now + timedelta(seconds=delay) if attempts < max_attempts else None,
+                        lastError=None if error is None else str(error)[:1000]
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
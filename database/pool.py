@@ -0,0 +1,109 @@
+'''This module configures the database connection pools from config.yaml and records their live statistics.'''
+
+import threading
+import time
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from helpers.misc import AppSettings
+
+
+class PoolStatistics:
+    '''Connection pool statistics class.'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.connect_errors = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record(self, wait: float, error: Exception | None = None) -> None:
+        '''Record a connection checkout, its wait time in seconds and its error if any.'''
+        with self.lock:
+            self.wait_seconds_total += wait
+            self.wait_seconds_max = max(self.wait_seconds_max, wait)
+            if error is None:
+                self.checkouts += 1
+            elif isinstance(error, exc.TimeoutError):
+                self.timeouts += 1
+            else:
+                self.connect_errors += 1
+
+    def report(self, pool: QueuePool) -> dict:
+        '''Report the pool live status along with the recorded statistics.'''
+        with self.lock:
+            attempts = self.checkouts + self.timeouts + self.connect_errors
+            return dict(
+                size=pool.size(),
+                checked_in=pool.checkedin(),
+                checked_out=pool.checkedout(),
+                overflow=pool.overflow(),
+                checkouts=self.checkouts,
+                timeouts=self.timeouts,
+                connect_errors=self.connect_errors,
+                wait_seconds_avg=self.wait_seconds_total/attempts if attempts else 0.0,
+                wait_seconds_max=self.wait_seconds_max
+            )
+
+
+class ObservedPool:
+    '''Connection pool mixin that records how long every checkout waits and how it fails.'''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statistics = PoolStatistics()
+
+    def connect(self):
+        '''Check out a connection from the pool.'''
+        start = time.perf_counter()
+        try:
+            conn = super().connect()
+        except Exception as e:
+            self.statistics.record(wait=time.perf_counter()-start, error=e)
+            raise
+        self.statistics.record(wait=time.perf_counter()-start)
+        return conn
+
+    def recreate(self):
+        '''Recreate the pool (e.g. on dispose) while keeping its statistics.'''
+        pool = super().recreate()
+        pool.statistics = self.statistics
+        return pool
+
+
+class ObservedQueuePool(ObservedPool, QueuePool):
+    '''Observed queue pool class.'''
+
+
+class ObservedAsyncQueuePool(ObservedPool, AsyncAdaptedQueuePool):
+    '''Observed asyncio queue pool class.'''
+
+
+class ConnectionPool:
+    '''Connection pool class.'''
+
+    def options(url: str, settings: AppSettings, asyncio: bool = False) -> dict:
+        '''Build the engine pool options, including the per-statement timeout of the database driver.'''
+        pool = settings.DATABASE.POSTGRESQL.POOL
+        timeout = int(pool.STATEMENT_TIMEOUT)
+
+        if url.startswith('postgresql+asyncpg'):
+            connect_args = {'server_settings': {'statement_timeout': str(timeout)}}
+        elif url.startswith('postgresql'):
+            connect_args = {'options': f'-c statement_timeout={timeout}'}
+        elif url.startswith('sqlite') and not asyncio:
+            connect_args = {'check_same_thread': False}  # pooled connections are checked out by any thread
+        else:
+            connect_args = {}
+
+        return dict(
+            poolclass=ObservedAsyncQueuePool if asyncio else ObservedQueuePool,
+            pool_size=int(pool.SIZE),
+            max_overflow=int(pool.MAX_OVERFLOW),
+            pool_timeout=float(pool.TIMEOUT),
+            pool_recycle=int(pool.RECYCLE),
+            pool_pre_ping=bool(pool.PRE_PING),
+            connect_args=connect_args
+        )
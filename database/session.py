@@ -1,17 +1,26 @@
-'''This module creates the database engine and a session for each instance as a generator.'''
+'''This module creates the database engines and a session for each instance as a generator.'''
 
-from typing import Generator
+from typing import AsyncGenerator, Generator
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 from config import get_settings
+from database.pool import ConnectionPool
 
 
+# the engines and their pools are built once, a new database URL or pool configuration requires a restart, see config.RESTART_SETTINGS
 settings = get_settings()
-engine = create_engine(settings.DATABASE.POSTGRESQL.URL)
+engine = create_engine(settings.DATABASE.POSTGRESQL.URL, **ConnectionPool.options(url=settings.DATABASE.POSTGRESQL.URL, settings=settings))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+async_engine = create_async_engine(
+    settings.DATABASE.POSTGRESQL.ASYNC_URL,
+    **ConnectionPool.options(url=settings.DATABASE.POSTGRESQL.ASYNC_URL, settings=settings, asyncio=True)
+)
+AsyncSessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=async_engine, class_=AsyncSession)
+
 
 def get_db() -> Generator:
     '''Database generator.'''
@@ -20,3 +29,17 @@ def get_db() -> Generator:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db() -> AsyncGenerator:
+    '''Database asyncio generator, i.e. queries are awaited instead of blocking the event loop.'''
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def get_pool_statistics() -> dict:
+    '''Report the live statistics of the database connection pools.'''
+    return dict(
+        sync=engine.pool.statistics.report(engine.pool),
+        asyncio=async_engine.sync_engine.pool.statistics.report(async_engine.sync_engine.pool)
+    )
@@ -1,10 +1,16 @@
 '''This module manages the creation and insertion of initial data to the database.'''
 
+import logging
+from sqlalchemy import Index, inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+
 from config import get_settings
 from database import crud, models, session
 from security.hashing import SecureHash
 
 
+LOGGER = logging.getLogger(__name__)
 settings = get_settings()
 ADMIN_MASTER = models.AdminsTable(
     username=settings.ADMIN.USERNAME,
@@ -18,6 +24,8 @@ def start_database():
 
     # initiate the database session
     models.Base.metadata.create_all(bind=session.engine)
+    migrate_farms_natural_key(bind=session.engine)
+    migrate_nfts_farm_index(bind=session.engine)
 
     # setup admin
     try:
@@ -27,3 +35,26 @@ def start_database():
         pass
     finally:
         db.close()
+
+
+def migrate_farms_natural_key(bind: Engine) -> None:
+    '''
+    Add the unique index of the farms natural key (FarmId, UnitNumber) to a farms table created without it, create_all does not alter existing tables.
+    Farm units repeated in the table are reported and left as they are, the ingestion upserts fail until they are removed.
+    '''
+    natural_key = ['FarmId', 'UnitNumber']
+    inspector = inspect(bind)
+    unique = inspector.get_unique_constraints('farms') + [i for i in inspector.get_indexes('farms') if i['unique']]
+    if any(u['column_names'] == natural_key for u in unique):
+        return
+
+    try:
+        Index('uq_farms_farm_id_unit_number', *[models.FarmsTable.__table__.c[c] for c in natural_key], unique=True).create(bind=bind)
+    except IntegrityError as e:
+        LOGGER.error('Unable to add the farms natural key, farm units are repeated in the farms table: %s', e.orig)
+
+
+def migrate_nfts_farm_index(bind: Engine) -> None:
+    '''Add the (farmId, id) index read by the NFT overlap checks to a nfts table created without it, create_all does not alter existing tables.'''
+    index = next(i for i in models.NFTsTable.__table__.indexes if i.name == 'ix_nfts_farm_id_id')
+    index.create(bind=bind, checkfirst=True)
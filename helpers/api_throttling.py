@@ -1,25 +1,186 @@
-'''This module manages the application throttling control.'''
+'''This module manages the application throttling control.
+Each client (IP address, or admin username when authenticated) has a token bucket per route.
+Buckets are kept in a SQLite file so all workers of a host share them.'''
 
-from fastapi import FastAPI
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.middleware import SlowAPIMiddleware
-from slowapi.errors import RateLimitExceeded
-from slowapi.util import get_remote_address
+import logging
+import math
+import sqlite3
+import threading
+import time
+from fastapi import FastAPI, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from jose import JWTError
+
+from config import get_settings
+from helpers.misc import AppSettings
+from security.tokens import JSONWebToken
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class TokenBucketStore:
+    '''Token bucket store class, i.e. a SQLite table of buckets (key, tokens, updated) shared by the worker processes.'''
+
+    def __init__(self, path: str, timeout: float = 1, cleanup_every: int = 10000, idle_seconds: float = 3600):
+        self.path = path
+        self.timeout = timeout
+        self.cleanup_every = cleanup_every
+        self.idle_seconds = idle_seconds
+        self.local = threading.local()
+        self.calls = 0
+        self.connection().execute('CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)')
+
+    def connection(self) -> sqlite3.Connection:
+        '''Open, once per thread, a connection in autocommit mode so transactions are explicit.'''
+        con = getattr(self.local, 'connection', None)
+        if con is None:
+            con = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            con.execute('PRAGMA journal_mode=WAL')
+            con.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = con
+        return con
+
+    def consume(self, key: str, rate: float, burst: float, cost: float = 1) -> tuple:
+        '''
+        Refill a bucket for the time elapsed since its last update, then take tokens from it if enough are left.
+
+            :param key [str]: Bucket key.
+            :param rate [float]: Tokens refilled per second.
+            :param burst [float]: Bucket capacity.
+            :param cost [float]: Tokens taken by the request.
+
+            :returns [tuple]: Whether the request is allowed, the tokens left and the seconds before enough tokens are refilled.
+        '''
+        con = self.connection()
+        now = time.time()
+        con.execute('BEGIN IMMEDIATE')  # the bucket is locked across processes until commit
+        try:
+            row = con.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + max(now - row[1], 0)*rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            con.execute('INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)', (key, tokens, now))
+            con.execute('COMMIT')
+        except sqlite3.Error:
+            con.execute('ROLLBACK')
+            raise
+
+        self.calls += 1
+        if self.calls % self.cleanup_every == 0:
+            self.cleanup(now=now)
+
+        retry_after = 0 if allowed else (cost - tokens)/rate if rate > 0 else math.inf
+        return allowed, tokens, retry_after
+
+    def cleanup(self, now: float) -> None:
+        '''Remove the buckets left idle, they would be full again anyway.'''
+        self.connection().execute('DELETE FROM buckets WHERE updated < ?', (now - self.idle_seconds,))
+
+
+class ThrottlingMiddleware:
+    '''Throttling middleware class, it rejects requests whose token bucket is empty with an HTTP 429 status.'''
+
+    def __init__(self, app, store: TokenBucketStore):
+        self.app = app
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        settings = get_settings()
+        if scope['type'] != 'http' or not settings.THROTTLING.ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        # the token check and the bucket transaction block, hence they run in a worker thread instead of the event loop
+        try:
+            limit, (allowed, tokens, retry_after) = await run_in_threadpool(self.check, scope=scope, settings=settings)
+        except sqlite3.Error as e:
+            LOGGER.warning('Unable to throttle request, it is allowed: %s', e)  # a busy or broken store must not take the API down
+            allowed = True
+
+        if allowed:
+            await self.app(scope, receive, send)
+            return
+
+        response = JSONResponse(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            content=dict(error=True, message=f'Rate limit exceeded: {limit["BURST"]} per burst and {limit["RATE"]} per second'),
+            headers={'Retry-After': str(math.ceil(retry_after)) if math.isfinite(retry_after) else '3600', 'X-RateLimit-Remaining': str(int(tokens))}
+        )
+        await response(scope, receive, send)
+
+    def check(self, scope: dict, settings: AppSettings) -> tuple:
+        '''Take a token from the bucket of the request client and route, returns the limit applied and the store answer, see TokenBucketStore.consume.'''
+        path = Throttling.route_path(path=scope['path'], settings=settings)
+        client = Throttling.client(scope=scope)
+        route, limit = Throttling.limit(path=path, client=client, settings=settings)
+        if route is None:
+            return None, (True, math.inf, 0)
+        return limit, self.store.consume(key=f'{route}|{client}', rate=float(limit['RATE']), burst=float(limit['BURST']))
 
 
 class Throttling:
     '''Throttling limiter class.'''
 
     def enable(app: FastAPI) -> FastAPI:
-        '''Enable a limiter to control the amount of requests per minute based on IP address.'''
-        limiter = Limiter(key_func=get_remote_address, default_limits=['2/second', '20/minute',])
-        app.state.limiter = limiter
-        app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-        app.add_middleware(SlowAPIMiddleware)
+        '''Enable a token bucket limiter, per client and route, with the limits from config.yaml.'''
+        settings = get_settings()
+        app.add_middleware(ThrottlingMiddleware, store=TokenBucketStore(path=settings.THROTTLING.STORE))
         return app
 
     def disable(app: FastAPI) -> FastAPI:
-        '''Disable throttling limiter.'''
-        limiter = Limiter(key_func=get_remote_address, enabled=False)
-        app.state.limiter = limiter
+        '''Disable throttling limiter, i.e. no middleware is installed.'''
         return app
+
+    def route_path(path: str, settings: AppSettings) -> str:
+        '''Remove the API prefix from a request path.'''
+        prefix = settings.API.PREFIX
+        return path[len(prefix):] if path.startswith(prefix) else path
+
+    def client(scope: dict) -> str:
+        '''Identify the client by admin username if it sends a valid JWT, otherwise by IP address.'''
+        token = Throttling.bearer_token(scope=scope)
+        if token:
+            try:
+                username = JSONWebToken.decode(token).get('username')
+                if username:
+                    return f'admin:{username}'
+            except JWTError:
+                pass
+        host = scope['client'][0] if scope.get('client') else 'unknown'
+        return f'ip:{host}'
+
+    def bearer_token(scope: dict) -> str | None:
+        '''Fetch the bearer token of the Authorization header, if any.'''
+        for name, value in scope.get('headers', []):
+            if name == b'authorization':
+                scheme, _, token = value.decode('latin-1').partition(' ')
+                return token if scheme.lower() == 'bearer' else None
+        return None
+
+    def limit(path: str, client: str, settings: AppSettings) -> tuple:
+        '''
+        Find the limit of a request, i.e. the route with the longest matching path prefix, then the admin limit if the client is one.
+
+            :param path [str]: Request path, without API prefix.
+            :param client [str]: Client identity, see Throttling.client.
+            :param settings: Application settings.
+
+            :returns [tuple]: Route path and its limit (RATE, BURST) mapping, or None if no route matches.
+        '''
+        route = None
+        for r in settings.THROTTLING.ROUTES:
+            if (path == r['PATH'] or path.startswith(r['PATH'].rstrip('/') + '/')) and (route is None or len(r['PATH']) > len(route['PATH'])):
+                route = r
+        if route is None:
+            return None, None
+
+        if client.startswith('admin:'):
+            username = client[len('admin:'):]
+            for admin in settings.THROTTLING.ADMINS:
+                if admin['USERNAME'] == username:
+                    return route['PATH'], admin
+            return route['PATH'], route['ADMIN']
+        return route['PATH'], route['ANONYMOUS']
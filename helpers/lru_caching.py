@@ -1,30 +1,293 @@
-'''This module uses the lru_cache decorator to create an object only once, instead of doing it for each request.
-Learn more at https://fastapi.tiangolo.com/it/advanced/settings/#creating-the-settings-only-once-with-lru_cache'''
+'''This module manages in-process caching: least recently used (LRU) caches with a lifetime per entry, bounded by count and by approximate size.
+Concurrent misses on the same key are computed once (single-flight), for both regular and async functions.'''
 
-from typing import Any, Callable, TypeVar
-from functools import lru_cache, wraps
-from datetime import datetime, timedelta
+import asyncio
+import inspect
+import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Awaitable, Callable, Hashable
 
 
-T = TypeVar('T')
+CACHES = {}
 
 
-def timed_lru_cache(seconds: int, maxsize: int = 128) -> Callable[..., Callable[..., T]]:
-    '''Set up a refresh time and space for the lru_cache decorator.'''
+def approximate_size(obj: Any, depth: int = 4) -> int:
+    '''Approximate the memory size of an object in bytes, including its content up to a given depth.'''
+    if hasattr(obj, 'memory_usage') and callable(obj.memory_usage):
+        try:
+            return int(obj.memory_usage(deep=True).sum())
+        except (TypeError, AttributeError):
+            pass
 
-    def decorator(func: Any) -> Any:
-        '''Wrap the decorated function with the lru_cache decorator.'''
-        func = lru_cache(maxsize=maxsize)(func)
-        func.lifetime = timedelta(seconds=seconds)
-        func.expiration = datetime.utcnow() + func.lifetime
+    size = sys.getsizeof(obj)
+    if depth <= 0 or isinstance(obj, (str, bytes, bytearray, int, float, bool)):
+        return size
+    if isinstance(obj, dict):
+        return size + sum(approximate_size(k, depth-1) + approximate_size(v, depth-1) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return size + sum(approximate_size(v, depth-1) for v in obj)
+    if hasattr(obj, '__dict__'):
+        return size + approximate_size(vars(obj), depth-1)
+    return size
+
+
+class Flight:
+    '''Single-flight call class, i.e. a computation in progress that concurrent callers wait for.'''
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class Flights:
+    '''
+    In-flight computations class, i.e. the single-flight calls of regular functions and the futures of async ones, per key.
+    Each key in flight has a generation, bumped when the key is invalidated, so computations started before do not cache their result.
+    The cache lock must be held by the callers.
+    '''
+
+    def __init__(self):
+        self.calls = {}  # key: Flight
+        self.futures = {}  # key: future
+        self.generations = {}  # key: [generation, computations in flight], kept while the key is computed
+
+    def start(self, key: Hashable) -> int:
+        '''Count a computation of a key in, returns the key generation it starts from.'''
+        entry = self.generations.setdefault(key, [0, 0])
+        entry[1] += 1
+        return entry[0]
+
+    def finish(self, key: Hashable, flights: dict, flight: Any) -> None:
+        '''Count a computation of a key out, its flight is unlisted unless an invalidation already did.'''
+        if flights.get(key) is flight:
+            del flights[key]
+        entry = self.generations[key]
+        entry[1] -= 1
+        if not entry[1]:
+            del self.generations[key]
+
+    def current(self, key: Hashable, generation: int) -> bool:
+        '''Check if a key has not been invalidated since a computation started from a generation.'''
+        entry = self.generations.get(key)
+        return entry is not None and entry[0] == generation
+
+    def invalidate(self, key: Hashable) -> None:
+        '''Bump the generation of a key in flight and unlist its flights, so later callers compute it again.'''
+        entry = self.generations.get(key)
+        if entry is not None:
+            entry[0] += 1
+        self.calls.pop(key, None)
+        self.futures.pop(key, None)
+
+
+class CacheStatistics:
+    '''Cache statistics class, i.e. the lookup and eviction counters and the approximate size in bytes of the entries.'''
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.nbytes = 0
+
+
+class TTLCache:
+    '''Least recently used cache class, with a lifetime per entry and bounded by count and by approximate size in bytes.'''
+
+    def __init__(self, name: str, seconds: float, maxsize: int = 128, maxbytes: int | None = None):
+        self.name = name
+        self.seconds = seconds
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.lock = threading.Lock()
+        self.items = OrderedDict()  # key: (value, expiration, size)
+        self.statistics = CacheStatistics()
+        self.flights = Flights()
+        CACHES[name] = self
+
+    def lookup(self, key: Hashable) -> tuple:
+        '''Fetch an entry as a (found, value) pair, expired entries are removed.'''
+        now = time.monotonic()
+        with self.lock:
+            item = self.items.get(key)
+            if item is not None:
+                value, expiration, _ = item
+                if now < expiration:
+                    self.items.move_to_end(key)
+                    self.statistics.hits += 1
+                    return True, value
+                self.pop(key)
+                self.statistics.expirations += 1
+            self.statistics.misses += 1
+            return False, None
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        '''Fetch a value, or the default one if the key is missing or expired.'''
+        found, value = self.lookup(key)
+        return value if found else default
+
+    def set(self, key: Hashable, value: Any, seconds: float | None = None, generation: int | None = None) -> None:
+        '''
+        Cache a value for its own lifetime (or the cache one), then evict the least recently used entries beyond the bounds.
+        A value computed from a generation of its key is dropped if the key has been invalidated since.
+        '''
+        seconds = self.seconds if seconds is None else seconds
+        if seconds <= 0 or self.maxsize <= 0:
+            return
+        size = approximate_size(value) if self.maxbytes else 0
+        with self.lock:
+            if generation is not None and not self.flights.current(key, generation):
+                return
+            self.pop(key)
+            self.items[key] = (value, time.monotonic() + seconds, size)
+            self.statistics.nbytes += size
+            while self.items and (len(self.items) > self.maxsize or (self.maxbytes and self.statistics.nbytes > self.maxbytes)):
+                self.pop(next(iter(self.items)))
+                self.statistics.evictions += 1
+
+    def pop(self, key: Hashable) -> None:
+        '''Remove an entry, the lock must be held by the caller.'''
+        item = self.items.pop(key, None)
+        if item is not None:
+            self.statistics.nbytes -= item[2]
+
+    def invalidate(self, key: Hashable) -> None:
+        '''Remove an entry by its key, the computations of the key in flight are not cached.'''
+        with self.lock:
+            self.pop(key)
+            self.flights.invalidate(key)
+
+    def invalidate_prefix(self, prefix: str) -> int:
+        '''Remove all entries whose (string) key starts with a prefix, returns the number of removed entries.'''
+        with self.lock:
+            keys = [k for k in self.items if isinstance(k, str) and k.startswith(prefix)]
+            for k in keys:
+                self.pop(k)
+            for k in [k for k in self.flights.generations if isinstance(k, str) and k.startswith(prefix)]:
+                self.flights.invalidate(k)
+            return len(keys)
+
+    def clear(self) -> None:
+        '''Remove all entries.'''
+        with self.lock:
+            self.items.clear()
+            self.statistics.nbytes = 0
+            for k in list(self.flights.generations):
+                self.flights.invalidate(k)
+
+    def stats(self) -> dict:
+        '''Report the cache statistics.'''
+        with self.lock:
+            return dict(
+                name=self.name,
+                size=len(self.items),
+                bytes=self.statistics.nbytes,
+                hits=self.statistics.hits,
+                misses=self.statistics.misses,
+                evictions=self.statistics.evictions,
+                expirations=self.statistics.expirations
+            )
+
+    def get_or_compute(self, key: Hashable, func: Callable[[], Any], seconds: float | None = None) -> Any:
+        '''Fetch a value or compute it, concurrent misses on the same key wait for a single computation.'''
+        found, value = self.lookup(key)
+        if found:
+            return value
+
+        with self.lock:
+            flight = self.flights.calls.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights.calls[key] = Flight()
+                generation = self.flights.start(key)
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = func()
+            self.set(key, flight.value, seconds=seconds, generation=generation)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                self.flights.finish(key, self.flights.calls, flight)
+            flight.done.set()
+
+    async def aget_or_compute(self, key: Hashable, func: Callable[[], Awaitable[Any]], seconds: float | None = None) -> Any:
+        '''Fetch a value or await its computation, concurrent misses on the same key await a single computation.'''
+        found, value = self.lookup(key)
+        if found:
+            return value
+
+        while key in self.flights.futures:
+            flight = self.flights.futures[key]
+            try:
+                return await asyncio.shield(flight)
+            except asyncio.CancelledError:
+                if not flight.cancelled():
+                    raise
+                # the computing caller was cancelled, take over
+
+        with self.lock:
+            flight = self.flights.futures[key] = asyncio.get_running_loop().create_future()
+            generation = self.flights.start(key)
+        try:
+            value = await func()
+            self.set(key, value, seconds=seconds, generation=generation)
+            flight.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except Exception as e:
+            flight.set_exception(e)
+            flight.exception()  # mark as retrieved when nobody waits for it
+            raise
+        finally:
+            with self.lock:
+                self.flights.finish(key, self.flights.futures, flight)
+
+
+def make_key(func: Callable, args: tuple, kwargs: dict) -> str:
+    '''Build a string cache key from a function name and its arguments, so entries can be invalidated by prefix.'''
+    params = [repr(a) for a in args] + [f'{k}={v!r}' for k, v in sorted(kwargs.items())]
+    return f'{func.__module__}.{func.__qualname__}:{",".join(params)}'
+
+
+def ttl_cache(seconds: float, maxsize: int = 128, maxbytes: int | None = None) -> Callable:
+    '''Cache a regular or async function results per arguments, see TTLCache.'''
+
+    def decorator(func: Callable) -> Callable:
+        '''Wrap the decorated function with a TTLCache, exposed as its cache attribute.'''
+        cache = TTLCache(name=f'{func.__module__}.{func.__qualname__}', seconds=seconds, maxsize=maxsize, maxbytes=maxbytes)
+
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                '''Await the cached result, or the function.'''
+                return await cache.aget_or_compute(make_key(func, args, kwargs), lambda: func(*args, **kwargs))
+            async_wrapper.cache = cache
+            return async_wrapper
 
         @wraps(func)
         def wrapper(*args: Any, **kwargs: Any) -> Any:
-            '''Before accessing an entry in the cache, it clears the cache and
-            recomputes the lifetime and expiration date if the current date is past the expiration date.'''
-            if datetime.utcnow() >= func.expiration:
-                func.cache_clear()
-                func.expiration = datetime.utcnow() + func.lifetime
-            return func(*args, **kwargs)
+            '''Return the cached result, or call the function.'''
+            return cache.get_or_compute(make_key(func, args, kwargs), lambda: func(*args, **kwargs))
+        wrapper.cache = cache
         return wrapper
     return decorator
+
+
+def cache_statistics() -> list:
+    '''Report the statistics of every cache.'''
+    return [cache.stats() for cache in CACHES.values()]
@@ -1,8 +1,10 @@
 '''This module contains a miscellaneous collection of unit functions.'''
 
-import os
+import base64
 import json
+from types import MappingProxyType
 from typing import Any
+from urllib.parse import quote_plus
 from uuid import UUID
 from decimal import Decimal
 from datetime import date, datetime
@@ -10,14 +12,25 @@ from caseconverter import camelcase, pascalcase
 
 
 class AppSettings():
-    '''Application settings class.'''
+    '''Application settings class, it is read-only once built so a single instance can be shared by every request and thread.'''
 
     def __init__(self, d):
         for k, v in d.items():
-            if isinstance(k, (list, tuple)):
-                setattr(self, k, [AppSettings(x) if isinstance(x, dict) else x for x in v])
-            else:
-                setattr(self, k, AppSettings(v) if isinstance(v, dict) else v)
+            object.__setattr__(self, k, AppSettings(v) if isinstance(v, dict) else AppSettings.freeze(v))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'Application settings are read-only: {name}')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'Application settings are read-only: {name}')
+
+    def freeze(v: Any) -> Any:
+        '''Convert nested lists into tuples and nested dictionaries into read-only mappings.'''
+        if isinstance(v, dict):
+            return MappingProxyType({k: AppSettings.freeze(x) for k, x in v.items()})
+        if isinstance(v, (list, tuple)):
+            return tuple(AppSettings.freeze(x) for x in v)
+        return v
 
 
 class DataAggregator:
@@ -59,6 +72,16 @@ class DataFormatter:
             return s.replace('postgres', 'postgresql')
         return s
 
+    def mssql(server: str, username: str, password: str, database: str) -> str:
+        '''Format a Microsoft SQL Server URL string, using the pymssql driver.'''
+        return f'mssql+pymssql://{quote_plus(username)}:{quote_plus(password)}@{server}/{database}'
+
+    def async_database_url(s: str) -> str:
+        '''Format a database URL string to use its asyncio driver, e.g. asyncpg for PostgreSQL.'''
+        drivers = {'postgresql': 'postgresql+asyncpg', 'sqlite': 'sqlite+aiosqlite'}
+        scheme, sep, path = s.partition('://')
+        return f'{drivers.get(scheme, scheme)}{sep}{path}'
+
     def class_to_dict_list(lst: list) -> list:
         '''Convert a list of objects to a list of dicts.'''
         return [item.__dict__ for item in lst]
@@ -77,10 +100,32 @@ class FileManagement:
                 return json.load(f)
         return None
 
-    def remove_file(filename: str) -> None:
-        '''Remove file if exists.'''
-        if os.path.exists(filename):
-            os.remove(filename)
+
+class ConditionalRequest:
+    '''HTTP conditional request class.'''
+
+    def etag_matches(if_none_match: str | None, etag: str) -> bool:
+        '''Check if an If-None-Match header matches an ETag, using the weak comparison.'''
+        if not if_none_match:
+            return False
+        tags = [t.strip() for t in if_none_match.split(',')]
+        return '*' in tags or etag.removeprefix('W/') in [t.removeprefix('W/') for t in tags]
+
+
+class KeysetCursor:
+    '''Keyset pagination cursor class, i.e. an opaque token holding the sort key of the last item of a page.'''
+
+    def encode(values: list) -> str:
+        '''Encode a sort key as a URL-safe cursor.'''
+        data = json.dumps(values, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+    def decode(cursor: str) -> list:
+        '''Decode a cursor into its sort key, raises ValueError if the cursor is malformed.'''
+        values = json.loads(base64.urlsafe_b64decode(cursor + '='*(-len(cursor) % 4)))
+        if not isinstance(values, list):
+            raise ValueError('cursor must hold a list')
+        return values
 
 
 class JSONCustomEncoder(json.JSONEncoder):
@@ -0,0 +1,366 @@
+'''This module manages in-memory spatial indexing: a uniform grid of longitude/latitude cells over GeoJSON geometries, i.e. [lng, lat] coordinates.
+Geometries are indexed by their bounding box, then bounding box, radius and k-nearest queries are refined with exact distances in kilometers.'''
+
+import heapq
+import itertools
+import math
+import threading
+from typing import Any, Hashable
+
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi*EARTH_RADIUS_KM/180
+
+
+class Geometry:
+    '''GeoJSON geometry class, i.e. Point, Polygon and MultiPolygon coordinates as [lng, lat].'''
+
+    def points(geometry: dict) -> list:
+        '''List the vertices of a geometry, raises ValueError if it is not a valid Point, Polygon or MultiPolygon.'''
+        try:
+            kind, coordinates = geometry['type'], geometry['coordinates']
+            if kind == 'Point':
+                points = [coordinates]
+            elif kind == 'Polygon':
+                points = [p for ring in coordinates for p in ring]
+            elif kind == 'MultiPolygon':
+                points = [p for polygon in coordinates for ring in polygon for p in ring]
+            else:
+                raise ValueError(f'unsupported geometry type: {kind}')
+            points = [(float(p[0]), float(p[1])) for p in points]
+        except (KeyError, IndexError, TypeError) as e:
+            raise ValueError('invalid geometry') from e
+        if not points or any(not (-180 <= lng <= 180 and -90 <= lat <= 90) for lng, lat in points):
+            raise ValueError('invalid geometry coordinates')
+        return points
+
+    def polygons(geometry: dict) -> list:
+        '''List the polygons of a geometry as lists of rings of (lng, lat) points, a point is a polygon of a single vertex.'''
+        if geometry['type'] == 'Point':
+            return [[[tuple(geometry['coordinates'])]]]
+        if geometry['type'] == 'Polygon':
+            return [[[tuple(p) for p in ring] for ring in geometry['coordinates']]]
+        return [[[tuple(p) for p in ring] for ring in polygon] for polygon in geometry['coordinates']]
+
+    def bbox(geometry: dict) -> tuple:
+        '''Compute the bounding box of a geometry, i.e. (min lng, min lat, max lng, max lat).'''
+        points = Geometry.points(geometry)
+        lngs, lats = [p[0] for p in points], [p[1] for p in points]
+        return (min(lngs), min(lats), max(lngs), max(lats))
+
+    def haversine(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+        '''Compute the great-circle distance between two points in kilometers.'''
+        phi1, phi2 = math.radians(lat1), math.radians(lat2)
+        a = math.sin((phi2 - phi1)/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(math.radians(lng2 - lng1)/2)**2
+        return 2*EARTH_RADIUS_KM*math.asin(min(1.0, math.sqrt(a)))
+
+    def project(points: list, lat: float, lng: float) -> list:
+        '''Project (lng, lat) points on a plane in kilometers around a point (equirectangular), accurate for parcel-sized geometries.'''
+        scale = math.cos(math.radians(lat))
+        return [((p[0] - lng)*scale*KM_PER_DEGREE, (p[1] - lat)*KM_PER_DEGREE) for p in points]
+
+    def unproject(x: float, y: float, lat: float, lng: float) -> tuple:
+        '''Convert a planar point in kilometers around a point back to (lng, lat).'''
+        return (lng + x/(math.cos(math.radians(lat))*KM_PER_DEGREE), lat + y/KM_PER_DEGREE)
+
+    def contains(rings: list, x: float, y: float) -> bool:
+        '''Check if a planar point lies inside a polygon, holes excluded (even-odd rule).'''
+        inside = False
+        for ring in rings:
+            for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+                if (y1 > y) != (y2 > y) and x < x1 + (y - y1)*(x2 - x1)/(y2 - y1):
+                    inside = not inside
+        return inside
+
+    def nearest_on_segment(x: float, y: float, x1: float, y1: float, x2: float, y2: float) -> tuple:
+        '''Find the point of a segment nearest to a planar point.'''
+        dx, dy = x2 - x1, y2 - y1
+        t = 0.0 if dx == dy == 0 else max(0.0, min(1.0, ((x - x1)*dx + (y - y1)*dy)/(dx*dx + dy*dy)))
+        return (x1 + t*dx, y1 + t*dy)
+
+    def distance(geometry: dict, lat: float, lng: float) -> float:
+        '''
+        Compute the distance in kilometers between a point and a geometry, 0 if the point lies inside it.
+        Polygons are projected around their own bounding box center to find their nearest point, then the great-circle distance to it is measured.
+        '''
+        if geometry['type'] == 'Point':
+            return Geometry.haversine(lat, lng, geometry['coordinates'][1], geometry['coordinates'][0])
+
+        bbox = Geometry.bbox(geometry)
+        lat0, lng0 = (bbox[1] + bbox[3])/2, (bbox[0] + bbox[2])/2
+        (x, y), = Geometry.project([(lng, lat)], lat=lat0, lng=lng0)
+
+        polygons = [[Geometry.project(ring, lat=lat0, lng=lng0) for ring in polygon] for polygon in Geometry.polygons(geometry)]
+        nearest = Geometry.nearest_point(polygons=polygons, x=x, y=y)
+        if nearest is None:
+            return 0.0
+
+        nearest_lng, nearest_lat = Geometry.unproject(*nearest, lat=lat0, lng=lng0)
+        return Geometry.haversine(lat, lng, nearest_lat, nearest_lng)
+
+    def nearest_point(polygons: list, x: float, y: float) -> tuple | None:
+        '''Find the boundary point of planar polygons nearest to a planar point, None if the point lies inside one of them.'''
+        if any(Geometry.contains(rings, x, y) for rings in polygons):
+            return None
+        points = (
+            Geometry.nearest_on_segment(x, y, *a, *b)
+            for rings in polygons for ring in rings for a, b in zip(ring, ring[1:] + ring[:1])
+        )
+        return min(points, key=lambda p: math.hypot(x - p[0], y - p[1]))
+
+    def radius_bbox(lat: float, lng: float, radius_km: float) -> tuple:
+        '''Compute the bounding box of a circle, it spans every longitude near the poles.'''
+        dlat = radius_km/KM_PER_DEGREE
+        scale = math.cos(math.radians(min(90.0, abs(lat) + dlat)))
+        dlng = 180.0 if scale < 1e-9 else min(180.0, dlat/scale)
+        return (max(-180.0, lng - dlng), max(-90.0, lat - dlat), min(180.0, lng + dlng), min(90.0, lat + dlat))
+
+    def bbox_intersects(a: tuple, b: tuple) -> bool:
+        '''Check if two bounding boxes intersect, touching edges included.'''
+        return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+    def edges(rings: list) -> list:
+        '''List the edges of planar rings as ((x1, y1), (x2, y2)), a closing vertex repeating the first one is ignored.'''
+        edges = []
+        for ring in rings:
+            ring = ring[:-1] if len(ring) > 1 and ring[0] == ring[-1] else ring
+            edges += [(p, q) for p, q in zip(ring, ring[1:] + ring[:1]) if p != q]
+        return edges
+
+    def strictly_inside(rings: list, edges: list, x: float, y: float, tolerance: float) -> bool:
+        '''Check if a planar point lies inside a polygon farther than a tolerance from its boundary.'''
+        if not Geometry.contains(rings, x, y):
+            return False
+        return all(math.hypot(x - p[0], y - p[1]) > tolerance for p in (Geometry.nearest_on_segment(x, y, *a, *b) for a, b in edges))
+
+    def cross(a: tuple, b: tuple, p: tuple) -> float:
+        '''Compute the signed distance of a planar point to the line through a segment, positive on its left.'''
+        length = math.hypot(b[0] - a[0], b[1] - a[1])
+        return ((b[0] - a[0])*(p[1] - a[1]) - (b[1] - a[1])*(p[0] - a[0]))/length
+
+    def crosses(p: tuple, q: tuple, r: tuple, s: tuple, tolerance: float) -> bool:
+        '''Check if two planar segments properly cross, i.e. each one has its ends on both sides of the other farther than a tolerance.'''
+        def apart(d1: float, d2: float) -> bool:
+            return (d1 > tolerance and d2 < -tolerance) or (d1 < -tolerance and d2 > tolerance)
+        return apart(Geometry.cross(r, s, p), Geometry.cross(r, s, q)) and apart(Geometry.cross(p, q, r), Geometry.cross(p, q, s))
+
+    def samples(rings: list, edges: list, tolerance: float) -> list:
+        '''List the planar points tested for overlap: vertices, edge midpoints and points just inside the outer ring off each edge midpoint.'''
+        points = [a for a, _ in edges] + [((a[0] + b[0])/2, (a[1] + b[1])/2) for a, b in edges]
+        outer = Geometry.edges(rings[:1])
+        area = sum(a[0]*b[1] - b[0]*a[1] for a, b in outer)/2
+        side = 1 if area > 0 else -1  # interior on the left of the edges if counterclockwise
+        for a, b in outer:
+            length = math.hypot(b[0] - a[0], b[1] - a[1])
+            nx, ny = -(b[1] - a[1])/length*side, (b[0] - a[0])/length*side
+            points.append(((a[0] + b[0])/2 + 2*tolerance*nx, (a[1] + b[1])/2 + 2*tolerance*ny))
+        return points
+
+    def overlaps(a: dict, b: dict, tolerance_m: float = 0.01) -> bool:
+        '''
+        Check if the interiors of two polygon geometries overlap, parcels only sharing edges or vertices do not overlap.
+        Both are projected in meters around their common center, then their edges are checked for crossings and their sample points for lying inside the other.
+
+            :param a [dict]: Polygon or MultiPolygon geometry.
+            :param b [dict]: Polygon or MultiPolygon geometry.
+            :param tolerance_m [float]: Distance in meters under which points are considered on a boundary, e.g. to absorb rounding of shared edges.
+
+            :returns [bool]: True if the geometries overlap.
+        '''
+        if a['type'] == 'Point' or b['type'] == 'Point':
+            return False
+        box_a, box_b = Geometry.bbox(a), Geometry.bbox(b)
+        if not Geometry.bbox_intersects(box_a, box_b):
+            return False
+
+        lat0 = (min(box_a[1], box_b[1]) + max(box_a[3], box_b[3]))/2
+        lng0 = (min(box_a[0], box_b[0]) + max(box_a[2], box_b[2]))/2
+        # planar coordinates are in kilometers, 1 µm absorbs the projection rounding, e.g. so that identical parcels overlap without tolerance
+        tolerance = max(tolerance_m, 1e-6)/1000
+
+        return any(
+            Geometry.polygons_overlap(a=polygon_a, b=polygon_b, tolerance=tolerance)
+            for polygon_a in Geometry.planar_polygons(a, lat=lat0, lng=lng0)
+            for polygon_b in Geometry.planar_polygons(b, lat=lat0, lng=lng0)
+        )
+
+    def planar_polygons(geometry: dict, lat: float, lng: float) -> list:
+        '''Project the polygons of a geometry around a point, as (rings, edges) in kilometers.'''
+        polygons = []
+        for polygon in Geometry.polygons(geometry):
+            rings = [Geometry.project(ring, lat=lat, lng=lng) for ring in polygon]
+            edges = Geometry.edges(rings)
+            if edges:
+                polygons.append((rings, edges))
+        return polygons
+
+    def polygons_overlap(a: tuple, b: tuple, tolerance: float) -> bool:
+        '''Check if two planar polygons (rings, edges) overlap, i.e. edges cross or a sample point of one lies inside the other.'''
+        (rings_a, edges_a), (rings_b, edges_b) = a, b
+        if any(Geometry.crosses(p, q, r, s, tolerance) for p, q in edges_a for r, s in edges_b):
+            return True
+        if any(Geometry.strictly_inside(rings_b, edges_b, x, y, tolerance) for x, y in Geometry.samples(rings_a, edges_a, tolerance)):
+            return True
+        return any(Geometry.strictly_inside(rings_a, edges_a, x, y, tolerance) for x, y in Geometry.samples(rings_b, edges_b, tolerance))
+
+
+class SpatialIndex:
+    '''
+    Spatial index class, i.e. a uniform grid of cells each listing the keys of the geometries whose bounding box overlaps it.
+    Geometries covering more than max_cells cells are kept aside in a list every query scans, so a huge polygon cannot flood the grid.
+    '''
+
+    def __init__(self, cell_degrees: float, max_cells: int = 1024):
+        self.cell_degrees = cell_degrees
+        self.max_cells = max_cells
+        self.lock = threading.RLock()
+        self.cells = {}  # (column, row): set of keys
+        self.items = {}  # key: (bbox, geometry, value)
+        self.oversized = set()  # keys of the geometries covering more than max_cells cells
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def cell_range(self, bbox: tuple) -> tuple:
+        '''Find the range of cells covering a bounding box, i.e. (first column, first row, last column, last row).'''
+        size = self.cell_degrees
+        return (math.floor(bbox[0]/size), math.floor(bbox[1]/size), math.floor(bbox[2]/size), math.floor(bbox[3]/size))
+
+    def cell_count(self, bbox: tuple) -> int:
+        '''Count the cells covering a bounding box.'''
+        c1, r1, c2, r2 = self.cell_range(bbox)
+        return (c2 - c1 + 1)*(r2 - r1 + 1)
+
+    def covering_cells(self, bbox: tuple) -> itertools.product:
+        '''List the cells covering a bounding box as (column, row).'''
+        c1, r1, c2, r2 = self.cell_range(bbox)
+        return itertools.product(range(c1, c2 + 1), range(r1, r2 + 1))
+
+    def upsert(self, key: Hashable, geometry: dict, value: Any = None) -> None:
+        '''Index a geometry under a key, replacing the previous one, raises ValueError if the geometry is not valid.'''
+        bbox = Geometry.bbox(geometry)
+        with self.lock:
+            item = self.items.get(key)
+            if item is not None and item[0] == bbox:
+                self.items[key] = (bbox, geometry, value)  # same cells, only the entry changes
+                return
+            self.remove(key)
+            if self.cell_count(bbox) > self.max_cells:
+                self.oversized.add(key)
+            else:
+                for cell in self.covering_cells(bbox):
+                    self.cells.setdefault(cell, set()).add(key)
+            self.items[key] = (bbox, geometry, value)
+
+    def remove(self, key: Hashable) -> None:
+        '''Remove a geometry from the index, if indexed.'''
+        with self.lock:
+            item = self.items.pop(key, None)
+            if item is None:
+                return
+            if key in self.oversized:
+                self.oversized.discard(key)
+                return
+            for cell in self.covering_cells(item[0]):
+                keys = self.cells.get(cell, set())
+                keys.discard(key)
+                if not keys:
+                    self.cells.pop(cell, None)
+
+    def clear(self) -> None:
+        '''Remove every geometry from the index.'''
+        with self.lock:
+            self.cells.clear()
+            self.items.clear()
+            self.oversized.clear()
+
+    def candidates(self, bbox: tuple) -> set:
+        '''Find the keys of the geometries whose bounding box intersects a bounding box, the oversized ones are all tested.'''
+        c1, r1, c2, r2 = self.cell_range(bbox)
+        with self.lock:
+            if self.cell_count(bbox) > len(self.cells):
+                # a large box covers more cells than there are occupied ones
+                cells = [keys for (c, r), keys in self.cells.items() if c1 <= c <= c2 and r1 <= r <= r2]
+            else:
+                cells = [self.cells[cell] for cell in self.covering_cells(bbox) if cell in self.cells]
+            return {k for k in set(self.oversized).union(*cells) if Geometry.bbox_intersects(self.items[k][0], bbox)}
+
+    def within_bbox(self, bbox: tuple, limit: int | None = None) -> list:
+        '''
+        Find the geometries intersecting a bounding box, in key order.
+
+            :param bbox [tuple]: (min lng, min lat, max lng, max lat).
+            :param limit [int]: Maximum number of geometries, None for all of them.
+
+            :returns [list]: (key, value) of the geometries.
+        '''
+        with self.lock:
+            keys = sorted(self.candidates(bbox), key=str) if limit is None else heapq.nsmallest(limit, self.candidates(bbox), key=str)
+            return [(k, self.items[k][2]) for k in keys]
+
+    def within_radius(self, lat: float, lng: float, radius_km: float, limit: int | None = None) -> list:
+        '''
+        Find the geometries within a distance of a point, nearest first.
+
+            :param lat [float]: Point latitude.
+            :param lng [float]: Point longitude.
+            :param radius_km [float]: Distance in kilometers.
+            :param limit [int]: Maximum number of geometries, None for all of them.
+
+            :returns [list]: (key, value, distance in kilometers) of the geometries.
+        '''
+        with self.lock:
+            found = []
+            for k in self.candidates(Geometry.radius_bbox(lat=lat, lng=lng, radius_km=radius_km)):
+                _, geometry, value = self.items[k]
+                distance = Geometry.distance(geometry, lat=lat, lng=lng)
+                if distance <= radius_km:
+                    found.append((k, value, distance))
+            return sorted(found, key=lambda x: (x[2], str(x[0])))[:limit] if limit is None else heapq.nsmallest(limit, found, key=lambda x: (x[2], str(x[0])))
+
+    def nearest(self, lat: float, lng: float, k: int) -> list:
+        '''
+        Find the k geometries nearest to a point, nearest first.
+        Rings of cells are scanned outwards until k geometries are found, then a radius query at the k-th distance catches nearer ones from farther cells.
+
+            :param lat [float]: Point latitude.
+            :param lng [float]: Point longitude.
+            :param k [int]: Number of geometries.
+
+            :returns [list]: (key, value, distance in kilometers) of the geometries.
+        '''
+        with self.lock:
+            if not self.items:
+                return []
+
+            c0, r0, _, _ = self.cell_range((lng, lat, lng, lat))
+            keys, ring = set(self.oversized), 0
+            while len(keys) < k:
+                if (2*ring + 1)**2 > len(self.cells):
+                    # the rings cover more cells than there are occupied ones, geometries are refined by distance to their bounding box instead
+                    return self.nearest_by_bbox(lat=lat, lng=lng, k=k)
+                for c in range(c0 - ring, c0 + ring + 1):
+                    step = 1 if c in (c0 - ring, c0 + ring) else 2*ring or 1
+                    for r in range(r0 - ring, r0 + ring + 1, step):
+                        keys |= self.cells.get((c, r), set())
+                ring += 1
+
+            distances = sorted(Geometry.distance(self.items[key][1], lat=lat, lng=lng) for key in keys)
+            return self.within_radius(lat=lat, lng=lng, radius_km=distances[min(k, len(distances)) - 1], limit=k)
+
+    def nearest_by_bbox(self, lat: float, lng: float, k: int) -> list:
+        '''Find the k geometries nearest to a point, exact distances are only computed until the next bounding box is farther than the k-th geometry.'''
+        with self.lock:
+            bounds = []
+            for key, (bbox, _, _) in self.items.items():
+                distance = Geometry.haversine(lat, lng, min(max(lat, bbox[1]), bbox[3]), min(max(lng, bbox[0]), bbox[2]))
+                bounds.append((distance, str(key), key))
+            heapq.heapify(bounds)
+
+            found = []
+            while bounds and (len(found) < k or bounds[0][0] <= found[k - 1][2]):
+                _, _, key = heapq.heappop(bounds)
+                _, geometry, value = self.items[key]
+                found.append((key, value, Geometry.distance(geometry, lat=lat, lng=lng)))
+                found.sort(key=lambda x: (x[2], str(x[0])))
+            return found[:k]
@@ -4,13 +4,15 @@ from fastapi import FastAPI
 from fastapi.exceptions import RequestValidationError
 from fastapi_pagination import add_pagination
 
-from config import get_settings
+from config import get_settings, watch_settings
 from apis.middleware import api_routers
 from database.startup import start_database
 from helpers.api_routers import APIRouters
 from helpers.api_cors import CrossOrigin
 from helpers.api_throttling import Throttling
 from helpers.api_exceptions import ResponseValidationError, request_exception_handler, response_exception_handler
+from models.blockchain import BlockchainRequest, OutboxDispatcher
+from models.farm_ingestion import IngestionScheduler
 
 
 def start_application():
@@ -26,8 +28,15 @@ def start_application():
     app.add_exception_handler(RequestValidationError, request_exception_handler)
     app.add_exception_handler(ResponseValidationError, response_exception_handler)
 
+    app.add_event_handler('startup', OutboxDispatcher.start)
+    app.add_event_handler('startup', lambda: IngestionScheduler.start(settings=get_settings()))
+    app.add_event_handler('shutdown', IngestionScheduler.stop)
+    app.add_event_handler('shutdown', lambda: OutboxDispatcher.stop(timeout=float(settings.NFT.DELIVERY.TIMEOUT)))
+    app.add_event_handler('shutdown', lambda: BlockchainRequest.pool.stop(timeout=float(settings.NFT.DELIVERY.TIMEOUT)))
+
     add_pagination(app)
     start_database()
+    watch_settings(seconds=float(settings.APP.SETTINGS_RELOAD_SECONDS))
 
     return app
 
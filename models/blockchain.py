@@ -1,22 +1,285 @@
-'''This module communicates with blockchains through APIs.'''
+'''This module communicates with blockchains through APIs.
+Requests are written to the outbox along with their data, then delivered by a fixed pool of worker threads, sharing a keep-alive HTTP session.'''
 
+import logging
+import queue
+import random
 import threading
+import time
+from typing import Callable
 import requests
+from requests.adapters import HTTPAdapter
 
+from config import get_settings
+from database.outbox import Outbox
+from database.session import SessionLocal
 from helpers.misc import AppSettings
 
 
+RETRY_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+LOGGER = logging.getLogger(__name__)
+
+
+class DeliveryStatistics:
+    '''Delivery statistics class.'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = dict(enqueued=0, rejected=0, delivered=0, failed=0, retries=0, in_flight=0)
+        self.latency_seconds_total = 0.0
+        self.latency_seconds_max = 0.0
+
+    def record(self, name: str, value: int = 1) -> None:
+        '''Increment a counter.'''
+        with self.lock:
+            self.counters[name] += value
+
+    def record_latency(self, seconds: float) -> None:
+        '''Record the time a request took from enqueued to delivered or failed.'''
+        with self.lock:
+            self.latency_seconds_total += seconds
+            self.latency_seconds_max = max(self.latency_seconds_max, seconds)
+
+    def report(self, pending: int, workers: int) -> dict:
+        '''Report the delivery statistics along with the queue live status.'''
+        with self.lock:
+            done = self.counters['delivered'] + self.counters['failed']
+            return dict(
+                workers=workers,
+                pending=pending,
+                **self.counters,
+                latency_seconds_avg=self.latency_seconds_total/done if done else 0.0,
+                latency_seconds_max=self.latency_seconds_max
+            )
+
+
+class RetryPolicy:
+    '''Retry policy class, i.e. retries with exponential backoff and full jitter, and the timeout of each attempt.'''
+
+    def __init__(self, retries: int, backoff_seconds: float, backoff_max_seconds: float, timeout: float):
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.timeout = timeout
+
+    def backoff(self, attempt: int) -> float:
+        '''Compute the delay before a retry, i.e. exponential backoff with full jitter.'''
+        return random.uniform(0, min(self.backoff_max_seconds, self.backoff_seconds * 2**attempt))
+
+
+class DeliveryPool:
+    '''Delivery pool class, i.e. worker threads posting queued requests with retries, exponential backoff and jitter.'''
+
+    def __init__(self, workers: int, queue_size: int, retries: int, backoff_seconds: float, backoff_max_seconds: float, timeout: float):
+        self.workers = workers
+        self.policy = RetryPolicy(retries=retries, backoff_seconds=backoff_seconds, backoff_max_seconds=backoff_max_seconds, timeout=timeout)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.statistics = DeliveryStatistics()
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=workers))
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=workers))
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def start(self) -> None:
+        '''Start the worker threads, once.'''
+        with self.lock:
+            if self.threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self.work, name=f'delivery-{i}', daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def stop(self, timeout: float | None = None) -> None:
+        '''Stop the worker threads once the queued requests are delivered.'''
+        with self.lock:
+            threads, self.threads = self.threads, []
+        for _ in threads:
+            self.queue.put(None)
+        for thread in threads:
+            thread.join(timeout=timeout)
+
+    def submit(self, url: str, data: dict, callback: Callable[[bool, str | None], None] | None = None, block_seconds: float = 0) -> bool:
+        '''
+        Queue a request, waiting for room up to a given time if the queue is full (backpressure).
+
+            :param url [str]: Request URL.
+            :param data [dict]: Request form data.
+            :param callback [callable]: Function called with the outcome (delivered, error) once the request is done.
+            :param block_seconds [float]: Seconds to wait for room in the queue.
+
+            :returns [bool]: True if the request is queued, False if the queue is still full.
+        '''
+        self.start()
+        try:
+            self.queue.put((url, data, callback, time.monotonic()), block=block_seconds > 0, timeout=block_seconds or None)
+        except queue.Full:
+            self.statistics.record('rejected')
+            return False
+        self.statistics.record('enqueued')
+        return True
+
+    def post(self, url: str, data: dict) -> tuple:
+        '''Post a request, retrying connection errors, timeouts and transient HTTP statuses, returns (delivered, error).'''
+        error = None
+        for attempt in range(self.policy.retries + 1):
+            if attempt:
+                self.statistics.record('retries')
+                time.sleep(self.policy.backoff(attempt - 1))
+            try:
+                response = self.session.post(url, data=data, timeout=self.policy.timeout)
+                if response.status_code < 400:
+                    return True, None
+                error = f'HTTP {response.status_code}'
+                if response.status_code not in RETRY_STATUS_CODES:
+                    break
+            except requests.RequestException as e:
+                error = f'{type(e).__name__}: {e}'
+        return False, error
+
+    def work(self) -> None:
+        '''Deliver queued requests until a stop marker is received.'''
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            self.deliver(*item)
+
+    def deliver(self, url: str, data: dict, callback: Callable[[bool, str | None], None] | None, enqueued_at: float) -> None:
+        '''Deliver a queued request, record its outcome and pass it to its callback.'''
+        self.statistics.record('in_flight')
+        try:
+            delivered, error = self.post(url=url, data=data)
+            self.statistics.record('delivered' if delivered else 'failed')
+            if not delivered:
+                LOGGER.warning('Unable to deliver request to %s: %s', url, error)
+            if callback is not None:
+                callback(delivered, error)
+        except Exception as e:  # pylint: disable=[W0703]
+            LOGGER.error('Unable to complete request delivery: %s', e)
+        finally:
+            self.statistics.record('in_flight', -1)
+            self.statistics.record_latency(time.monotonic() - enqueued_at)
+            self.queue.task_done()
+
+    def report(self) -> dict:
+        '''Report the delivery statistics.'''
+        return self.statistics.report(pending=self.queue.qsize(), workers=len(self.threads))
+
+
+def delivery_pool(settings: AppSettings) -> DeliveryPool:
+    '''Create a delivery pool from the settings.'''
+    delivery = settings.NFT.DELIVERY
+    return DeliveryPool(
+        workers=int(delivery.WORKERS),
+        queue_size=int(delivery.QUEUE_SIZE),
+        retries=int(delivery.RETRIES),
+        backoff_seconds=float(delivery.BACKOFF_SECONDS),
+        backoff_max_seconds=float(delivery.BACKOFF_MAX_SECONDS),
+        timeout=float(delivery.TIMEOUT)
+    )
+
+
 class BlockchainRequest:
     '''Blockchain request class.'''
 
-    def request_update(req_type: str, data: dict,  settings: AppSettings) -> None:
-        '''Make a request seperately and wait for the response without affecting the rest of the task.'''
-        if req_type == 'NFT':
-            threading.Thread(target=BlockchainRequest.update_nft, args=(data, settings)).start()
+    pool = delivery_pool(settings=get_settings())
+
+    def url(topic: str, settings: AppSettings) -> str | None:
+        '''Find the blockchain API URL of an outbox topic.'''
+        if topic == 'NFT':
+            return settings.NFT.URL.UPDATE
+        return None
+
+    def deliver(rows: list, settings: AppSettings) -> tuple:
+        '''
+        Deliver a batch of outbox messages through the delivery pool and wait for their outcome.
+
+            :param rows [list]: Outbox messages as (id, topic, key, payload, attempts) rows.
+            :param settings: Application settings.
+
+            :returns [tuple]: Ids of the delivered messages, and (id, attempts, error) of the failed ones; messages still in flight are in neither.
+        '''
+        results = {}
+        done = threading.Event()
 
-    def update_nft(data: dict, settings: AppSettings) -> None:
-        '''Request an NFT update onto Solana blockchain.'''
+        def settle(row_id: int, delivered: bool, error: str | None) -> None:
+            '''Record a message outcome, the last one wakes the dispatcher up.'''
+            results[row_id] = (delivered, error)
+            if len(results) == len(rows):
+                done.set()
+
+        for row in rows:
+            url = BlockchainRequest.url(topic=row.topic, settings=settings)
+            if url is None:
+                settle(row.id, False, f'Unknown topic: {row.topic}')
+            elif not BlockchainRequest.pool.submit(
+                url=url,
+                data=row.payload,
+                callback=lambda delivered, error, row_id=row.id: settle(row_id, delivered, error),
+                block_seconds=float(settings.NFT.DELIVERY.ENQUEUE_SECONDS)
+            ):
+                settle(row.id, False, 'Delivery queue is full')
+
+        done.wait(timeout=float(settings.NFT.OUTBOX.LEASE_SECONDS))
+        attempts = {row.id: row.attempts for row in rows}
+        delivered = [k for k, (ok, _) in list(results.items()) if ok]
+        failed = [(k, attempts[k], error) for k, (ok, error) in list(results.items()) if not ok]
+        return delivered, failed
+
+
+class OutboxDispatcher:
+    '''Outbox dispatcher class, i.e. a thread draining due outbox messages in batches, in every worker process.'''
+
+    thread = None
+    stopped = threading.Event()
+
+    def start() -> None:
+        '''Start the dispatcher, messages left by a previous run are due again once their lease expires.'''
+        if OutboxDispatcher.thread is not None:
+            return
+        OutboxDispatcher.stopped.clear()
+        OutboxDispatcher.thread = threading.Thread(target=OutboxDispatcher.run, name='outbox-dispatcher', daemon=True)
+        OutboxDispatcher.thread.start()
+
+    def stop(timeout: float | None = None) -> None:
+        '''Stop the dispatcher after its current batch.'''
+        thread, OutboxDispatcher.thread = OutboxDispatcher.thread, None
+        OutboxDispatcher.stopped.set()
+        if thread is not None:
+            thread.join(timeout=timeout)
+
+    def run() -> None:
+        '''Dispatch batches until stopped, it only waits between batches when the outbox is drained.'''
+        while not OutboxDispatcher.stopped.is_set():
+            settings = get_settings()
+            try:
+                claimed = OutboxDispatcher.dispatch(settings=settings)
+            except Exception as e:  # pylint: disable=[W0703]
+                LOGGER.error('Unable to dispatch outbox: %s', e)
+                claimed = 0
+            if claimed < int(settings.NFT.OUTBOX.BATCH_SIZE):
+                OutboxDispatcher.stopped.wait(float(settings.NFT.OUTBOX.POLL_SECONDS))
+
+    def dispatch(settings: AppSettings) -> int:
+        '''Claim a batch of due messages, deliver them and settle their outcome, returns the number of claimed messages.'''
+        outbox = settings.NFT.OUTBOX
+        db = SessionLocal()
         try:
-            requests.post(settings.NFT.URL.UPDATE, data=data, timeout=60)
-        except Exception as e:  # pylint: disable=[W0703]
-            print(e)
+            rows = Outbox.claim(db=db, batch_size=int(outbox.BATCH_SIZE), lease_seconds=float(outbox.LEASE_SECONDS))
+            if not rows:
+                return 0
+            delivered, failed = BlockchainRequest.deliver(rows=rows, settings=settings)
+            Outbox.settle(
+                db=db,
+                delivered=delivered,
+                failed=failed,
+                max_attempts=int(outbox.MAX_ATTEMPTS),
+                backoff_seconds=float(outbox.BACKOFF_SECONDS),
+                backoff_max_seconds=float(outbox.BACKOFF_MAX_SECONDS)
+            )
+            return len(rows)
+        finally:
+            db.close()
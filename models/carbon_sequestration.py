@@ -1,5 +1,10 @@
 '''This module calculates carbon sequestration based on the following:
-./docs/pdf/carbon_sequestration.pdf'''
+./docs/pdf/carbon_sequestration.pdf
+
+Every formula accepts either scalars or arrays (NumPy arrays, pandas Series) of the same length, in which case it returns arrays.'''
+
+import numpy
+from numpy.typing import ArrayLike
 
 from helpers.misc import AppSettings, DataAggregator
 from models.plantation_metrics import PlantationMetrics
@@ -17,23 +22,49 @@ class TreeCarbonSequestration:
 
             :returns [float]: Tree CO2 sequestered in pounds.
         '''
-        height = PlantationMetrics.tree_height(tree=tree, settings=settings)
-        diameter = PlantationMetrics.tree_diameter(tree=tree, settings=settings)
+        return TreeCarbonSequestration.trees_carbon_sequestration(
+            height=PlantationMetrics.tree_height(tree=tree, settings=settings),
+            diameter=PlantationMetrics.tree_diameter(tree=tree, settings=settings),
+            root=DataAggregator.list_mean(tree['rootDryMass']['measure']),
+            dry_matter=DataAggregator.list_mean(tree['dryBiomass']['measure']),
+            carbon_content=DataAggregator.list_mean(tree['carbonConcentration']['measure']),
+            settings=settings
+        )
+
+    def trees_carbon_sequestration(
+        height: ArrayLike,
+        diameter: ArrayLike,
+        root: ArrayLike,
+        dry_matter: ArrayLike,
+        carbon_content: ArrayLike,
+        settings: AppSettings
+    ) -> ArrayLike:
+        '''
+        Determines the weight of carbon dioxide sequestered by one or many trees.
 
+            :param height: Trunk height in feet.
+            :param diameter: Trunk diameter in inches.
+            :param root: Average root weight in percentage.
+            :param dry_matter: Average dry matter in percentage.
+            :param carbon_content: Average carbon content in percentage.
+            :param settings: Application settings.
+
+            :returns [float | array]: Trees CO2 sequestered in pounds.
+        '''
         green_weight = TreeCarbonSequestration.green_weight(
             height=height,
             diameter=diameter,
-            root=DataAggregator.list_mean(tree['rootDryMass']['measure'])
+            root=root
         )
 
         dry_weight = TreeCarbonSequestration.dry_weight(
             green_weight=green_weight,
-            dry_matter=DataAggregator.list_mean(tree['dryBiomass']['measure'])
+            dry_matter=dry_matter
         )
 
         carbon_weight = TreeCarbonSequestration.carbon_weight(
             dry_weight=dry_weight,
-            carbon_content=DataAggregator.list_mean(tree['carbonConcentration']['measure'])
+            carbon_content=carbon_content
         )
 
         carbon_dioxide_seq = TreeCarbonSequestration.carbon_dioxide_sequestered(
@@ -43,7 +74,7 @@ class TreeCarbonSequestration:
 
         return carbon_dioxide_seq
 
-    def green_weight(height: float, diameter: float, root: float) -> float:
+    def green_weight(height: ArrayLike, diameter: ArrayLike, root: ArrayLike) -> ArrayLike:
         '''
         Determines the weight of a tree when it is alive.
 
@@ -51,44 +82,41 @@ class TreeCarbonSequestration:
             :param diameter: Trunk diameter in inches.
             :param root: Average root weight in percentage.
 
-            :returns [float]: Tree green weight in pounds.
+            :returns [float | array]: Tree green weight in pounds.
         '''
-        if diameter < 11:
-            coeff = 0.25
-        else:
-            coeff = 0.15
+        coeff = numpy.where(numpy.asarray(diameter) < 11, 0.25, 0.15)
         return (coeff*height*diameter**2)*(1+root)
 
-    def dry_weight(green_weight: float, dry_matter: float) -> float:
+    def dry_weight(green_weight: ArrayLike, dry_matter: ArrayLike) -> ArrayLike:
         '''
         Determines the dry weight of a tree.
 
             :param green_weight: Tree green weight in pounds.
             :param dry_matter: Average dry matter in percentage.
 
-            :returns [float]: Tree dry weight in pounds.
+            :returns [float | array]: Tree dry weight in pounds.
         '''
         return green_weight*dry_matter
 
-    def carbon_weight(dry_weight: float, carbon_content: float) -> float:
+    def carbon_weight(dry_weight: ArrayLike, carbon_content: ArrayLike) -> ArrayLike:
         '''
         Determines the carbon weight of a tree.
 
             :param dry_weight: Tree dry weight in pounds.
             :param carbon_content: Average carbon content in percentage.
 
-            :returns [float]: Tree carbon weight in pounds.
+            :returns [float | array]: Tree carbon weight in pounds.
         '''
         return dry_weight*carbon_content
 
-    def carbon_dioxide_sequestered(carbon_weight: float, settings: AppSettings) -> float:
+    def carbon_dioxide_sequestered(carbon_weight: ArrayLike, settings: AppSettings) -> ArrayLike:
         '''
         Determines the weight of carbon dioxide sequestered by a tree.
 
             :param carbon_weight: Tree carbon weight in pounds.
             :param settings: Application settings.
 
-            :returns [float]: Tree CO2 sequestered in pounds.
+            :returns [float | array]: Tree CO2 sequestered in pounds.
         '''
         carbon = settings.ATOMIC_WEIGHT.carbon
         carbon_dioxide = settings.ATOMIC_WEIGHT.carbonDioxide
@@ -99,7 +127,7 @@ class TreeCarbonSequestration:
 class PlantationCarbonSequestration:
     '''Plantation carbon Sequestration class.'''
 
-    def plantation_carbon_sequestration(co2: float, spha: float, age: float, settings: AppSettings) -> float:
+    def plantation_carbon_sequestration(co2: ArrayLike, spha: ArrayLike, age: ArrayLike, settings: AppSettings) -> ArrayLike:
         '''
         Determines the weight of carbon sequestered per hectare per year of a plantation.
 
@@ -108,7 +136,7 @@ class PlantationCarbonSequestration:
             :param age: Plantation age in years.
             :param settings: Application settings.
 
-            :returns [float]: Plantation CO2 sequestered in tons per hectare per year.
+            :returns [float | array]: Plantation CO2 sequestered in tons per hectare per year.
         '''
         co2_seq = PlantationCarbonSequestration.carbon_dioxide_sequestered(
             co2=co2,
@@ -117,7 +145,7 @@ class PlantationCarbonSequestration:
         )
         return co2_seq/age
 
-    def carbon_dioxide_sequestered(co2: float, spha: float, settings: AppSettings) -> float:
+    def carbon_dioxide_sequestered(co2: ArrayLike, spha: ArrayLike, settings: AppSettings) -> ArrayLike:
         '''
         Determines the weight of carbon dioxide sequestered by a plantation.
         Assume the trees were planted at the same time and grew equally, i.e. the plantation trees have the same age and size.
@@ -126,7 +154,7 @@ class PlantationCarbonSequestration:
             :param spha: The number of stems per hectare.
             :param settings: Application settings.
 
-            :returns [float]: Plantation CO2 sequestered in tons per hectare.
+            :returns [float | array]: Plantation CO2 sequestered in tons per hectare.
         '''
         ton = settings.UNIT_CONVERSION.weight.tonLb
         return co2*spha/ton
@@ -135,7 +163,7 @@ class PlantationCarbonSequestration:
 class NftCarbonSequestration:
     '''NFT carbon Sequestration class.'''
 
-    def nft_carbon_sequestration(nft_area: float, farm_spha: float, trees_co2: float, period: float, settings: AppSettings) -> float:
+    def nft_carbon_sequestration(nft_area: ArrayLike, farm_spha: ArrayLike, trees_co2: ArrayLike, period: ArrayLike, settings: AppSettings) -> ArrayLike:
         '''
         Determines the weight of carbon sequestered of a given area during a certain period of time (seconds).
 
@@ -145,7 +173,7 @@ class NftCarbonSequestration:
             :param period: Timespan in seconds
             :param settings: Application settings.
 
-            :returns [float]: NFT CO2 sequestered in tons.
+            :returns [float | array]: NFT CO2 sequestered in tons.
         '''
 
         ton = settings.UNIT_CONVERSION.weight.tonLb
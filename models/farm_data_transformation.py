@@ -1,166 +1,357 @@
 '''This module manages the farm data transformation on ETL process e.g. clean, apply business rules, check for data integrity, and create aggregates.'''
 
-import math
+import asyncio
+import bisect
+import hashlib
+import time
+from typing import Callable
+import numpy
+from fastapi import status
+from fastapi.concurrency import run_in_threadpool
 from pandas import DataFrame
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, case, distinct, func, literal_column, null
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import async_crud, models
+from helpers.api_exceptions import ResponseValidationError
+from helpers.misc import AppSettings, DataFormatter, KeysetCursor
+from models.carbon_sequestration import PlantationCarbonSequestration
+
+
+SORT_FIELDS = ('farmId', 'groupScheme', 'country', 'province', 'effectiveArea', 'farmSize', 'hectareUsd', 'farmCo2y', 'treesPlanted', 'plantAge')
+
+
+class FarmSnapshot:
+    '''Farm data snapshot class, i.e. the materialized farm list, its farmId index and the data version it was built from.'''
+
+    lock = asyncio.Lock()
+    current = (None, [], {})
+    checked = 0.0  # monotonic time the data version was last checked
+    encoded = (None, b'', None)  # (version, response body, ETag) of the farm list
+    orders = (None, {})  # (version, {sort field: (sort keys, farms)}) in ascending order
+
+    async def fetch(db: AsyncSession, settings: AppSettings) -> tuple:
+        '''
+        Fetch the current farm snapshot (version, farm list, farmId index), rebuild it if the settings or data version has changed.
+        The data version is checked at most every FARM.VERSION_CHECK_SECONDS, in between the snapshot is served without querying the database.
+        '''
+
+        snapshot = FarmSnapshot.current
+        if (
+            snapshot[0] is not None and snapshot[0][0] == settings.VERSION
+            and time.monotonic() - FarmSnapshot.checked < float(settings.FARM.VERSION_CHECK_SECONDS)
+        ):
+            return snapshot
+
+        version = (settings.VERSION, await FarmSnapshot.data_version(db=db))
+        if snapshot[0] == version:
+            FarmSnapshot.checked = time.monotonic()
+            return snapshot
+
+        async with FarmSnapshot.lock:
+            snapshot = FarmSnapshot.current
+            if snapshot[0] != version:
+                farm, ha = await FarmData.extract_farms(db=db, settings=settings)
+                data = await run_in_threadpool(FarmData.transform_farms, farm=farm, ha=ha, settings=settings)
+                snapshot = (version, data, {d['farmId']: d for d in data})
+                FarmSnapshot.current = snapshot
+            FarmSnapshot.checked = time.monotonic()
+
+        return snapshot
+
+    def invalidate() -> None:
+        '''Drop the farm snapshot, e.g. after a farm upload, so the next request rebuilds it.'''
+        FarmSnapshot.current = (None, [], {})
+        FarmSnapshot.encoded = (None, b'', None)
+        FarmSnapshot.orders = (None, {})
+
+    async def data_version(db: AsyncSession) -> tuple:
+        '''Fetch the farm data version, i.e. the latest update date and the number of rows of the farms and pricing tables.'''
+        return (
+            await async_crud.get_table_version(db=db, table=models.FarmsTable, column=models.FarmsTable.UpdatedAt),
+            await async_crud.get_table_version(db=db, table=models.PricingTable, column=models.PricingTable.updatedAt)
+        )
 
-from database import crud, models
-from helpers.misc import AppSettings, DataFormatter, ResponseFormatter
-from models.carbon_sequestration import TreeCarbonSequestration, PlantationCarbonSequestration
+    async def encoded_farms(db: AsyncSession, settings: AppSettings, encode: Callable[[list], bytes]) -> tuple:
+        '''
+        Retrive all farms as an encoded response body, it is only encoded again when the snapshot changes.
+
+            :param db [generator]: Database asyncio session.
+            :param settings: Application settings.
+            :param encode [callable]: Function encoding the farm list into a response body.
+
+            :returns [tuple]: Response body and its strong ETag.
+        '''
+        version, data, _ = await FarmSnapshot.fetch(db=db, settings=settings)
+
+        encoded = FarmSnapshot.encoded
+        if encoded[0] != version:
+            body = await run_in_threadpool(encode, data)
+            encoded = (version, body, f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+            FarmSnapshot.encoded = encoded
+
+        return encoded[1], encoded[2]
+
+
+class FarmQuery:
+    '''Farm query class, i.e. filtered, sorted and paginated pages of the farm snapshot.'''
+
+    async def page(db: AsyncSession, settings: AppSettings, filters: dict, sort: str, limit: int | None, cursor: str | None) -> tuple:
+        '''
+        Retrive a page of the farms matching filters from the snapshot, in sort order, after a keyset cursor.
+
+            :param db [generator]: Database asyncio session.
+            :param settings: Application settings.
+            :param filters [dict]: Filters, see FarmQuery.farm_matches; None values are ignored.
+            :param sort [str]: Sort field, prefixed with - for descending order; missing values come last in ascending order and first in descending order.
+            :param limit [int]: Maximum number of farms, None for all of them.
+            :param cursor [str]: Cursor returned with the previous page, None for the first page.
+
+            :returns [tuple]: Farms of the page, number of farms matching the filters and cursor of the next page, None if it is the last one.
+        '''
+        snapshot = await FarmSnapshot.fetch(db=db, settings=settings)
+        keys, farms = FarmQuery.sorted_farms(version=snapshot[0], data=snapshot[1], field=sort.lstrip('-'))
+        filters = {k: v for k, v in filters.items() if v is not None}
+
+        total = sum(1 for farm in farms if FarmQuery.farm_matches(farm=farm, filters=filters))
+        page, last = [], None
+        for i in FarmQuery.positions(keys=keys, sort=sort, cursor=cursor):
+            if not FarmQuery.farm_matches(farm=farms[i], filters=filters):
+                continue
+            if limit is not None and len(page) == limit:
+                return page, total, KeysetCursor.encode([sort, *last])
+            page.append(farms[i])
+            last = keys[i]
+
+        return page, total, None
+
+    def positions(keys: list, sort: str, cursor: str | None) -> range:
+        '''Find the positions of the sorted farms to scan, in sort order, from the first farm after the cursor.'''
+        descending = sort.startswith('-')
+        start, stop, step = (len(keys) - 1, -1, -1) if descending else (0, len(keys), 1)
+        if cursor is not None:
+            key = FarmQuery.cursor_key(cursor=cursor, sort=sort)
+            try:
+                start = bisect.bisect_left(keys, key) - 1 if descending else bisect.bisect_right(keys, key)
+            except TypeError as e:
+                raise ResponseValidationError(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, message={'cursor': 'invalid cursor'}) from e
+        return range(start, stop, step)
+
+    def sorted_farms(version: tuple, data: list, field: str) -> tuple:
+        '''Sort the snapshot farms in ascending order of a field, once per snapshot version, returns (sort keys, farms).'''
+        orders = FarmSnapshot.orders
+        if orders[0] != version:
+            orders = (version, {})
+            FarmSnapshot.orders = orders
+        if field not in orders[1]:
+            farms = sorted(data, key=lambda farm: FarmQuery.sort_key(farm=farm, field=field))
+            orders[1][field] = ([FarmQuery.sort_key(farm=farm, field=field) for farm in farms], farms)
+        return orders[1][field]
+
+    def sort_key(farm: dict, field: str) -> tuple:
+        '''Build the sort key of a farm, i.e. (missing value, value, farmId) so farms sharing a value keep a stable order.'''
+        value = farm.get(field)
+        if isinstance(value, numpy.generic):
+            value = value.item()
+        missing = value is None or (isinstance(value, float) and bool(numpy.isnan(value)))
+        return (missing, None if missing else value, farm['farmId'])
+
+    def cursor_key(cursor: str, sort: str) -> tuple:
+        '''Decode a cursor into a sort key, it must have been returned for the same sort order.'''
+        try:
+            values = KeysetCursor.decode(cursor)
+        except ValueError as e:
+            raise ResponseValidationError(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, message={'cursor': 'invalid cursor'}) from e
+        if len(values) != 4 or values[0] != sort or not isinstance(values[1], bool) or not isinstance(values[3], str):
+            raise ResponseValidationError(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, message={'cursor': 'invalid cursor for this sort order'})
+        return tuple(values[1:])
+
+    def farm_matches(farm: dict, filters: dict) -> bool:
+        '''Check if a farm matches filters, i.e. groupScheme, country and province (case-insensitive), minEffectiveArea and isFscCertified.'''
+        for k in ('groupScheme', 'country', 'province'):
+            if k in filters and (farm.get(k) or '').casefold() != filters[k].casefold():
+                return False
+        if 'minEffectiveArea' in filters and not (farm.get('effectiveArea') or 0) >= filters['minEffectiveArea']:
+            return False
+        if 'isFscCertified' in filters and bool(farm.get('isFscCertified')) != filters['isFscCertified']:
+            return False
+        return True
 
 
 class FarmData:
     '''Farm Data class.'''
 
-    def retrieve_farms(db: Session, settings: AppSettings) -> list:
-        '''Retrive all farms from the database.'''
-
-        # extract
-        farm = DataFormatter.class_to_dict_list(
-            lst=crud.get_table(
-                db=db,
-                table=models.FarmsTable
-            )
-        )
-
-        ha = DataFormatter.class_to_dict_list(
-            lst=crud.get_table(
-                db=db,
-                table=models.PricingTable
-            )
-        )
+    async def retrieve_farms(db: AsyncSession, settings: AppSettings) -> list:
+        '''Retrive all farms from the snapshot, it is only rebuilt when the farm or pricing data version changes.'''
+        _, data, _ = await FarmSnapshot.fetch(db=db, settings=settings)
+        return data
 
-        # transform
-        data = FarmData.add_tree_co2(data=farm, settings=settings)
-        data = FarmData.groupby_farm_id(data=data)
-        data = FarmData.add_scientific_name(data=data)
-        data = FarmData.add_farm_radius(data=data, settings=settings)
-        data = FarmData.add_farm_co2(data=data, settings=settings)
-        data = FarmData.add_trees_planted(data=data)
-        data = FarmData.add_hectare_price(data=data, ha=ha)
-        data = FarmData.response_format(data=data)
+    async def retrieve_farm(db: AsyncSession, settings: AppSettings, farm_id: str) -> dict | None:
+        '''Retrive a farm by its farmId from the snapshot index.'''
+        _, _, index = await FarmSnapshot.fetch(db=db, settings=settings)
+        return index.get(farm_id)
+
+    async def extract_farms(db: AsyncSession, settings: AppSettings) -> tuple:
+        '''Extract the farms, already grouped if the database aggregates them, and the pricing from the database.'''
+        if settings.FARM.AGGREGATION == 'database':
+            farm = await FarmData.aggregate_farms(db=db, settings=settings)
+        else:
+            farm = await FarmData.extract_table(db=db, table=models.FarmsTable)
+        ha = await FarmData.extract_table(db=db, table=models.PricingTable)
+        return farm, ha
+
+    def transform_farms(farm: DataFrame, ha: DataFrame, settings: AppSettings) -> list:
+        '''Transform the extracted farms as a single columnar pipeline, it is CPU bound hence it runs off the event loop.'''
+
+        df = farm
+        if settings.FARM.AGGREGATION != 'database':
+            df = FarmData.add_tree_co2(data=df, settings=settings)
+            df = FarmData.add_scientific_name(data=df)
+            df = FarmData.groupby_farm_id(data=df)
+
+        df = FarmData.remove_duplicate_locations(data=df)
+        df = FarmData.add_farm_radius(data=df, settings=settings)
+        df = FarmData.add_farm_co2(data=df, settings=settings)
+        df = FarmData.add_trees_planted(data=df)
+        df = FarmData.add_hectare_price(data=df, ha=ha)
+        df = FarmData.response_format(data=df)
 
         # TODO: this data must come from the source partners, remove it after it
-        for d in data:
-            if d['groupScheme'] == 'Sri Trang Thailand':
-                d['isFscCertified'] = True
-            else:
-                d['isFscCertified'] = False
-
-        return data
+        df['isFscCertified'] = df['groupScheme'] == 'Sri Trang Thailand'
 
-    def add_farm_co2(data: list, settings: AppSettings) -> list:
-        '''Add carbon sequestration per year and per day - FarmCO2y to list of objects.'''
-
-        for d in data:
-            co2 = PlantationCarbonSequestration.plantation_carbon_sequestration(
-                co2=d['PlantCO2'],
-                spha=d['SphaSurvival']*0.9,
-                age=d['PlantAge'],
-                settings=settings
-            )
-            d['FarmCO2y'] = co2
+        return df.to_dict('records')
 
+    async def extract_table(db: AsyncSession, table: models.Base) -> DataFrame:
+        '''Extract all rows of a table straight into a DataFrame.'''
+        columns = list(table.__table__.columns)
+        rows = await async_crud.get_columns(db=db, columns=columns)
+        return DataFrame.from_records(rows, columns=[c.key for c in columns])
+
+    def add_farm_co2(data: DataFrame, settings: AppSettings) -> DataFrame:
+        '''Add carbon sequestration per year - FarmCO2y column.'''
+        data['FarmCO2y'] = PlantationCarbonSequestration.plantation_carbon_sequestration(  # pylint: disable=[E1137]
+            co2=data['PlantCO2'],
+            spha=data['SphaSurvival']*0.9,
+            age=data['PlantAge'],
+            settings=settings
+        )
         return data
 
-    def add_farm_radius(data: list, settings: AppSettings) -> list:
-        '''Add farm radius to list of objects based on its area size.'''
-
+    def add_farm_radius(data: DataFrame, settings: AppSettings) -> DataFrame:
+        '''Add farm radius column based on its area size.'''
         hectare = settings.UNIT_CONVERSION.area.haM2
-        for d in data:
-            d['FarmRadius'] = math.sqrt((d['FarmSize']*hectare)/math.pi)
-
+        data['FarmRadius'] = numpy.sqrt((data['FarmSize']*hectare)/numpy.pi)  # pylint: disable=[E1137]
         return data
 
-    def add_hectare_price(data: list, ha: list) -> list:
-        '''Add farm hectare price.'''
-        ha = FarmData.map_hectare_price(data=ha)
-        for d in data:
-            d['hectareUsd'] = ha[d['GroupScheme']]
-        return data
+    def add_hectare_price(data: DataFrame, ha: DataFrame) -> DataFrame:
+        '''Add farm hectare price by Group Scheme.'''
+        price = ha[['groupScheme', 'hectareUsd']].rename(columns={'groupScheme': 'GroupScheme'})
+        return data.merge(price, on='GroupScheme', how='left')
 
-    def add_scientific_name(data: list) -> list:
-        '''Add tree scientific name (genus + species).'''
-        for d in data:
-            d['ScientificName'] = sorted(list({f'{i} {j}' for i, j in zip(d['GenusName'], d['SpeciesName'])}))
+    def add_scientific_name(data: DataFrame) -> DataFrame:
+        '''Add tree scientific name (genus + species) column.'''
+        data['ScientificName'] = data['GenusName'] + ' ' + data['SpeciesName']  # pylint: disable=[E1137]
         return data
 
-    def add_tree_co2(data: list, settings: AppSettings) -> list:
-        '''Add carbon sequestration - PlantCO2 (key) to list of objects.'''
-        tree_co2 = FarmData.calc_tree_co2(settings=settings)
+    def add_tree_co2(data: DataFrame, settings: AppSettings) -> DataFrame:
+        '''Add carbon sequestration - PlantCO2 column, looked up in the species table.'''
+        species = DataFrame(
+            [(*key, tree.co2) for key, tree in settings.SPECIES_TABLE.items()],
+            columns=['GenusKey', 'SpeciesKey', 'PlantCO2']
+        )
 
-        df = DataFrame(data)
-        df = FarmData.remove_hybrids(data=df)
-        df['PlantCO2'] = df['SpeciesName'].map(tree_co2)
+        df = FarmData.remove_hybrids(data=data)
+        df = df.assign(
+            GenusKey=df['GenusName'].str.strip().str.lower(),
+            SpeciesKey=df['SpeciesName'].str.strip().str.lower()
+        )
+        df = df.merge(species, on=['GenusKey', 'SpeciesKey'], how='left')
 
-        return df.to_dict('records')
+        return df.drop(columns=['GenusKey', 'SpeciesKey'])
 
-    def add_trees_planted(data: list) -> list:
-        '''Add estimated number of trees planted.'''
-        for d in data:
-            d['TreesPlanted'] = int(d['SphaSurvival']*d['EffectiveArea'])
+    def add_trees_planted(data: DataFrame) -> DataFrame:
+        '''Add estimated number of trees planted column.'''
+        data['TreesPlanted'] = (data['SphaSurvival']*data['EffectiveArea']).astype(int)  # pylint: disable=[E1137]
         return data
 
-    def calc_tree_co2(settings: AppSettings) -> dict:
-        '''Calculate the carbon sequestration (pounds) based on tree characteristics.'''
-
-        metrics = settings.PLANTATION_METRICS.plantationMetrics
-        for tree in metrics:
-            co2_seq = TreeCarbonSequestration.tree_carbon_sequestration(tree=tree, settings=settings)
-            tree.update({'carbonSequestration': {tree['speciesName']: co2_seq}})
-        metrics = [d['carbonSequestration'] for d in metrics]
-
-        tree_co2 = {}
-        for d in metrics:
-            tree_co2.update(d)
-
-        return tree_co2
-
-    def map_hectare_price(data: list) -> dict:
-        '''Fetch hectare price by Group Scheme.'''
-        price = {}
-        for d in data:
-            price[d['groupScheme']] = d['hectareUsd']
-        return price
-
-    def groupby_farm_id(data: list) -> list:
+    def groupby_farm_id(data: DataFrame) -> DataFrame:
         '''Group by farm id numbers.'''
 
-        df = DataFrame(data)
-        dfg = df[df['IsActive']].groupby(['GroupScheme', 'Country', 'Province', 'FarmId', 'Latitude', 'Longitude', 'FarmSize', 'IsActive']).agg({
+        dfg = data[data['IsActive']].groupby(['GroupScheme', 'Country', 'Province', 'FarmId', 'Latitude', 'Longitude', 'FarmSize', 'IsActive']).agg({
             'UnitNumber': 'count',
             'EffectiveArea': 'sum',
             'SphaSurvival': 'mean',
             'PlantCO2': 'mean',
             'PlantAge': 'mean',
-            'ProductGroup': list,
+            'ProductGroup': FarmData.unique_sorted,
             'GenusName': list,
-            'SpeciesName': list
+            'SpeciesName': list,
+            'ScientificName': FarmData.unique_sorted
         }).reset_index(drop=False)
 
-        # remove duplicates
-        dfg = FarmData.remove_duplicates(data=dfg, col='ProductGroup').sort_values(by=['GroupScheme', 'FarmSize'], ascending=[True, False])
-        dfg = dfg.drop_duplicates(subset=['Latitude', 'Longitude'], keep='first')
+        return dfg
 
-        return dfg.to_dict('records')
+    async def aggregate_farms(db: AsyncSession, settings: AppSettings) -> DataFrame:
+        '''Group by farm id numbers in the database, only the active and non-hybrid farm units are grouped.'''
 
-    def remove_duplicates(data: DataFrame, col: str) -> DataFrame:
-        '''Remove duplicates from values (list) of a given column.'''
-        data[col] = data.apply(lambda x: sorted(list(set(x[col]))), axis=1)  # pylint: disable=[E1137]
-        return data
+        table = models.FarmsTable
+        keys = [table.GroupScheme, table.Country, table.Province, table.FarmId, table.Latitude, table.Longitude, table.FarmSize, table.IsActive]
+
+        genus = func.lower(func.trim(table.GenusName))
+        species = func.lower(func.trim(table.SpeciesName))
+        plant_co2 = case(
+            *[(and_(genus == g, species == s), tree.co2) for (g, s), tree in settings.SPECIES_TABLE.items()],
+            else_=null()
+        )
+        scientific_name = func.concat(table.GenusName, literal_column("' '"), table.SpeciesName).collate('C')
+
+        rows = await async_crud.get_aggregate(
+            db=db,
+            columns=[
+                *keys,
+                func.count(table.UnitNumber).label('UnitNumber'),
+                func.sum(table.EffectiveArea).label('EffectiveArea'),
+                func.avg(table.SphaSurvival).label('SphaSurvival'),
+                func.avg(plant_co2).label('PlantCO2'),
+                func.avg(table.PlantAge).label('PlantAge'),
+                func.array_agg(aggregate_order_by(distinct(table.ProductGroup.collate('C')), table.ProductGroup.collate('C'))).label('ProductGroup'),
+                func.array_agg(table.GenusName).label('GenusName'),
+                func.array_agg(table.SpeciesName).label('SpeciesName'),
+                func.array_agg(aggregate_order_by(distinct(scientific_name), scientific_name)).label('ScientificName')
+            ],
+            group_by=keys,
+            filters=[table.IsActive.is_(True), table.SpeciesName.notin_(['clones', 'GxN'])]
+        )
+
+        dfg = DataFrame.from_records(rows, columns=[c.key for c in keys] + [
+            'UnitNumber', 'EffectiveArea', 'SphaSurvival', 'PlantCO2', 'PlantAge', 'ProductGroup', 'GenusName', 'SpeciesName', 'ScientificName'
+        ])
+        dfg = dfg.astype({'EffectiveArea': float, 'SphaSurvival': float, 'PlantCO2': float, 'PlantAge': float})
+
+        return dfg.sort_values(by=[c.key for c in keys]).reset_index(drop=True)
+
+    def remove_duplicate_locations(data: DataFrame) -> DataFrame:
+        '''Keep the largest farm of each Group Scheme among farms sharing the same location.'''
+        df = data.sort_values(by=['GroupScheme', 'FarmSize'], ascending=[True, False])
+        return df.drop_duplicates(subset=['Latitude', 'Longitude'], keep='first')
+
+    def unique_sorted(values: list) -> list:
+        '''Remove duplicates from values and sort them.'''
+        return sorted(set(values))
 
     def remove_hybrids(data: DataFrame) -> DataFrame:
         '''Remove hybrid trees.'''
         return data[(data['SpeciesName'] != 'clones') & (data['SpeciesName'] != 'GxN')]
 
-    def response_format(data: list) -> list:
-        '''Format farm data keys and values.'''
-
-        farm = data.copy()
+    def response_format(data: DataFrame) -> DataFrame:
+        '''Format farm data columns and values.'''
 
-        # keys
-        farm = ResponseFormatter.obj_list_case_converter(data=farm, fmt='camel')
+        # columns
+        df = data.rename(columns=DataFormatter.camel_case)
         # values
-        farm = ResponseFormatter.obj_list_strip_string(data=farm)
+        for col in df.columns[df.dtypes == object]:
+            strings = df[col].map(type) == str
+            df.loc[strings, col] = df.loc[strings, col].str.strip()
 
-        return farm
+        return df
@@ -0,0 +1,274 @@
+'''This module manages the farm data ingestion on ETL process, i.e. partner farm rows streamed into the farms table from Microsoft SQL Server or uploaded files.
+Rows are read in fixed-size chunks, and each chunk is upserted by natural key (FarmId, UnitNumber).'''
+
+import logging
+import threading
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import BinaryIO, Generator
+import numpy
+import pandas
+import pyarrow
+import pyarrow.parquet
+import schedule
+from sqlalchemy import Boolean, DateTime, Float, column, create_engine, func, or_, select, table, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+from fastapi import status
+
+from config import get_settings
+from database import models
+from database.session import SessionLocal, engine
+from helpers.api_exceptions import ResponseValidationError
+from helpers.misc import AppSettings, DataFormatter
+from models.farm_data_transformation import FarmSnapshot
+
+
+LOGGER = logging.getLogger(__name__)
+NATURAL_KEY = ['FarmId', 'UnitNumber']
+COLUMNS = [c.name for c in models.FarmsTable.__table__.columns if c.name not in ('Id', 'CreatedAt', 'UpdatedAt')]
+MAX_PARAMETERS = 32767  # bound parameters per statement allowed by PostgreSQL
+
+
+class FarmIngestion:
+    '''Farm ingestion class.'''
+
+    def source_url(settings: AppSettings) -> str:
+        '''Find the source database URL, the MSSQL settings are used unless another URL is set, e.g. a SQLite stand-in.'''
+        url = settings.INGESTION.SOURCE_URL
+        if url == 'mssql':
+            mssql = settings.DATABASE.MSSQL
+            return DataFormatter.mssql(server=mssql.SERVER, username=mssql.USERNAME, password=mssql.PASSWORD, database=mssql.DATABASE)
+        return url
+
+    def extract(settings: AppSettings, watermark: datetime | None) -> Generator[list, None, None]:
+        '''
+        Stream the source rows changed since a watermark, ordered by watermark, as chunks of dictionaries.
+        Rows at the watermark itself are read again, so ties split by a previous run are not missed; loading them again changes nothing.
+
+            :param settings: Application settings.
+            :param watermark [datetime]: Latest source change already loaded, None to read every row.
+
+            :returns [generator]: Chunks of source rows, including the watermark column.
+        '''
+        ingestion = settings.INGESTION
+        schema, _, name = ingestion.SOURCE_TABLE.rpartition('.')
+        watermark_column = column(ingestion.WATERMARK_COLUMN, DateTime)
+        source = table(name, *[column(c, models.FarmsTable.__table__.c[c].type) for c in COLUMNS], watermark_column, schema=schema or None)
+
+        query = select(*[source.c[c] for c in COLUMNS], watermark_column.label('_watermark')).order_by(watermark_column)
+        if watermark is not None:
+            query = query.where(watermark_column >= watermark - timedelta(seconds=float(ingestion.LOOKBACK_SECONDS)))
+
+        engine = create_engine(FarmIngestion.source_url(settings=settings), poolclass=NullPool)
+        try:
+            with engine.connect() as conn:
+                result = conn.execution_options(yield_per=int(ingestion.CHUNK_SIZE)).execute(query)
+                for partition in result.mappings().partitions():
+                    yield [dict(row) for row in partition]
+        finally:
+            engine.dispose()
+
+    def validate(rows: list) -> tuple:
+        '''Keep the rows whose required columns are set, the last row of a natural key wins, returns (valid rows, number of rejected rows).'''
+        valid, rejected = {}, 0
+        for row in rows:
+            if any(row.get(c) is None for c in COLUMNS):
+                rejected += 1
+                continue
+            row = {c: row[c] for c in COLUMNS}
+            row['FarmId'], row['UnitNumber'] = str(row['FarmId']), str(row['UnitNumber'])
+            row['IsActive'] = bool(row['IsActive'])
+            valid[(row['FarmId'], row['UnitNumber'])] = row
+        return list(valid.values()), rejected
+
+    def upsert(db: Session, rows: list) -> None:
+        '''Insert rows into the farms table, or update the existing ones by natural key if any value differs, UpdatedAt is set explicitly.'''
+        insert = postgresql_insert if db.bind.dialect.name == 'postgresql' else sqlite_insert
+        farms = models.FarmsTable.__table__
+        now = datetime.now(timezone.utc)
+        chunk_size = MAX_PARAMETERS // (len(COLUMNS) + 1)
+
+        for i in range(0, len(rows), chunk_size):
+            statement = insert(farms).values([{**row, 'UpdatedAt': now} for row in rows[i:i+chunk_size]])
+            statement = statement.on_conflict_do_update(
+                index_elements=NATURAL_KEY,
+                set_={c: statement.excluded[c] for c in COLUMNS + ['UpdatedAt'] if c not in NATURAL_KEY},
+                where=or_(*[farms.c[c].is_distinct_from(statement.excluded[c]) for c in COLUMNS if c not in NATURAL_KEY])
+            )
+            db.execute(statement)
+
+    def run(settings: AppSettings) -> dict:
+        '''
+        Run an ingestion, each chunk is upserted along with the new watermark in its own transaction, so memory stays flat and an interrupted run resumes.
+
+            :param settings: Application settings.
+
+            :returns [dict]: Loaded and rejected rows, chunks and watermark, or skipped if another process is running the ingestion.
+        '''
+        source = settings.INGESTION.SOURCE_TABLE
+        stats = dict(source=source, loaded=0, rejected=0, chunks=0, watermark=None, skipped=False)
+
+        # a single process of the deployment runs the ingestion at a time, the advisory lock is held by a dedicated connection
+        lock = zlib.crc32(f'ingestion:{source}'.encode('utf-8'))
+        with engine.connect() as lock_conn:
+            locking = lock_conn.dialect.name == 'postgresql'
+            if locking and not lock_conn.execute(select(func.pg_try_advisory_lock(lock))).scalar():
+                stats['skipped'] = True
+                return stats
+
+            db = SessionLocal()
+            try:
+                state = db.execute(select(models.IngestionWatermarksTable).where(models.IngestionWatermarksTable.source == source)).scalar_one_or_none()
+                if state is None:
+                    db.add(models.IngestionWatermarksTable(source=source, watermark=None, rowsLoaded=0, rowsRejected=0))
+                watermark = None if state is None else state.watermark
+                db.commit()
+
+                for chunk in FarmIngestion.extract(settings=settings, watermark=watermark):
+                    rows, rejected = FarmIngestion.validate(chunk)
+                    FarmIngestion.upsert(db=db, rows=rows)
+                    watermark = max((row['_watermark'] for row in chunk if row['_watermark'] is not None), default=watermark)
+                    db.execute(
+                        update(models.IngestionWatermarksTable)
+                        .where(models.IngestionWatermarksTable.source == source)
+                        .values(
+                            watermark=watermark,
+                            rowsLoaded=models.IngestionWatermarksTable.rowsLoaded + len(rows),
+                            rowsRejected=models.IngestionWatermarksTable.rowsRejected + rejected
+                        )
+                        .execution_options(synchronize_session=False)
+                    )
+                    db.commit()
+                    stats['loaded'] += len(rows)
+                    stats['rejected'] += rejected
+                    stats['chunks'] += 1
+
+                stats['watermark'] = watermark
+                return stats
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+                if locking:
+                    lock_conn.execute(select(func.pg_advisory_unlock(lock)))
+
+    def job() -> None:
+        '''Run an ingestion with the current settings, failures are reported and retried on the next run.'''
+        try:
+            stats = FarmIngestion.run(settings=get_settings())
+            LOGGER.info('Farm ingestion: %s', stats)
+        except Exception as e:  # pylint: disable=[W0703]
+            LOGGER.error('Unable to ingest farms: %s', e)
+
+
+class FarmUpload:
+    '''Farm upload class, i.e. a CSV or Parquet file of farm unit rows loaded in a single transaction.'''
+
+    def frames(file: BinaryIO, file_format: str, chunk_size: int) -> Generator[pandas.DataFrame, None, None]:
+        '''Read a CSV or Parquet file as a stream of data frames of a fixed number of rows.'''
+        if file_format == 'csv':
+            yield from pandas.read_csv(file, chunksize=chunk_size, dtype=str, keep_default_na=False, na_values=[''])
+        elif file_format == 'parquet':
+            for batch in pyarrow.parquet.ParquetFile(file).iter_batches(batch_size=chunk_size):
+                yield batch.to_pandas()
+        else:
+            raise ResponseValidationError(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                message={'file': 'file format must be one of the following: csv | parquet'}
+            )
+
+    def coerce(df: pandas.DataFrame) -> list:
+        '''Convert the farm columns of a data frame to their table types, values that cannot be converted become None so their rows are rejected.'''
+        missing = [c for c in COLUMNS if c not in df.columns]
+        if missing:
+            raise ResponseValidationError(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                message={'file': f'missing columns: {", ".join(missing)}'}
+            )
+
+        data = {}
+        for c in COLUMNS:
+            kind = type(models.FarmsTable.__table__.c[c].type)
+            if kind is Float:
+                data[c] = pandas.to_numeric(df[c], errors='coerce')
+            elif kind is Boolean:
+                data[c] = df[c].astype(str).str.strip().str.lower().map({'true': True, '1': True, 't': True, 'false': False, '0': False, 'f': False})
+            else:
+                data[c] = df[c].where(df[c].isna(), df[c].astype(str).str.strip()).replace('', numpy.nan)
+        return pandas.DataFrame(data).astype(object).where(lambda x: x.notna(), None).to_dict('records')
+
+    def load(file: BinaryIO, file_format: str, settings: AppSettings) -> dict:
+        '''
+        Load a farm file into the farms table, chunk by chunk in a single transaction, so memory stays bounded and a failed load changes nothing.
+
+            :param file [file]: CSV or Parquet file.
+            :param file_format [str]: File format, i.e. csv | parquet.
+            :param settings: Application settings.
+
+            :returns [dict]: Rows loaded and rejected.
+        '''
+        loaded, rejected = 0, 0
+        db = SessionLocal()
+        try:
+            for df in FarmUpload.frames(file=file, file_format=file_format, chunk_size=int(settings.FARM.UPLOAD_CHUNK_SIZE)):
+                rows, invalid = FarmIngestion.validate(FarmUpload.coerce(df))
+                FarmIngestion.upsert(db=db, rows=rows)
+                loaded += len(rows)
+                rejected += invalid
+            db.commit()
+        except (pandas.errors.ParserError, pyarrow.ArrowException, UnicodeDecodeError) as e:
+            db.rollback()
+            raise ResponseValidationError(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                message={'file': f'unable to read file: {e}'}
+            ) from e
+        except SQLAlchemyError as e:
+            db.rollback()
+            raise ResponseValidationError(
+                status_code=status.HTTP_409_CONFLICT,
+                message='Unable to load farms into the database.'
+            ) from e
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        FarmSnapshot.invalidate()
+        return dict(loaded=loaded, rejected=rejected)
+
+
+class IngestionScheduler:
+    '''Ingestion scheduler class, i.e. a thread running the farm ingestion at a fixed interval.'''
+
+    thread = None
+    stopped = threading.Event()
+    scheduler = schedule.Scheduler()
+
+    def start(settings: AppSettings) -> None:
+        '''Schedule the farm ingestion if enabled, its first run is immediate.'''
+        if not settings.INGESTION.ENABLED or IngestionScheduler.thread is not None:
+            return
+        IngestionScheduler.stopped.clear()
+        IngestionScheduler.scheduler.clear()
+        IngestionScheduler.scheduler.every(float(settings.INGESTION.EVERY_MINUTES)).minutes.do(FarmIngestion.job)
+        IngestionScheduler.thread = threading.Thread(target=IngestionScheduler.run, name='farm-ingestion', daemon=True)
+        IngestionScheduler.thread.start()
+
+    def stop(timeout: float | None = None) -> None:
+        '''Stop the scheduler, an ingestion interrupted by the process exit resumes from its last committed chunk.'''
+        thread, IngestionScheduler.thread = IngestionScheduler.thread, None
+        IngestionScheduler.stopped.set()
+        if thread is not None:
+            thread.join(timeout=timeout)
+
+    def run() -> None:
+        '''Run the pending jobs until stopped.'''
+        IngestionScheduler.scheduler.run_all()
+        while not IngestionScheduler.stopped.wait(1):
+            IngestionScheduler.scheduler.run_pending()
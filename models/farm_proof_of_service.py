@@ -1,14 +1,34 @@
 '''This module manages the farm proof of service.'''
 
+import hashlib
 import folium
+from starlette.concurrency import run_in_threadpool
+
+from config import get_settings, on_reload
+from helpers.lru_caching import TTLCache
 from helpers.misc import AppSettings
 
 
+TEMPLATE_VERSION = 1  # bump it when the map template changes, so cached views are rendered again
+SATELLITE_CACHE = TTLCache(
+    name='satellite',
+    seconds=float(get_settings().GIS.SATELLITE.CACHE_SECONDS),
+    maxsize=int(get_settings().GIS.SATELLITE.CACHE_SIZE)
+)
+
+
+@on_reload
+def configure_satellite_cache(settings: AppSettings) -> None:
+    '''Resize the satellite view cache, views rendered with the previous settings are no longer looked up.'''
+    SATELLITE_CACHE.seconds = float(settings.GIS.SATELLITE.CACHE_SECONDS)
+    SATELLITE_CACHE.maxsize = int(settings.GIS.SATELLITE.CACHE_SIZE)
+
+
 class FarmProofOfService:
     '''Farm Proof Of Service class.'''
 
-    def satellite_mapbox(farm_id: str, lat: float, lng: float, settings: AppSettings) -> str:
-        '''Generate a satellite view (html) based on geographic coordinates.'''
+    def satellite_mapbox(lat: float, lng: float, settings: AppSettings) -> str:
+        '''Generate a satellite view (html) based on geographic coordinates, it is rendered in memory.'''
 
         base_url = 'https://api.mapbox.com/v4'
         endpoint = 'mapbox.satellite/{z}/{x}/{y}@2x.png'
@@ -21,7 +41,20 @@ class FarmProofOfService:
             attr='Mapbox'
         )
 
-        filename = f'temp/{farm_id}.html'
-        gis.save(filename)
+        return gis.get_root().render()
+
+    def satellite_key(farm_id: str, lat: float, lng: float, settings: AppSettings) -> str:
+        '''Build the satellite view cache key, i.e. what the rendered view depends on.'''
+        return f'{farm_id}:{lat!r}:{lng!r}:{TEMPLATE_VERSION}:{folium.__version__}:{settings.VERSION}'
 
-        return filename
+    def satellite_etag(key: str) -> str:
+        '''Build a weak ETag from the satellite view cache key, views of the same key look the same even if their element ids differ.'''
+        return f'W/"{hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]}"'
+
+    async def satellite_view(farm_id: str, lat: float, lng: float, settings: AppSettings) -> str:
+        '''Fetch a satellite view from the cache, or render it off the event loop once for concurrent requests.'''
+        key = FarmProofOfService.satellite_key(farm_id=farm_id, lat=lat, lng=lng, settings=settings)
+        return await SATELLITE_CACHE.aget_or_compute(
+            key,
+            lambda: run_in_threadpool(FarmProofOfService.satellite_mapbox, lat=lat, lng=lng, settings=settings)
+        )
@@ -7,14 +7,9 @@ from helpers.misc import AppSettings, DataAggregator, UnitMeasureConversion
 class PlantationMetrics:
     '''Plantation Metrics class.'''
 
-    def tree(data: dict, metrics: list) -> list:
-        '''Returns a tree data specifations.'''
-        try:
-            genus = data['GenusName'].strip().lower()
-            species = data['SpeciesName'].strip().lower()
-            return [d for d in metrics if d['genusName'] == genus and d['speciesName'] == species][0]
-        except (AttributeError, IndexError, KeyError):
-            return []
+    def species_key(genus: str, species: str) -> tuple:
+        '''Returns a normalized (genus, species) key.'''
+        return (str(genus).strip().lower(), str(species).strip().lower())
 
     def tree_height(tree: dict, settings: AppSettings):
         '''Returns a tree height in a standard metric.'''
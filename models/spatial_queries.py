@@ -0,0 +1,264 @@
+'''This module manages the spatial queries over farms and NFTs, i.e. bounding box, radius and k-nearest searches, and NFT parcel overlaps.
+Farm centroids are indexed from the farm snapshot, NFT geometries from the nfts table, both indexes are updated incrementally as the data changes.'''
+
+import asyncio
+import time
+import zlib
+from fastapi import status
+from sqlalchemy import BigInteger, and_, cast, false, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import get_settings, on_reload
+from database import async_crud, models
+from helpers.api_exceptions import ResponseValidationError
+from helpers.misc import AppSettings
+from helpers.spatial_index import Geometry, SpatialIndex
+from models.farm_data_transformation import FarmSnapshot
+
+
+NFT_COLUMNS = [
+    'nftId', 'nftName', 'nftArea', 'nftValueSol', 'geolocation', 'tileCount', 'carbonUrl',
+    'mintStatus', 'mintStartDate', 'mintEndDate', 'farmId', 'scientificName', 'plantStatus'
+]
+
+
+@on_reload
+def configure_spatial_indexes(settings: AppSettings) -> None:
+    '''Rebuild the spatial indexes if their grid cell size or maximum cells per geometry has changed.'''
+    max_cells = int(settings.GIS.SPATIAL_INDEX.MAX_CELLS)
+    farm_cell_degrees = float(settings.GIS.SPATIAL_INDEX.FARM_CELL_DEGREES)
+    if (FarmIndex.index.cell_degrees, FarmIndex.index.max_cells) != (farm_cell_degrees, max_cells):
+        FarmIndex.index, FarmIndex.version = SpatialIndex(cell_degrees=farm_cell_degrees, max_cells=max_cells), None
+    nft_cell_degrees = float(settings.GIS.SPATIAL_INDEX.NFT_CELL_DEGREES)
+    if (NFTIndex.index.cell_degrees, NFTIndex.index.max_cells) != (nft_cell_degrees, max_cells):
+        NFTIndex.index = SpatialIndex(cell_degrees=nft_cell_degrees, max_cells=max_cells)
+        NFTIndex.invalidate()
+
+
+class FarmIndex:
+    '''Farm spatial index class, i.e. farm centroids kept in sync with the farm snapshot.'''
+
+    index = SpatialIndex(
+        cell_degrees=float(get_settings().GIS.SPATIAL_INDEX.FARM_CELL_DEGREES),
+        max_cells=int(get_settings().GIS.SPATIAL_INDEX.MAX_CELLS)
+    )
+    version = None
+
+    async def current(db: AsyncSession, settings: AppSettings) -> SpatialIndex:
+        '''Fetch the farm index, it is updated when the snapshot version changes.'''
+        version, data, _ = await FarmSnapshot.fetch(db=db, settings=settings)
+        if FarmIndex.version != version:
+            FarmIndex.sync(data=data)
+            FarmIndex.version = version
+        return FarmIndex.index
+
+    def sync(data: list) -> None:
+        '''Update the farm index from a farm list, only farms that moved are placed in other cells and farms that are gone are removed.'''
+        index = FarmIndex.index
+        farm_ids = set()
+        for farm in data:
+            try:
+                index.upsert(farm['farmId'], {'type': 'Point', 'coordinates': [farm['longitude'], farm['latitude']]}, farm)
+                farm_ids.add(farm['farmId'])
+            except (TypeError, ValueError):
+                continue  # farms without a valid location are not indexed
+        for farm_id in set(index.items) - farm_ids:
+            index.remove(farm_id)
+
+
+class NFTIndex:
+    '''NFT spatial index class, i.e. NFT geometries kept in sync with the nfts table.'''
+
+    index = SpatialIndex(
+        cell_degrees=float(get_settings().GIS.SPATIAL_INDEX.NFT_CELL_DEGREES),
+        max_cells=int(get_settings().GIS.SPATIAL_INDEX.MAX_CELLS)
+    )
+    version = None  # (latest update date, number of rows) of the nfts table
+    keys = set()  # nftIds loaded, including the ones without a valid geometry
+    farms = {}  # highest NFT id loaded per farm while the farm was locked, see NFTIndex.catch_up
+    checked = 0.0
+    lock = asyncio.Lock()
+
+    async def current(db: AsyncSession, settings: AppSettings) -> SpatialIndex:
+        '''
+        Fetch the NFT index, the nfts table version is checked at most every GIS.SPATIAL_INDEX.VERSION_CHECK_SECONDS.
+        Rows updated since the previous version are loaded into the index, the whole table only if rows are missing, e.g. written by another worker.
+        '''
+        if NFTIndex.version is not None and time.monotonic() - NFTIndex.checked < float(settings.GIS.SPATIAL_INDEX.VERSION_CHECK_SECONDS):
+            return NFTIndex.index
+
+        async with NFTIndex.lock:
+            version = await async_crud.get_table_version(db=db, table=models.NFTsTable, column=models.NFTsTable.updatedAt)
+            if version != NFTIndex.version:
+                table = models.NFTsTable
+                filters = [] if NFTIndex.version is None or NFTIndex.version[0] is None else [table.updatedAt >= NFTIndex.version[0]]
+                NFTIndex.upsert(rows=await async_crud.get_rows(db=db, columns=[getattr(table, c) for c in NFT_COLUMNS], filters=filters))
+                if len(NFTIndex.keys) != version[1]:
+                    NFTIndex.invalidate()
+                    NFTIndex.upsert(rows=await async_crud.get_rows(db=db, columns=[getattr(table, c) for c in NFT_COLUMNS]))
+                NFTIndex.version = version
+            NFTIndex.checked = time.monotonic()
+
+        return NFTIndex.index
+
+    async def catch_up(db: AsyncSession, farm_ids: set) -> SpatialIndex:
+        '''
+        Load the NFTs of locked farms added since they were last loaded, e.g. by another worker, read in the insert transaction.
+        Writes to a locked farm are serialized, so the ids of its NFTs only grow and the ones over its highest loaded id are the new ones.
+        '''
+        table = models.NFTsTable
+        async with NFTIndex.lock:
+            farms = NFTIndex.farms
+            filters = [and_(table.farmId == farm_id, table.id > farms.get(farm_id, 0)) for farm_id in sorted(farm_ids)]
+            rows = (await db.execute(select(table.id, *[getattr(table, c) for c in NFT_COLUMNS]).where(or_(*filters)))).all()
+            NFTIndex.upsert(rows=[row._asdict() for row in rows])
+            for row in rows:
+                farms[row.farmId] = max(farms.get(row.farmId, 0), row.id)
+        return NFTIndex.index
+
+    def invalidate() -> None:
+        '''Drop the loaded NFTs, e.g. after NFTs are deleted, so they are loaded again from the nfts table.'''
+        NFTIndex.index.clear()
+        NFTIndex.version = None
+        NFTIndex.keys = set()
+        NFTIndex.farms = {}
+
+    def upsert(rows: list) -> None:
+        '''Index NFTs, e.g. right after they are written, as rows or dictionaries of the NFT columns.'''
+        for row in rows:
+            nft = {c: row[c] for c in NFT_COLUMNS} if isinstance(row, dict) else row._asdict()
+            NFTIndex.keys.add(nft['nftId'])
+            try:
+                NFTIndex.index.upsert(nft['nftId'], nft['geolocation'], nft)
+            except (TypeError, ValueError):
+                NFTIndex.index.remove(nft['nftId'])  # NFTs without a valid geometry are not indexed
+
+
+class SpatialQuery:
+    '''Spatial query class.'''
+
+    def search(index: SpatialIndex, bbox: str | None, lat: float | None, lng: float | None, radius_km: float | None, k: int | None, limit: int) -> list:
+        '''
+        Search an index by bounding box, radius or k-nearest, whichever the parameters describe.
+
+            :param index [SpatialIndex]: Spatial index.
+            :param bbox [str]: Bounding box as minLng,minLat,maxLng,maxLat.
+            :param lat [float]: Point latitude, for radius and k-nearest searches.
+            :param lng [float]: Point longitude, for radius and k-nearest searches.
+            :param radius_km [float]: Distance in kilometers, for radius searches.
+            :param k [int]: Number of geometries, for k-nearest searches.
+            :param limit [int]: Maximum number of geometries.
+
+            :returns [list]: (key, value, distance in kilometers or None) of the geometries found.
+        '''
+        point = lat is not None and lng is not None
+        if (lat is None) != (lng is None) or [bbox is not None, point and radius_km is not None, point and k is not None].count(True) != 1:
+            raise ResponseValidationError(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                message={'query': 'it must be one of the following: bbox | lat, lng and radiusKm | lat, lng and k'}
+            )
+
+        if bbox is not None:
+            try:
+                box = tuple(float(v) for v in bbox.split(','))
+            except ValueError:
+                box = ()
+            if len(box) != 4 or not (-180 <= box[0] <= box[2] <= 180 and -90 <= box[1] <= box[3] <= 90):
+                raise ResponseValidationError(
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    message={'bbox': 'it must be minLng,minLat,maxLng,maxLat'}
+                )
+            return [(key, value, None) for key, value in index.within_bbox(bbox=box, limit=limit)]
+
+        if radius_km is not None:
+            return index.within_radius(lat=lat, lng=lng, radius_km=radius_km, limit=limit)
+
+        return index.nearest(lat=lat, lng=lng, k=min(k, limit))
+
+    def overlapping(index: SpatialIndex, geometry: dict, farm_id: str, tolerance_m: float, exclude: str | None = None) -> list:
+        '''
+        Find the NFTs of a farm whose parcel overlaps a geometry, only the ones whose bounding box intersects it are tested exactly.
+
+            :param index [SpatialIndex]: NFT spatial index, values are dictionaries holding a farmId.
+            :param geometry [dict]: Polygon or MultiPolygon geometry, other geometries overlap nothing.
+            :param farm_id [str]: Farm of the NFTs tested.
+            :param tolerance_m [float]: Distance in meters under which parcel edges are considered shared.
+            :param exclude [str]: Key not tested, e.g. the NFT itself.
+
+            :returns [list]: Keys of the overlapping NFTs.
+        '''
+        try:
+            bbox = Geometry.bbox(geometry)
+        except ValueError:
+            return []
+
+        with index.lock:
+            candidates = [(k, index.items[k]) for k in index.candidates(bbox) if k != exclude]
+        return sorted(
+            k for k, (_, other, value) in candidates
+            if value['farmId'] == farm_id and Geometry.overlaps(geometry, other, tolerance_m=tolerance_m)
+        )
+
+
+class NFTOverlap:
+    '''
+    NFT overlap class, i.e. the parcel overlap rule enforced inside the insert transaction.
+    The farms of the new NFTs are locked until commit, so concurrent writes to a farm check its parcels one after another.
+    '''
+
+    async def lock(db: AsyncSession, farm_ids: set) -> None:
+        '''Lock farms until the transaction ends, in a fixed order so writers to several farms cannot deadlock.'''
+        if db.bind.dialect.name != 'postgresql':
+            # SQLite has no row or advisory locks, an empty update takes its database write lock so other writers wait for the commit
+            await db.execute(update(models.NFTsTable).where(false()).values(id=models.NFTsTable.id))
+            return
+        for farm_id in sorted(farm_ids):
+            key = zlib.crc32(f'nft-overlap:{farm_id}'.encode('utf-8'))
+            await db.execute(select(func.pg_advisory_xact_lock(cast(key, BigInteger))))
+
+    async def screen(db: AsyncSession, rows: list, settings: AppSettings, rejected: dict, flagged: dict) -> list:
+        '''
+        Check new NFTs against the committed NFTs of their farm and the ones before them, after locking their farms.
+        The committed NFTs are the ones of the NFT index, once the NFTs added to the farms since they were last loaded are read.
+
+            :param db [generator]: Database asyncio session, in the insert transaction.
+            :param rows [list]: New NFTs as dictionaries holding nftId, farmId and geolocation.
+            :param settings: Application settings.
+            :param rejected [dict]: Filled with the error of each NFT rejected for overlapping, if NFT.OVERLAP.ACTION is reject.
+            :param flagged [dict]: Filled with the overlapping NFTs of each NFT kept despite overlapping, if NFT.OVERLAP.ACTION is flag.
+
+            :returns [list]: NFTs to insert.
+        '''
+        farm_ids = {row['farmId'] for row in rows}
+        await NFTOverlap.lock(db=db, farm_ids=farm_ids)
+        committed = await NFTIndex.catch_up(db=db, farm_ids=farm_ids)
+        batch = SpatialIndex(cell_degrees=committed.cell_degrees, max_cells=committed.max_cells)
+        tolerance_m = float(settings.NFT.OVERLAP.TOLERANCE_METERS)
+
+        kept = []
+        for row in rows:
+            overlaps = sorted(
+                k for index in (committed, batch)
+                for k in SpatialQuery.overlapping(
+                    index=index, geometry=row['geolocation'], farm_id=row['farmId'], tolerance_m=tolerance_m, exclude=row['nftId']
+                )
+            )
+            if overlaps and settings.NFT.OVERLAP.ACTION == 'reject':
+                rejected[row['nftId']] = f'NFT overlaps existing NFTs: {", ".join(overlaps)}.'
+                continue
+            if overlaps:
+                flagged[row['nftId']] = overlaps
+            if row['nftId'] not in committed.items:
+                try:
+                    batch.upsert(row['nftId'], row['geolocation'], {'farmId': row['farmId']})
+                except (TypeError, ValueError):
+                    pass  # NFTs without a valid geometry overlap nothing
+            kept.append(row)
+        return kept
+
+    async def check(db: AsyncSession, row: dict, settings: AppSettings, flagged: dict) -> None:
+        '''Check a new NFT, see NFTOverlap.screen, raises a conflict error if it is rejected.'''
+        rejected = {}
+        await NFTOverlap.screen(db=db, rows=[row], settings=settings, rejected=rejected, flagged=flagged)
+        if rejected:
+            raise ResponseValidationError(status_code=status.HTTP_409_CONFLICT, message=rejected[row['nftId']])
@@ -0,0 +1,53 @@
+'''This module compiles the plantation metrics, once at load, into an immutable species table from the following:
+./docs/json/plantation_metrics.json'''
+
+from types import MappingProxyType
+from typing import Mapping, NamedTuple
+import numpy
+
+from helpers.misc import AppSettings, DataAggregator
+from models.carbon_sequestration import TreeCarbonSequestration
+from models.plantation_metrics import PlantationMetrics
+
+
+class Species(NamedTuple):
+    '''Compiled tree species metrics.'''
+
+    genus: str
+    species: str
+    height: float  # feet
+    diameter: float  # inches
+    co2: float  # pounds
+
+
+class SpeciesTable:
+    '''Species table class.'''
+
+    def compile(settings: AppSettings) -> Mapping:
+        '''
+        Compile the plantation metrics into a read-only table keyed by normalized (genus, species).
+
+            :param settings: Application settings.
+
+            :returns [mapping]: Species metrics by (genus, species) key.
+        '''
+        metrics = settings.PLANTATION_METRICS.plantationMetrics
+
+        height = numpy.array([PlantationMetrics.tree_height(tree=tree, settings=settings) for tree in metrics], dtype=float)
+        diameter = numpy.array([PlantationMetrics.tree_diameter(tree=tree, settings=settings) for tree in metrics], dtype=float)
+
+        co2 = TreeCarbonSequestration.trees_carbon_sequestration(
+            height=height,
+            diameter=diameter,
+            root=numpy.array([DataAggregator.list_mean(tree['rootDryMass']['measure']) for tree in metrics], dtype=float),
+            dry_matter=numpy.array([DataAggregator.list_mean(tree['dryBiomass']['measure']) for tree in metrics], dtype=float),
+            carbon_content=numpy.array([DataAggregator.list_mean(tree['carbonConcentration']['measure']) for tree in metrics], dtype=float),
+            settings=settings
+        )
+
+        table = {}
+        for tree, h, d, c in zip(metrics, height.tolist(), diameter.tolist(), co2.tolist()):
+            key = PlantationMetrics.species_key(genus=tree['genusName'], species=tree['speciesName'])
+            table[key] = Species(*key, height=h, diameter=d, co2=c)
+
+        return MappingProxyType(table)
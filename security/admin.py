@@ -2,24 +2,37 @@
 
 from fastapi import HTTPException, Depends, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError
 
 from apis.schemas.admin import AccessTokenData, Admin
-from database import crud, models
-from database.session import get_db
+from database import async_crud, models
+from database.session import get_async_db
 from security.hashing import SecureHash
 from security.tokens import JSONWebToken
-from config import get_settings
+from helpers.lru_caching import TTLCache
+from helpers.misc import AppSettings
+from config import get_settings, on_reload
 
 
-settings = get_settings()
-OAUTH2_SCHEME = OAuth2PasswordBearer(tokenUrl=f'{settings.API.PREFIX}/token')
+OAUTH2_SCHEME = OAuth2PasswordBearer(tokenUrl=f'{get_settings().API.PREFIX}/token')
+ADMIN_CACHE = TTLCache(
+    name='admins',
+    seconds=float(get_settings().SECURITY.ADMIN_CACHE_SECONDS),
+    maxsize=int(get_settings().SECURITY.ADMIN_CACHE_SIZE)
+)
 
 
-def get_admin(db: Session, username: str):
+@on_reload
+def configure_admin_cache(settings: AppSettings) -> None:
+    '''Resize the admin cache, cached admins expire on their own lifetime.'''
+    ADMIN_CACHE.seconds = float(settings.SECURITY.ADMIN_CACHE_SECONDS)
+    ADMIN_CACHE.maxsize = int(settings.SECURITY.ADMIN_CACHE_SIZE)
+
+
+async def get_admin(db: AsyncSession, username: str):
     '''Retrieve admin from the database.'''
-    return crud.get_object(
+    return await async_crud.get_object(
         db=db,
         table=models.AdminsTable,
         column=models.AdminsTable.username,
@@ -28,9 +41,9 @@ def get_admin(db: Session, username: str):
     )
 
 
-def authenticate_admin(db: Session, username: str, password: str):
+async def authenticate_admin(db: AsyncSession, username: str, password: str):
     '''Authenticate admin credentials (username and password).'''
-    admin = get_admin(db=db, username=username)
+    admin = await get_admin(db=db, username=username)
     if not admin or not SecureHash.verify(signature=password, hashed=admin.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -40,7 +53,7 @@ def authenticate_admin(db: Session, username: str, password: str):
     return admin
 
 
-async def get_current_admin(db: Session = Depends(get_db), token: str = Depends(OAUTH2_SCHEME)):
+async def get_current_admin(db: AsyncSession = Depends(get_async_db), token: str = Depends(OAUTH2_SCHEME)):
     '''Ensure admin JWT is valid.'''
     creds_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -56,7 +69,14 @@ async def get_current_admin(db: Session = Depends(get_db), token: str = Depends(
         token_data = AccessTokenData(username=username)
     except JWTError as e:
         raise creds_exception from e
-    return get_admin(db=db, username=token_data.username)
+
+    return await ADMIN_CACHE.aget_or_compute(token_data.username, lambda: resolve_admin(db=db, username=token_data.username))
+
+
+async def resolve_admin(db: AsyncSession, username: str) -> Admin:
+    '''Resolve an admin principal (username and status) from the database.'''
+    admin = await get_admin(db=db, username=username)
+    return Admin(username=admin.username, is_active=admin.is_active)
 
 
 async def get_current_active_admin(current_admin: Admin = Depends(get_current_admin)):
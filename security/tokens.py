@@ -1,12 +1,28 @@
 '''This module manages the creation of JWTs.'''
 
+import hashlib
+import time
 from datetime import datetime, timedelta
 from jose import jwt
 
-from config import get_settings
+from helpers.lru_caching import TTLCache
+from helpers.misc import AppSettings
+from config import get_settings, on_reload
 
 
-settings = get_settings()
+TOKEN_CACHE = TTLCache(
+    name='tokens',
+    seconds=int(get_settings().SECURITY.JWT_EXPIRE_MINUTES)*60,
+    maxsize=int(get_settings().SECURITY.JWT_CACHE_SIZE)
+)
+
+
+@on_reload
+def configure_token_cache(settings: AppSettings) -> None:
+    '''Resize the token cache and drop tokens verified with the previous secret key.'''
+    TOKEN_CACHE.seconds = int(settings.SECURITY.JWT_EXPIRE_MINUTES)*60
+    TOKEN_CACHE.maxsize = int(settings.SECURITY.JWT_CACHE_SIZE)
+    TOKEN_CACHE.clear()
 
 
 class JSONWebToken:
@@ -14,11 +30,19 @@ class JSONWebToken:
 
     def create(data: dict):
         '''Create a JWT token.'''
+        settings = get_settings()
         expire = datetime.utcnow() + timedelta(minutes=int(settings.SECURITY.JWT_EXPIRE_MINUTES))
         to_encode = data.copy()
         to_encode.update({'exp': expire})
         return jwt.encode(to_encode, settings.SECURITY.JWT_SECRET_KEY, algorithm=settings.SECURITY.JWT_ALGORITHM)
 
     def decode(token: str):
-        '''Decode a JWT token.'''
-        return jwt.decode(token, settings.SECURITY.JWT_SECRET_KEY, algorithms=[settings.SECURITY.JWT_ALGORITHM])
+        '''Decode a JWT token, verified tokens are cached so their signature is only checked once.'''
+        key = hashlib.sha256(token.encode('utf-8')).hexdigest()  # raw tokens are never kept in memory
+        payload = TOKEN_CACHE.get(key)
+        if payload is None:
+            settings = get_settings()
+            payload = jwt.decode(token, settings.SECURITY.JWT_SECRET_KEY, algorithms=[settings.SECURITY.JWT_ALGORITHM])
+            if 'exp' in payload:
+                TOKEN_CACHE.set(key, payload, seconds=float(payload['exp']) - time.time())
+        return dict(payload)
@@ -0,0 +1,70 @@
+'''This module configures the test suite, i.e. the environment variables read by the settings, a throwaway SQLite database and the seed data.'''
+
+import asyncio
+import os
+import tempfile
+from typing import Coroutine
+import pandas
+import pytest
+
+
+PATH_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PATH_DATA = os.path.join(PATH_ROOT, 'tests', 'data')
+
+# settings are built on import from files relative to the project root, the tests never touch the databases of the environment
+os.chdir(PATH_ROOT)
+os.environ.update({
+    'ENVIRONMENT': 'development',
+    'DATABASE_URL': f'sqlite:///{tempfile.mkdtemp(prefix="ecoverse-tests-")}/ecoverse.db',
+    'ADMIN_USERNAME': 'admin',
+    'ADMIN_PASSWORD': 'admin',
+    'JWT_EXPIRE_MINUTES': '15',
+    'JWT_ALGORITHM': 'HS256',
+    'JWT_SECRET_KEY': 'tests',
+    'NFT_UPDATE_URL': 'http://127.0.0.1:9/nft/update',
+    'MAPBOX_ACCESS_TOKEN': 'tests'
+})
+
+
+def run(coroutine: Coroutine):
+    '''Run a coroutine in a new event loop, the asyncio connections are closed with it.'''
+    from database.session import async_engine  # pylint: disable=C0415
+
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            await async_engine.dispose()
+
+    return asyncio.run(main())
+
+
+@pytest.fixture(scope='session')
+def database():
+    '''Create the database tables.'''
+    from database import models, session  # pylint: disable=C0415
+    models.Base.metadata.create_all(bind=session.engine)
+    yield session
+    models.Base.metadata.drop_all(bind=session.engine)
+
+
+@pytest.fixture
+def farms(database):
+    '''Load the seed farms and pricing, i.e. tests/data/farms.csv and tests/data/pricing.csv.'''
+    from database import models  # pylint: disable=C0415
+    from models.farm_data_transformation import FarmSnapshot  # pylint: disable=C0415
+
+    db = database.SessionLocal()
+    try:
+        db.query(models.FarmsTable).delete()
+        db.query(models.PricingTable).delete()
+        farm = pandas.read_csv(f'{PATH_DATA}/farms.csv', dtype={'UnitNumber': str})
+        db.add_all([models.FarmsTable(**row) for row in farm.to_dict('records')])
+        db.add_all([models.PricingTable(**row) for row in pandas.read_csv(f'{PATH_DATA}/pricing.csv').to_dict('records')])
+        db.commit()
+    finally:
+        db.close()
+
+    FarmSnapshot.invalidate()
+    yield farm
+    FarmSnapshot.invalidate()
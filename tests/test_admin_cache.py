@@ -0,0 +1,83 @@
+'''Tests of the admin cache, i.e. admin status changes taking effect while an admin is being resolved.'''
+
+import asyncio
+import threading
+import pytest
+
+from tests.conftest import run
+from database import async_crud, models
+from helpers.lru_caching import TTLCache
+from security.admin import ADMIN_CACHE, resolve_admin
+
+
+USERNAME = 'cache-test'
+
+
+@pytest.fixture
+def admin(database):
+    '''Create an active admin, yields the database session module.'''
+    db = database.SessionLocal()
+    try:
+        db.query(models.AdminsTable).filter(models.AdminsTable.username == USERNAME).delete()
+        db.add(models.AdminsTable(username=USERNAME, hashed_password='-', is_active=True))
+        db.commit()
+    finally:
+        db.close()
+    ADMIN_CACHE.clear()
+    yield database
+    ADMIN_CACHE.clear()
+
+
+def test_deactivation_during_resolution_is_not_cached(admin):
+    async def main():
+        read, resume = asyncio.Event(), asyncio.Event()
+
+        async def slow_resolve():
+            principal = await resolve_admin(db=admin.AsyncSessionLocal(), username=USERNAME)
+            read.set()
+            await resume.wait()
+            return principal
+
+        stale = asyncio.create_task(ADMIN_CACHE.aget_or_compute(USERNAME, slow_resolve))
+        await read.wait()
+
+        # what the admin status route does, while the admin read before it is still in flight
+        await async_crud.update_object(
+            db=admin.AsyncSessionLocal(), table=models.AdminsTable, column=models.AdminsTable.username, value=USERNAME, data={'is_active': False}
+        )
+        ADMIN_CACHE.invalidate(USERNAME)
+
+        fresh = await asyncio.wait_for(ADMIN_CACHE.aget_or_compute(USERNAME, lambda: resolve_admin(db=admin.AsyncSessionLocal(), username=USERNAME)), 5)
+        resume.set()
+        return (await stale), fresh, ADMIN_CACHE.get(USERNAME)
+
+    stale, fresh, cached = run(main())
+
+    assert stale.is_active
+    assert not fresh.is_active
+    assert not cached.is_active
+
+
+def test_invalidation_during_computation_is_not_cached():
+    cache = TTLCache(name='tests.invalidation', seconds=60)
+    computing, resume = threading.Event(), threading.Event()
+
+    def slow():
+        computing.set()
+        resume.wait()
+        return 'stale'
+
+    stale = threading.Thread(target=cache.get_or_compute, args=('key', slow), daemon=True)
+    stale.start()
+    computing.wait()
+    cache.invalidate('key')
+    found = []
+    fresh = threading.Thread(target=lambda: found.append(cache.get_or_compute('key', lambda: 'fresh')), daemon=True)
+    fresh.start()
+    fresh.join(timeout=5)  # a caller joining the invalidated computation would wait for it
+    resume.set()
+    stale.join()
+
+    assert found == ['fresh']
+    assert cache.get('key') == 'fresh'
+    assert not cache.flights.generations and not cache.flights.calls
@@ -0,0 +1,64 @@
+'''Tests of the throttling middleware.'''
+
+import threading
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from config import get_settings
+from helpers.api_throttling import ThrottlingMiddleware, TokenBucketStore
+from security.tokens import JSONWebToken
+
+
+def throttled_app(store: TokenBucketStore) -> FastAPI:
+    '''Build an app with a single route under the API prefix, throttled by the default route limits.'''
+    app = FastAPI()
+
+    @app.get(f'{get_settings().API.PREFIX}/ping')
+    async def ping():
+        return {'thread': threading.get_ident()}
+
+    app.add_middleware(ThrottlingMiddleware, store=store)
+    return app
+
+
+def test_requests_beyond_the_burst_are_rejected(tmp_path):
+    client = TestClient(throttled_app(TokenBucketStore(path=str(tmp_path / 'buckets.sqlite3'))))
+    burst = next(r for r in get_settings().THROTTLING.ROUTES if r['PATH'] == '/')['ANONYMOUS']['BURST']
+
+    responses = [client.get(f'{get_settings().API.PREFIX}/ping') for _ in range(int(burst) + 1)]
+
+    assert [r.status_code for r in responses[:-1]] == [200]*int(burst)
+    assert responses[-1].status_code == 429
+    assert int(responses[-1].headers['Retry-After']) >= 1
+
+
+def test_admins_have_their_own_bucket(tmp_path):
+    client = TestClient(throttled_app(TokenBucketStore(path=str(tmp_path / 'buckets.sqlite3'))))
+    burst = next(r for r in get_settings().THROTTLING.ROUTES if r['PATH'] == '/')['ANONYMOUS']['BURST']
+    for _ in range(int(burst) + 1):
+        client.get(f'{get_settings().API.PREFIX}/ping')
+
+    token = JSONWebToken.create(data={'username': 'admin'})
+    assert client.get(f'{get_settings().API.PREFIX}/ping', headers={'Authorization': f'Bearer {token}'}).status_code == 200
+
+
+def test_buckets_are_taken_off_the_event_loop(tmp_path):
+    store = TokenBucketStore(path=str(tmp_path / 'buckets.sqlite3'))
+    threads = []
+    consume = store.consume
+
+    def recorded(*args, **kwargs):
+        threads.append(threading.get_ident())
+        return consume(*args, **kwargs)
+
+    store.consume = recorded
+    response = TestClient(throttled_app(store)).get(f'{get_settings().API.PREFIX}/ping')
+
+    assert response.status_code == 200
+    assert threads and threads[0] != response.json()['thread']
+
+
+def test_broken_store_allows_requests(tmp_path):
+    store = TokenBucketStore(path=str(tmp_path / 'buckets.sqlite3'))
+    store.connection().execute('DROP TABLE buckets')
+    assert TestClient(throttled_app(store)).get(f'{get_settings().API.PREFIX}/ping').status_code == 200
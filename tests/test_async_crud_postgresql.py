@@ -0,0 +1,206 @@
+'''Tests of the INSERT/UPDATE ... RETURNING statements of the asyncio CRUD functions and of the farms grouped by the database, they only run on PostgreSQL.
+Set TEST_POSTGRESQL_URL to a throwaway database, its nfts, outbox, farms and pricing tables are dropped.'''
+
+import asyncio
+import json
+import math
+import os
+from datetime import datetime, timezone
+import pandas
+import pytest
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from apis.routers.nfts import create_nfts
+from apis.schemas.farms import FarmListResponse
+from apis.schemas.nfts import NFTBulkRequest
+from config import get_settings
+from database import async_crud, models
+from database.outbox import Outbox
+from helpers.api_exceptions import ResponseValidationError
+from helpers.misc import AppSettings, DataFormatter
+from models.farm_data_transformation import FarmData
+from tests.conftest import PATH_DATA
+from tests.test_farm_data_transformation import assert_same_farms
+
+
+POSTGRESQL_URL = os.environ.get('TEST_POSTGRESQL_URL')
+TABLES = [models.NFTsTable.__table__, models.OutboxTable.__table__]
+FARM_TABLES = [models.FarmsTable.__table__, models.PricingTable.__table__]
+
+pytestmark = pytest.mark.skipif(not POSTGRESQL_URL, reason='TEST_POSTGRESQL_URL is not set')
+
+
+@pytest.fixture
+def postgresql():
+    '''Create empty nfts and outbox tables, yields the asyncio database URL.'''
+    url = DataFormatter.postgresql(POSTGRESQL_URL)
+    engine = create_engine(url)
+    models.Base.metadata.drop_all(bind=engine, tables=TABLES)
+    models.Base.metadata.create_all(bind=engine, tables=TABLES)
+    yield DataFormatter.async_database_url(url)
+    models.Base.metadata.drop_all(bind=engine, tables=TABLES)
+    engine.dispose()
+
+
+@pytest.fixture
+def farms_postgresql():
+    '''Create farms and pricing tables loaded with the seed data, yields the database URL.'''
+    url = DataFormatter.postgresql(POSTGRESQL_URL)
+    engine = create_engine(url)
+    models.Base.metadata.drop_all(bind=engine, tables=FARM_TABLES)
+    models.Base.metadata.create_all(bind=engine, tables=FARM_TABLES)
+    with engine.begin() as conn:
+        conn.execute(insert(models.FarmsTable), pandas.read_csv(f'{PATH_DATA}/farms.csv', dtype={'UnitNumber': str}).to_dict('records'))
+        conn.execute(insert(models.PricingTable), pandas.read_csv(f'{PATH_DATA}/pricing.csv').to_dict('records'))
+    yield url
+    models.Base.metadata.drop_all(bind=engine, tables=FARM_TABLES)
+    engine.dispose()
+
+
+class Aggregation:
+    '''Application settings grouping the farms with pandas or in the database.'''
+
+    def __init__(self, aggregation: str):
+        self.FARM = AppSettings({'AGGREGATION': aggregation})
+
+    def __getattr__(self, name):
+        return getattr(get_settings(), name)
+
+
+def farm_list(url: str, aggregation: str) -> list:
+    '''Extract and transform the farms as the /farm response items.'''
+    settings = Aggregation(aggregation)
+
+    async def work(session):
+        farm, ha = await FarmData.extract_farms(db=session(), settings=settings)
+        data = FarmData.transform_farms(farm=farm, ha=ha, settings=settings)
+        return FarmListResponse(items=data, total=len(data)).dict()['items']
+
+    return run(DataFormatter.async_database_url(url), work)
+
+
+def run(url: str, work):
+    '''Run a coroutine function of a session factory, with its own asyncio engine.'''
+    async def main():
+        engine = create_async_engine(url)
+        try:
+            return await work(lambda: AsyncSession(engine, expire_on_commit=False))
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+def nft(nft_id: str) -> dict:
+    '''Build the column values of a NFT.'''
+    return dict(
+        nftId=nft_id,
+        nftName=f'NFT {nft_id}',
+        nftArea=1.5,
+        nftValueSol=0.1,
+        geolocation={'type': 'Point', 'coordinates': [30.0, -25.0]},
+        tileCount=1,
+        carbonUrl='https://example.com',
+        mintStatus=False,
+        mintStartDate=datetime(2023, 1, 1, tzinfo=timezone.utc),
+        mintEndDate=datetime(2023, 2, 1, tzinfo=timezone.utc),
+        farmId='1',
+        scientificName=['Eucalyptus grandis'],
+        plantStatus='Planted'
+    )
+
+
+def test_create_object_returning_includes_server_defaults(postgresql):
+    row = run(postgresql, lambda session: async_crud.create_object_returning(db=session(), table=models.NFTsTable, data=nft('1')))
+
+    assert row['nftId'] == '1' and row['scientificName'] == ['Eucalyptus grandis']
+    assert row['id'] is not None and row['createdAt'] is not None
+
+
+def test_create_objects_returning_skips_conflicts_and_adds_related(postgresql):
+    async def work(session):
+        await async_crud.create_objects(db=session(), data=[models.NFTsTable(**nft('1'))])
+        created = await async_crud.create_objects_returning(
+            db=session(),
+            table=models.NFTsTable,
+            data=[nft(str(i)) for i in range(5)],
+            conflict_column=models.NFTsTable.nftId,
+            related=lambda nft_ids: (models.OutboxTable, [Outbox.values(topic='NFT', key=k, payload={'nftId': k}) for k in nft_ids]),
+            chunk_size=2
+        )
+        async with session() as db:
+            keys = (await db.execute(select(models.OutboxTable.key).order_by(models.OutboxTable.key))).scalars().all()
+            count = (await db.execute(select(func.count()).select_from(models.NFTsTable))).scalar()
+        return created, keys, count
+
+    created, keys, count = run(postgresql, work)
+
+    assert sorted(created) == ['0', '2', '3', '4']
+    assert keys == ['0', '2', '3', '4']
+    assert count == 5
+
+
+def test_update_object_returning_returns_the_updated_object(postgresql):
+    async def work(session):
+        await async_crud.create_object_returning(db=session(), table=models.NFTsTable, data=nft('1'))
+        return await async_crud.update_object_returning(
+            db=session(), table=models.NFTsTable, column=models.NFTsTable.nftId, value='1', data={'mintStatus': True}
+        )
+
+    row = run(postgresql, work)
+
+    assert row['nftId'] == '1' and row['mintStatus'] is True
+
+
+def test_update_object_returning_rejects_missing_objects(postgresql):
+    with pytest.raises(ResponseValidationError):
+        run(postgresql, lambda session: async_crud.update_object_returning(
+            db=session(), table=models.NFTsTable, column=models.NFTsTable.nftId, value='missing', data={'mintStatus': True}
+        ))
+
+
+def test_bulk_nfts_with_an_invalid_geolocation_are_rejected_alone(postgresql):
+    def item(nft_id: str, geolocation: str) -> dict:
+        return {**nft(nft_id), 'geolocation': geolocation, 'farmId': nft_id}
+
+    request = NFTBulkRequest(nfts=[item('1', '{"type": "Point", "coordinates": [30.0, -25.0]}'), item('2', 'not json'), item('3', '[30.0, -25.0]')])
+    resp = run(postgresql, lambda session: create_nfts(item=request, db=session(), settings=get_settings()))
+
+    assert (resp.created, resp.rejected) == (1, 2)
+    assert [(i.nftId, i.created) for i in resp.data] == [('1', True), ('2', False), ('3', False)]
+    assert resp.data[1].error.startswith('Invalid geolocation')
+
+
+def test_farms_grouped_by_the_database_match_the_original_pipeline(farms_postgresql):
+    with open(f'{PATH_DATA}/farms_expected.json', encoding='utf-8') as f:
+        expected = json.load(f)
+
+    assert_same_farms(farm_list(farms_postgresql, 'database'), expected)
+
+
+def test_farms_grouped_by_the_database_match_pandas_for_species_without_co2(farms_postgresql):
+    def unit(farm_id: str, unit_number: str, genus: str, species: str, latitude: float) -> dict:
+        return dict(
+            GroupScheme='CMO', Country='ZA', Province='KwaZulu-Natal', Latitude=latitude, Longitude=30.0, FarmId=farm_id, FarmSize=100.0,
+            UnitNumber=unit_number, EffectiveArea=10.0, AreaTypeName='Plantation', ProductGroup='Pulp', GenusName=genus, SpeciesName=species,
+            PlantAge=5.0, SphaSurvival=1000.0, PlannedPlantDT='2020-01-01', IsActive=True
+        )
+
+    engine = create_engine(farms_postgresql)
+    with engine.begin() as conn:
+        conn.execute(insert(models.FarmsTable), [
+            unit('N001', '01', 'Pinus', ' Taeda ', -10.0),  # known species, once normalized
+            unit('N001', '02', 'unknown', 'species', -10.0),  # no CO2, left out of the mean
+            unit('N002', '01', 'unknown', 'species', -11.0),  # no CO2 at all
+            unit('N002', '02', 'eucalyptus', 'clones', -11.0)  # hybrid, filtered out
+        ])
+    engine.dispose()
+
+    pandas_farms = farm_list(farms_postgresql, 'pandas')
+    database_farms = farm_list(farms_postgresql, 'database')
+
+    assert_same_farms(database_farms, pandas_farms)
+    farms = {farm['farmId']: farm for farm in database_farms}
+    assert len(farms['N001']['scientificName']) == 2 and not math.isnan(farms['N001']['farmCo2y'])
+    assert farms['N002']['scientificName'] == ['unknown species'] and math.isnan(farms['N002']['farmCo2y'])
@@ -0,0 +1,90 @@
+'''Tests of the blockchain delivery pool against a local stub of the blockchain API.'''
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+import pytest
+
+from models.blockchain import DeliveryPool
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    '''Answer each POST with the next scripted status, 200 once the script is over, and record the form data.'''
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+        with self.server.lock:
+            self.server.received.append(parse_qs(body))
+            code = self.server.script.pop(0) if self.server.script else 200
+        self.send_response(code)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):  # pylint: disable=W0221
+        pass
+
+
+@pytest.fixture
+def stub():
+    '''Serve the stub on a free local port.'''
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.lock, server.received, server.script = threading.Lock(), [], []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def deliver(server: ThreadingHTTPServer, data: dict, retries: int = 2) -> tuple:
+    '''Submit a request to the stub through a new pool, wait for its outcome and return it with the pool report.'''
+    pool = DeliveryPool(workers=2, queue_size=10, retries=retries, backoff_seconds=0.01, backoff_max_seconds=0.05, timeout=5)
+    outcome, done = [], threading.Event()
+    try:
+        assert pool.submit(
+            url=f'http://127.0.0.1:{server.server_port}/nft/update',
+            data=data,
+            callback=lambda delivered, error: (outcome.append((delivered, error)), done.set())
+        )
+        assert done.wait(timeout=10)
+    finally:
+        pool.stop(timeout=10)
+    return outcome[0], pool.report()
+
+
+def test_request_is_delivered(stub):
+    (delivered, error), report = deliver(stub, data={'nftId': '1', 'plantStatus': 'Planted'})
+
+    assert (delivered, error) == (True, None)
+    assert stub.received == [{'nftId': ['1'], 'plantStatus': ['Planted']}]
+    assert (report['delivered'], report['failed'], report['retries']) == (1, 0, 0)
+
+
+def test_transient_statuses_are_retried(stub):
+    stub.script.extend([503, 429])
+
+    (delivered, error), report = deliver(stub, data={'nftId': '1'})
+
+    assert (delivered, error) == (True, None)
+    assert len(stub.received) == 3
+    assert report['retries'] == 2
+
+
+def test_client_errors_are_not_retried(stub):
+    stub.script.append(400)
+
+    (delivered, error), report = deliver(stub, data={'nftId': '1'})
+
+    assert (delivered, error) == (False, 'HTTP 400')
+    assert len(stub.received) == 1
+    assert (report['delivered'], report['failed'], report['retries']) == (0, 1, 0)
+
+
+def test_retries_are_bounded(stub):
+    stub.script.extend([502]*10)
+
+    (delivered, error), report = deliver(stub, data={'nftId': '1'}, retries=2)
+
+    assert (delivered, error) == (False, 'HTTP 502')
+    assert len(stub.received) == 3
+    assert report['failed'] == 1
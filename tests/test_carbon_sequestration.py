@@ -0,0 +1,75 @@
+'''Parity tests of the array-native carbon sequestration formulas against their scalar calls.'''
+
+import numpy
+import pandas
+import pytest
+
+from config import get_settings
+from models.carbon_sequestration import NftCarbonSequestration, PlantationCarbonSequestration, TreeCarbonSequestration
+
+
+@pytest.fixture
+def trees() -> dict:
+    '''Tree measures on both sides of the diameter < 11 inches coefficient switch.'''
+    rng = numpy.random.default_rng(4)
+    return dict(
+        height=rng.uniform(10, 120, 200),
+        diameter=numpy.concatenate([[10.999, 11, 11.001], rng.uniform(2, 20, 197)]),
+        root=rng.uniform(0.1, 0.3, 200),
+        dry_matter=rng.uniform(0.4, 0.8, 200),
+        carbon_content=rng.uniform(0.45, 0.55, 200)
+    )
+
+
+def test_green_weight_coefficient_per_element():
+    weight = TreeCarbonSequestration.green_weight(height=numpy.array([1.0, 1.0]), diameter=numpy.array([10.0, 11.0]), root=numpy.array([0.0, 0.0]))
+    assert weight.tolist() == [0.25*10**2, 0.15*11**2]
+
+
+def test_trees_match_scalar_calls(trees):
+    settings = get_settings()
+    arrays = TreeCarbonSequestration.trees_carbon_sequestration(**trees, settings=settings)
+    scalars = [
+        TreeCarbonSequestration.trees_carbon_sequestration(**{k: float(v[i]) for k, v in trees.items()}, settings=settings)
+        for i in range(len(trees['height']))
+    ]
+    assert isinstance(arrays, numpy.ndarray)
+    assert arrays == pytest.approx(scalars, rel=1e-12)
+
+
+def test_trees_accept_series(trees):
+    settings = get_settings()
+    series = TreeCarbonSequestration.trees_carbon_sequestration(**{k: pandas.Series(v) for k, v in trees.items()}, settings=settings)
+    arrays = TreeCarbonSequestration.trees_carbon_sequestration(**trees, settings=settings)
+    assert numpy.asarray(series) == pytest.approx(arrays, rel=1e-12)
+
+
+def test_tree_of_plantation_metrics_is_a_float():
+    settings = get_settings()
+    for tree in settings.PLANTATION_METRICS.plantationMetrics:
+        co2 = TreeCarbonSequestration.tree_carbon_sequestration(tree=tree, settings=settings)
+        assert isinstance(co2, float) and co2 > 0
+
+
+def test_plantation_matches_scalar_calls():
+    settings = get_settings()
+    rng = numpy.random.default_rng(5)
+    co2, spha, age = rng.uniform(100, 900, 50), rng.uniform(500, 1600, 50), rng.uniform(1, 25, 50)
+    arrays = PlantationCarbonSequestration.plantation_carbon_sequestration(co2=co2, spha=spha, age=age, settings=settings)
+    scalars = [
+        PlantationCarbonSequestration.plantation_carbon_sequestration(co2=float(c), spha=float(s), age=float(a), settings=settings)
+        for c, s, a in zip(co2, spha, age)
+    ]
+    assert arrays == pytest.approx(scalars, rel=1e-12)
+
+
+def test_nft_matches_scalar_calls():
+    settings = get_settings()
+    rng = numpy.random.default_rng(6)
+    area, spha, co2, period = rng.uniform(0.1, 5, 50), rng.uniform(500, 1600, 50), rng.uniform(100, 900, 50), rng.uniform(1, 3.2e7, 50)
+    arrays = NftCarbonSequestration.nft_carbon_sequestration(nft_area=area, farm_spha=spha, trees_co2=co2, period=period, settings=settings)
+    scalars = [
+        NftCarbonSequestration.nft_carbon_sequestration(nft_area=float(a), farm_spha=float(s), trees_co2=float(c), period=float(p), settings=settings)
+        for a, s, c, p in zip(area, spha, co2, period)
+    ]
+    assert arrays == pytest.approx(scalars, rel=1e-12)
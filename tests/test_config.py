@@ -0,0 +1,45 @@
+'''Tests of the settings reload.'''
+
+import os
+
+import config
+
+
+def test_reload_unsets_variables_removed_from_dotenv(tmp_path, monkeypatch):
+    dotenv = tmp_path / '.env'
+    monkeypatch.setattr(config, 'PATH_DOTENV', str(dotenv))
+
+    dotenv.write_text('ECOVERSE_TESTS_VARIABLE=1\n', encoding='utf-8')
+    assert config.reload_settings(force=True)
+    assert os.environ['ECOVERSE_TESTS_VARIABLE'] == '1'
+
+    dotenv.write_text('', encoding='utf-8')
+    assert config.reload_settings(force=True)
+    assert 'ECOVERSE_TESTS_VARIABLE' not in os.environ
+
+
+def test_reload_keeps_process_variables(tmp_path, monkeypatch):
+    dotenv = tmp_path / '.env'
+    monkeypatch.setattr(config, 'PATH_DOTENV', str(dotenv))
+
+    dotenv.write_text('JWT_SECRET_KEY=from-dotenv\n', encoding='utf-8')
+    assert config.reload_settings(force=True)
+    assert config.get_settings().SECURITY.JWT_SECRET_KEY == 'tests'
+
+    dotenv.write_text('', encoding='utf-8')
+    assert config.reload_settings(force=True)
+    assert os.environ['JWT_SECRET_KEY'] == 'tests'
+
+
+def test_reload_warns_about_settings_read_at_startup(tmp_path, monkeypatch, caplog):
+    path = tmp_path / 'config.yaml'
+    with open(config.PATH_CONFIG, encoding='utf-8') as f:
+        path.write_text(f.read().replace('PROJECT_NAME: Ecoverse APIs', 'PROJECT_NAME: Renamed'), encoding='utf-8')
+    monkeypatch.setattr(config, 'PATH_CONFIG', str(path))
+
+    assert config.reload_settings(force=True)
+    monkeypatch.undo()
+    assert config.reload_settings(force=True)
+
+    warnings = [r.getMessage() for r in caplog.records if r.name == 'config']
+    assert len(warnings) == 2 and all('APP.PROJECT_NAME take effect after a restart' in w for w in warnings)
@@ -0,0 +1,52 @@
+'''Parity tests of the farm data pipeline against the farm list of the original row-by-row pipeline.
+
+tests/data/farms_expected.json was produced by the original pipeline (before the array-native formulas and the columnar transform) from tests/data/farms.csv
+and tests/data/pricing.csv, i.e. the /farm response items.'''
+
+import json
+import math
+import pytest
+
+from apis.schemas.farms import FarmListResponse
+from config import get_settings
+from database.session import AsyncSessionLocal
+from models.farm_data_transformation import FarmData
+from tests.conftest import PATH_DATA, run
+
+
+async def retrieve_farms() -> list:
+    '''Retrieve the farms as the /farm response items.'''
+    async with AsyncSessionLocal() as db:
+        data = await FarmData.retrieve_farms(db=db, settings=get_settings())
+    return FarmListResponse(items=data, total=len(data)).dict()['items']
+
+
+def assert_same_farms(actual: list, expected: list):
+    '''Compare farm lists in order, floats up to rounding, NaN being equal to NaN.'''
+    assert [farm['farmId'] for farm in actual] == [farm['farmId'] for farm in expected]
+    for a, e in zip(actual, expected):
+        assert a.keys() == e.keys()
+        for k, v in e.items():
+            if isinstance(v, float):
+                assert math.isclose(a[k], v, rel_tol=1e-9) or math.isnan(a[k]) and math.isnan(v), (e['farmId'], k)
+            else:
+                assert a[k] == v, (e['farmId'], k)
+
+
+@pytest.fixture
+def expected() -> list:
+    '''Farm list of the original pipeline.'''
+    with open(f'{PATH_DATA}/farms_expected.json', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_farms_match_the_original_pipeline(farms, expected):  # pylint: disable=W0613
+    assert_same_farms(run(retrieve_farms()), expected)
+
+
+def test_farms_drop_inactive_units_hybrids_and_duplicate_locations(farms):
+    data = run(retrieve_farms())
+    units = farms[farms['IsActive'] & ~farms['SpeciesName'].isin(['clones', 'GxN'])]
+    assert {farm['farmId'] for farm in data} < set(units['FarmId'])
+    assert len({(farm['latitude'], farm['longitude']) for farm in data}) == len(data)
+    assert all(name.split(' ')[1] not in ('clones', 'GxN') for farm in data for name in farm['scientificName'])
@@ -0,0 +1,127 @@
+'''Tests of the farm ingestion from a SQLite stand-in of the source database, and of the farms natural key migration.'''
+
+from datetime import datetime, timedelta
+import pandas
+import pytest
+from sqlalchemy import Column, DateTime, MetaData, Table, create_engine, func, inspect, select, text
+
+from tests.conftest import PATH_DATA
+from database import models
+from database.startup import migrate_farms_natural_key
+from helpers.misc import AppSettings
+from models.farm_ingestion import COLUMNS, FarmIngestion
+
+
+@pytest.fixture
+def source(tmp_path):
+    '''Create a source Farms table with a watermark column, yields its engine and table.'''
+    engine = create_engine(f'sqlite:///{tmp_path}/source.db')
+    farms = Table(
+        'Farms', MetaData(),
+        *[Column(c, models.FarmsTable.__table__.c[c].type) for c in COLUMNS],
+        Column('UpdatedAt', DateTime)
+    )
+    farms.create(bind=engine)
+    yield engine, farms
+    engine.dispose()
+
+
+@pytest.fixture
+def empty_farms(database):
+    '''Empty the farms table and the ingestion watermarks.'''
+    db = database.SessionLocal()
+    try:
+        db.query(models.FarmsTable).delete()
+        db.query(models.IngestionWatermarksTable).delete()
+        db.commit()
+    finally:
+        db.close()
+    yield database
+
+
+def legacy_farms(bind) -> Table:
+    '''Create the farms table as it was before the natural key.'''
+    farms = Table(
+        'farms', MetaData(),
+        *[Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable) for c in models.FarmsTable.__table__.columns]
+    )
+    farms.create(bind=bind)
+    return farms
+
+
+def ingestion_settings(url: str) -> AppSettings:
+    '''Build the ingestion settings of a source database.'''
+    return AppSettings({'INGESTION': dict(SOURCE_URL=url, SOURCE_TABLE='Farms', WATERMARK_COLUMN='UpdatedAt', LOOKBACK_SECONDS=0, CHUNK_SIZE=50)})
+
+
+def loaded_farms(database) -> dict:
+    '''Fetch the farms table rows by natural key.'''
+    db = database.SessionLocal()
+    try:
+        return {(r.FarmId, r.UnitNumber): r for r in db.execute(select(models.FarmsTable)).scalars()}
+    finally:
+        db.close()
+
+
+def test_ingestion_upserts_changed_rows_by_natural_key(source, empty_farms):
+    engine, farms = source
+    rows = pandas.read_csv(f'{PATH_DATA}/farms.csv', dtype={'UnitNumber': str, 'FarmId': str}).to_dict('records')
+    changed = datetime(2023, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(farms.insert(), [{**row, 'UpdatedAt': changed + timedelta(seconds=i)} for i, row in enumerate(rows)])
+    settings = ingestion_settings(str(engine.url))
+
+    first = FarmIngestion.run(settings=settings)
+    assert (first['loaded'], first['rejected'], first['chunks']) == (len(rows), 0, -(-len(rows)//50))
+    assert len(loaded_farms(empty_farms)) == len(rows)
+
+    farm_id, unit_number = str(rows[0]['FarmId']), str(rows[0]['UnitNumber'])
+    with engine.begin() as conn:
+        conn.execute(
+            farms.update().where(farms.c.FarmId == farm_id, farms.c.UnitNumber == unit_number).values(EffectiveArea=123.5, UpdatedAt=datetime(2024, 1, 1))
+        )
+
+    second = FarmIngestion.run(settings=settings)  # the row at the previous watermark is read again along the changed one
+    assert second['loaded'] == 2 and second['watermark'] == datetime(2024, 1, 1)
+    farm = loaded_farms(empty_farms)
+    assert len(farm) == len(rows)
+    assert farm[(farm_id, unit_number)].EffectiveArea == 123.5
+
+
+def test_ingestion_rejects_incomplete_rows(source, empty_farms):
+    engine, farms = source
+    row = pandas.read_csv(f'{PATH_DATA}/farms.csv', dtype={'UnitNumber': str, 'FarmId': str}).to_dict('records')[0]
+    with engine.begin() as conn:
+        conn.execute(farms.insert(), [{**row, 'UpdatedAt': datetime(2023, 1, 1)}, {**row, 'UnitNumber': 'X', 'Province': None, 'UpdatedAt': datetime(2023, 1, 1)}])
+
+    stats = FarmIngestion.run(settings=ingestion_settings(str(engine.url)))
+
+    assert (stats['loaded'], stats['rejected']) == (1, 1)
+
+
+def test_natural_key_is_added_to_existing_farms_tables(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path}/legacy.db')
+    legacy_farms(bind=engine)
+
+    migrate_farms_natural_key(bind=engine)
+    migrate_farms_natural_key(bind=engine)
+
+    unique = [i for i in inspect(engine).get_indexes('farms') if i['unique']]
+    assert [i['column_names'] for i in unique] == [['FarmId', 'UnitNumber']]
+    engine.dispose()
+
+
+def test_natural_key_is_not_added_over_repeated_farm_units(tmp_path, caplog):
+    engine = create_engine(f'sqlite:///{tmp_path}/legacy.db')
+    farms = legacy_farms(bind=engine)
+    row = pandas.read_csv(f'{PATH_DATA}/farms.csv', dtype={'UnitNumber': str, 'FarmId': str}).to_dict('records')[0]
+    with engine.begin() as conn:
+        conn.execute(farms.insert(), [row, row])
+
+    migrate_farms_natural_key(bind=engine)
+
+    assert not [i for i in inspect(engine).get_indexes('farms') if i['unique']]
+    assert 'repeated' in caplog.text
+    with engine.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(text('farms'))).scalar() == 2
+    engine.dispose()
@@ -0,0 +1,203 @@
+'''Tests of the NFT parcel overlap rule, checked inside the insert transaction.
+The PostgreSQL concurrent writes test runs if TEST_POSTGRESQL_URL is set to a throwaway database, its nfts and outbox tables are dropped.'''
+
+import asyncio
+import pytest
+from sqlalchemy import Column, MetaData, Table, create_engine, inspect, select
+
+from tests.conftest import run
+from tests.test_async_crud_postgresql import POSTGRESQL_URL, nft, postgresql  # pylint: disable=W0611
+from tests.test_spatial_index import square
+from database import async_crud, models
+from database.startup import migrate_nfts_farm_index
+from helpers.api_exceptions import ResponseValidationError
+from helpers.misc import AppSettings
+from models.spatial_queries import NFTIndex, NFTOverlap
+
+
+def overlap_settings(action: str, tolerance_m: float = 0.01) -> AppSettings:
+    '''Build the NFT overlap settings.'''
+    return AppSettings({'NFT': {'OVERLAP': {'ACTION': action, 'TOLERANCE_METERS': tolerance_m}}})
+
+
+def parcel(nft_id: str, lng: float, farm_id: str = '1') -> dict:
+    '''Build the column values of a NFT with a small square parcel.'''
+    return {**nft(nft_id), 'farmId': farm_id, 'geolocation': square(lng, -25.0, 0.001)}
+
+
+@pytest.fixture
+def committed(database):
+    '''Commit a NFT parcel of farm 1, yields the database session module.'''
+    db = database.SessionLocal()
+    try:
+        db.query(models.NFTsTable).delete()
+        db.add(models.NFTsTable(**parcel('committed', 30.0)))
+        db.commit()
+    finally:
+        db.close()
+    NFTIndex.invalidate()
+    yield database
+    NFTIndex.invalidate()
+    db = database.SessionLocal()
+    try:
+        db.query(models.NFTsTable).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+def screen(session, rows: list, action: str, tolerance_m: float = 0.01) -> tuple:
+    '''Screen new NFTs in an asyncio session, returns the kept NFTs ids and the rejected and flagged ones.'''
+    rejected, flagged = {}, {}
+
+    async def main():
+        async with session.AsyncSessionLocal() as db:
+            return await NFTOverlap.screen(db=db, rows=rows, settings=overlap_settings(action, tolerance_m), rejected=rejected, flagged=flagged)
+
+    return [row['nftId'] for row in run(main())], rejected, flagged
+
+
+def test_overlaps_with_committed_and_earlier_nfts_are_rejected(committed):
+    kept, rejected, flagged = screen(committed, [
+        parcel('over-committed', 30.0005), parcel('apart', 30.01), parcel('over-apart', 30.0105), parcel('other-farm', 30.0, farm_id='2')
+    ], action='reject')
+
+    assert kept == ['apart', 'other-farm']
+    assert rejected == {
+        'over-committed': 'NFT overlaps existing NFTs: committed.',
+        'over-apart': 'NFT overlaps existing NFTs: apart.'
+    }
+    assert not flagged
+
+
+def test_overlaps_are_kept_and_flagged(committed):
+    kept, rejected, flagged = screen(committed, [parcel('over-committed', 30.0005), parcel('over-both', 30.0002)], action='flag')
+
+    assert kept == ['over-committed', 'over-both']
+    assert not rejected
+    assert flagged == {'over-committed': ['committed'], 'over-both': ['committed', 'over-committed']}
+
+
+def test_an_existing_nft_does_not_overlap_itself(committed):
+    kept, rejected, _ = screen(committed, [parcel('committed', 30.0)], action='reject')
+
+    assert kept == ['committed'] and not rejected
+
+
+def test_identical_parcels_overlap_without_tolerance(committed):
+    kept, rejected, _ = screen(committed, [parcel('same', 30.0), parcel('adjacent', 30.001)], action='reject', tolerance_m=0)
+
+    assert kept == ['adjacent']
+    assert rejected == {'same': 'NFT overlaps existing NFTs: committed.'}
+
+
+def test_only_nfts_added_since_the_farm_was_loaded_are_read(committed, monkeypatch):
+    loaded = []
+    upsert = NFTIndex.upsert
+    monkeypatch.setattr(NFTIndex, 'upsert', lambda rows: loaded.append([row['nftId'] for row in rows]) or upsert(rows=rows))
+
+    screen(committed, [parcel('apart', 30.01)], action='reject')
+    screen(committed, [parcel('apart', 30.01)], action='reject')
+    db = committed.SessionLocal()
+    try:
+        db.add(models.NFTsTable(**parcel('other-worker', 30.02)))  # written by another worker, not in the NFT index
+        db.commit()
+    finally:
+        db.close()
+    kept, rejected, _ = screen(committed, [parcel('over-other-worker', 30.0205)], action='reject')
+
+    assert loaded == [['committed'], [], ['other-worker']]
+    assert not kept and rejected == {'over-other-worker': 'NFT overlaps existing NFTs: other-worker.'}
+
+
+def test_farm_index_is_added_to_existing_nfts_tables(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path}/legacy.db')
+    Table('nfts', MetaData(), *[Column(c.name, c.type, primary_key=c.primary_key) for c in models.NFTsTable.__table__.columns]).create(bind=engine)
+
+    migrate_nfts_farm_index(bind=engine)
+    migrate_nfts_farm_index(bind=engine)
+
+    assert [i['column_names'] for i in inspect(engine).get_indexes('nfts')] == [['farmId', 'id']]
+    engine.dispose()
+
+
+def test_nfts_without_a_supported_geometry_overlap_nothing(committed):
+    line = {**parcel('line', 30.0), 'geolocation': {'type': 'LineString', 'coordinates': [[30.0, -25.0], [30.1, -25.0]]}}
+    kept, rejected, _ = screen(committed, [line, {**line, 'nftId': 'line-again'}, parcel('over-committed', 30.0005)], action='reject')
+
+    assert kept == ['line', 'line-again']
+    assert list(rejected) == ['over-committed']
+
+
+def test_overlapping_nft_is_not_created(committed):
+    async def main():
+        async with committed.AsyncSessionLocal() as db:
+            row = parcel('over-committed', 30.0005)
+            await async_crud.create_objects(
+                db=db,
+                data=[models.NFTsTable(**row)],
+                before=lambda db: NFTOverlap.check(db=db, row=row, settings=overlap_settings('reject'), flagged={})
+            )
+
+    with pytest.raises(ResponseValidationError) as e:
+        run(main())
+
+    assert e.value.status_code == 409
+    db = committed.SessionLocal()
+    try:
+        assert [n.nftId for n in db.query(models.NFTsTable)] == ['committed']
+    finally:
+        db.close()
+
+
+def test_concurrent_overlapping_nfts_are_not_both_created_on_sqlite(committed):
+    async def create(row: dict) -> str:
+        async def before(db):
+            await NFTOverlap.check(db=db, row=row, settings=overlap_settings('reject'), flagged={})
+            await asyncio.sleep(0.2)  # widen the window between the check and the insert
+
+        try:
+            await async_crud.create_objects(db=committed.AsyncSessionLocal(), data=[models.NFTsTable(**row)], before=before)
+        except ResponseValidationError as e:
+            return e.status_code
+        return row['nftId']
+
+    async def main():
+        async with committed.AsyncSessionLocal() as db:
+            await db.execute(select(1))  # the first connection of the pool runs its connect events on its own
+        return await asyncio.gather(create(parcel('first', 30.01)), create(parcel('second', 30.0105)))
+
+    outcomes = run(main())
+
+    assert outcomes.count(409) == 1
+
+
+@pytest.mark.skipif(not POSTGRESQL_URL, reason='TEST_POSTGRESQL_URL is not set')
+def test_concurrent_overlapping_nfts_are_not_both_created(postgresql):  # pylint: disable=W0621
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine  # pylint: disable=C0415
+
+    async def create(engine, row: dict, rejected: dict) -> list:
+        async def before(db, data):
+            kept = await NFTOverlap.screen(db=db, rows=data, settings=overlap_settings('reject'), rejected=rejected, flagged={})
+            await asyncio.sleep(0.2)  # widen the window between the check and the insert
+            return kept
+
+        return await async_crud.create_objects_returning(
+            db=AsyncSession(engine, expire_on_commit=False), table=models.NFTsTable, data=[row], conflict_column=models.NFTsTable.nftId, before=before
+        )
+
+    async def main():
+        engine = create_async_engine(postgresql)
+        try:
+            rejected = {}
+            created = await asyncio.gather(
+                create(engine, parcel('first', 30.0, farm_id='2'), rejected), create(engine, parcel('second', 30.0005, farm_id='2'), rejected)
+            )
+            return created, rejected
+        finally:
+            await engine.dispose()
+
+    created, rejected = asyncio.run(main())  # the lock key of farm 2 is over the int32 range
+
+    assert sorted(len(c) for c in created) == [0, 1]
+    assert len(rejected) == 1
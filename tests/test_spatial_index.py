@@ -0,0 +1,93 @@
+'''Tests of the spatial index, and of the NFT geolocation validation.'''
+
+import json
+import pytest
+from pydantic import ValidationError
+
+from apis.schemas.nfts import NFTBulkRequest, NFTRequest
+from helpers.spatial_index import Geometry, SpatialIndex
+
+
+def square(lng: float, lat: float, size: float) -> dict:
+    '''Build a square Polygon from its south-west corner.'''
+    return {'type': 'Polygon', 'coordinates': [[[lng, lat], [lng + size, lat], [lng + size, lat + size], [lng, lat + size], [lng, lat]]]}
+
+
+@pytest.fixture
+def index():
+    '''Index a few small parcels and a huge polygon covering far more cells than allowed per geometry.'''
+    index = SpatialIndex(cell_degrees=0.01, max_cells=16)
+    index.upsert('small-1', square(30.0, -25.0, 0.001), 'small-1')
+    index.upsert('small-2', square(30.5, -25.5, 0.001), 'small-2')
+    index.upsert('huge', square(10.0, -40.0, 40.0), 'huge')
+    return index
+
+
+def test_oversized_geometries_are_kept_out_of_the_grid(index):
+    assert index.oversized == {'huge'}
+    assert all('huge' not in keys for keys in index.cells.values())
+    assert len(index.cells) <= 2*index.max_cells
+
+
+def test_oversized_geometries_are_found_by_every_query(index):
+    assert [k for k, _ in index.within_bbox(bbox=(29.9, -25.1, 30.1, -24.9))] == ['huge', 'small-1']
+    assert [k for k, _, _ in index.within_radius(lat=-24.99, lng=30.0, radius_km=5)] == ['huge', 'small-1']
+    assert index.nearest(lat=-45.0, lng=0.0, k=1)[0][0] == 'huge'
+
+
+def test_oversized_geometries_are_removed(index):
+    index.upsert('huge', square(30.0, -25.0, 0.001), 'moved')
+    assert not index.oversized
+    index.remove('huge')
+    assert 'huge' not in index.items and all('huge' not in keys for keys in index.cells.values())
+
+
+def nft(geolocation: str) -> dict:
+    '''Build a NFT request with a geolocation.'''
+    return dict(
+        nftId='1', nftName='NFT', nftArea=1.5, nftValueSol=0.1, geolocation=geolocation, tileCount=1, carbonUrl='https://example.com',
+        mintStartDate='2023-01-01T00:00:00Z', mintEndDate='2023-02-01T00:00:00Z', farmId='1', scientificName=[], plantStatus='Planted'
+    )
+
+
+@pytest.mark.parametrize('geolocation', [
+    'not json',
+    json.dumps([30.0, -25.0]),
+    '{"type": "Point", "coordinates": [NaN, 0]}'
+])
+def test_invalid_geolocations_are_rejected(geolocation):
+    with pytest.raises(ValidationError):
+        NFTRequest(**nft(geolocation))
+
+
+def test_invalid_geolocations_do_not_reject_the_bulk_request():
+    assert [n.geolocation for n in NFTBulkRequest(nfts=[nft('not json'), nft('[]')]).nfts] == ['not json', '[]']
+
+
+@pytest.mark.parametrize('geolocation', [
+    square(30.0, -25.0, 0.001),
+    {'type': 'Point', 'coordinates': [-180.0, 90.0]},
+    {'type': 'LineString', 'coordinates': [[30.0, -25.0], [30.1, -25.0]]},
+    {'type': 'Point', 'coordinates': [200.0, -25.0]},
+    {'type': 'Polygon', 'coordinates': []}
+])
+def test_valid_json_geolocations_are_accepted(geolocation):
+    assert NFTRequest(**nft(json.dumps(geolocation))).geolocation
+
+
+@pytest.mark.parametrize('geolocation', [
+    {'type': 'LineString', 'coordinates': [[30.0, -25.0], [30.1, -25.0]]},
+    {'type': 'Point', 'coordinates': [200.0, -25.0]},
+    {'type': 'Polygon', 'coordinates': [[[30.0, -25.0], [30.1]]]}
+])
+def test_unsupported_geolocations_are_not_indexed(geolocation):
+    index = SpatialIndex(cell_degrees=0.1)
+    with pytest.raises(ValueError):
+        index.upsert('1', geolocation)
+    assert not index.items
+
+
+def test_identical_parcels_overlap_without_tolerance():
+    parcel = square(30.0, -25.0, 0.001)
+    assert Geometry.overlaps(parcel, parcel, tolerance_m=0)
+    assert not Geometry.overlaps(parcel, square(30.001, -25.0, 0.001), tolerance_m=0)